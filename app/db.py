@@ -1,6 +1,8 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+import logging
 import os
 from dotenv import load_dotenv
+from app.utils.metrics import mongo_command_listener
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,12 +16,12 @@ if not MONGO_URI or not MONGO_DB_NAME:
     raise ValueError("MONGO_URI and MONGO_DB_NAME must be set")
 
 # Create the MongoDB client and database connection
-client = AsyncIOMotorClient(MONGO_URI)
+# Every command is timed by the metrics listener (see /metrics)
+client = AsyncIOMotorClient(MONGO_URI, event_listeners=[mongo_command_listener])
 db = client[MONGO_DB_NAME]
 
 # Optional: Access specific collections directly
 restaurants_collection = db["restaurants"]
 
-# Print the connection string (for debugging)
-print(f"Connected to MongoDB at: {MONGO_URI}")
-print(f"Using database: {MONGO_DB_NAME}")
+# Never log MONGO_URI itself, it carries the credentials
+logging.getLogger(__name__).info("Using MongoDB database: %s", MONGO_DB_NAME)
@@ -0,0 +1,200 @@
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+from app.db import db
+from app.utils.ad_index import not_expired
+from app.utils.render_jobs import RENDER_JOB_RETENTION_SECONDS
+
+# Every index the application relies on. Names are fixed so reconciliation can
+# tell "ours, but outdated" apart from indexes created by hand.
+REQUIRED_INDEXES = [
+    {
+        "collection": "ads",
+        "name": "ads_bid_price_last_served",
+        "keys": [("bid_price", DESCENDING), ("last_served", ASCENDING)],
+    },
+    {
+        # Mongo's TTL monitor deletes ads once expires_at has passed; ads without it never expire
+        "collection": "ads",
+        "name": "ads_expires_at_ttl",
+        "keys": [("expires_at", ASCENDING)],
+        "options": {"expireAfterSeconds": 0},
+    },
+    {
+        # The ad index's incremental refresh picks up ads served by other workers
+        "collection": "ads",
+        "name": "ads_last_served",
+        "keys": [("last_served", ASCENDING)],
+    },
+    {
+        "collection": "ads",
+        "name": "ads_brand_id_expires_at",
+        "keys": [("brand_id", ASCENDING), ("expires_at", ASCENDING)],
+    },
+    {
+        # Anchored prefix lookups for the brand typeahead
+        "collection": "brands",
+        "name": "brands_search_keys",
+        "keys": [("search_keys", ASCENDING)],
+    },
+    {
+        "collection": "menus",
+        "name": "menus_restaurant_id",
+        "keys": [("restaurant_id", ASCENDING)],
+    },
+    {
+        # Still needed for restaurants whose menus haven't been migrated out yet
+        "collection": "restaurants",
+        "name": "restaurants_menus_id",
+        "keys": [("menus.id", ASCENDING)],
+    },
+    {
+        # Workers claim the lowest-ranked, oldest queued job
+        "collection": "render_jobs",
+        "name": "render_jobs_claim",
+        "keys": [("status", ASCENDING), ("rank", ASCENDING), ("created_at", ASCENDING)],
+    },
+    {
+        # Fairness ranks and duplicate-submission checks look up a restaurant's active jobs
+        "collection": "render_jobs",
+        "name": "render_jobs_restaurant_status",
+        "keys": [("restaurant_id", ASCENDING), ("status", ASCENDING)],
+    },
+    {
+        "collection": "render_jobs",
+        "name": "render_jobs_finished_at_ttl",
+        "keys": [("finished_at", ASCENDING)],
+        "options": {"expireAfterSeconds": RENDER_JOB_RETENTION_SECONDS},
+    },
+    {
+        "collection": "rerender_scans",
+        "name": "rerender_scans_finished_at_ttl",
+        "keys": [("finished_at", ASCENDING)],
+        "options": {"expireAfterSeconds": RENDER_JOB_RETENTION_SECONDS},
+    },
+]
+
+# Queries on hot paths that must never fall back to a collection scan
+HOT_QUERIES = [
+    {
+        "name": "ads ranked by bid",
+        "collection": "ads",
+        "filter": {},
+        "sort": [("bid_price", DESCENDING), ("last_served", ASCENDING)],
+    },
+    {
+        "name": "live ads for a brand",
+        "collection": "ads",
+        "filter": lambda: {"brand_id": "", **not_expired(datetime.utcnow())},
+    },
+    {
+        "name": "ads created or served since",
+        "collection": "ads",
+        "filter": lambda: {"$or": [
+            {"_id": {"$gte": ObjectId.from_datetime(datetime.utcnow())}},
+            {"last_served": {"$gte": datetime.utcnow()}},
+        ]},
+    },
+    {
+        "name": "expired ads",
+        "collection": "ads",
+        "filter": lambda: {"expires_at": {"$lte": datetime.utcnow()}},
+    },
+    {
+        "name": "brand typeahead",
+        "collection": "brands",
+        "filter": {"search_keys": {"$regex": "^a"}},
+    },
+    {
+        "name": "menus of a restaurant",
+        "collection": "menus",
+        "filter": {"restaurant_id": None},
+    },
+    {
+        "name": "restaurant by menu id",
+        "collection": "restaurants",
+        "filter": {"menus.id": ""},
+    },
+    {
+        "name": "claim render job",
+        "collection": "render_jobs",
+        "filter": {"status": "queued"},
+        "sort": [("rank", ASCENDING), ("created_at", ASCENDING)],
+    },
+]
+
+# Index options compared during reconciliation
+_COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def _matches(existing, spec):
+    if list(existing["key"].items()) != [tuple(k) for k in spec["keys"]]:
+        return False
+    options = spec.get("options", {})
+    return all(existing.get(option) == options.get(option) for option in _COMPARED_OPTIONS)
+
+
+async def ensure_indexes(rebuild=False):
+    """Create missing indexes and report ones whose definition changed.
+
+    Every worker runs this at startup, so an outdated index is only reported
+    ("outdated"): dropping and recreating it from several workers at once would race,
+    and queries would run without it meanwhile. Rebuild them once with
+    python -m app.migrations.rebuild_indexes, which passes rebuild=True.
+
+    Returns a list of {collection, name, action} entries describing what was done.
+    """
+    report = []
+    for spec in REQUIRED_INDEXES:
+        collection = db[spec["collection"]]
+        existing = {}
+        async for index in collection.list_indexes():
+            existing[index["name"]] = index
+
+        current = existing.get(spec["name"])
+        if current is not None and _matches(current, spec):
+            action = "ok"
+        elif current is not None and not rebuild:
+            action = "outdated"
+        else:
+            if current is not None:
+                await collection.drop_index(spec["name"])
+                action = "rebuilt"
+            else:
+                action = "created"
+            await collection.create_index(spec["keys"], name=spec["name"], **spec.get("options", {}))
+        report.append({"collection": spec["collection"], "name": spec["name"], "action": action})
+    return report
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for key in ("inputStage", "queryPlan", "winningPlan"):
+            if key in plan:
+                yield from _plan_stages(plan[key])
+        for child in plan.get("inputStages", []):
+            yield from _plan_stages(child)
+
+
+async def check_query_plans():
+    """Explain each hot query and flag the ones whose winning plan is a COLLSCAN."""
+    results = []
+    for query in HOT_QUERIES:
+        query_filter = query["filter"]() if callable(query["filter"]) else query["filter"]
+        cursor = db[query["collection"]].find(query_filter)
+        if query.get("sort"):
+            cursor = cursor.sort(query["sort"])
+        explain = await cursor.explain()
+        stages = list(_plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {})))
+        results.append({
+            "query": query["name"],
+            "collection": query["collection"],
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return results
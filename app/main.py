@@ -1,10 +1,68 @@
-from fastapi import FastAPI
-from app.routes import restaurant, menu, category, dish, ads, brand
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from app.routes import restaurant, menu, category, dish, ads, brand, render_jobs
+from app.utils.render_cache import render_cache
+from app.utils.render_executor import render_executor
+from app.utils.image_fetcher import ad_image_fetcher
+from app.utils.ad_creatives import ad_creative_store
+from app.utils.pdf_assembly import menu_pdf_assembler
+from app.utils.qr_codes import qr_code_cache
+from app.utils.impressions import impression_buffer
+from app.utils.render_jobs import render_job_runner
+from app.utils.maintenance import maintenance_scheduler
+from app.indexes import ensure_indexes, check_query_plans
+from app.utils.brand_search import backfill_search_keys
+from app.utils import read_metrics
+from app.utils.metrics import RequestMetricsMiddleware, render_latest
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn  # Import uvicorn
+import logging
 import os  # Import os for reading environment variables
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# Set ENSURE_INDEXES=0 to skip index reconciliation (e.g. when indexes are managed elsewhere)
+ENSURE_INDEXES = os.getenv("ENSURE_INDEXES", "1") == "1"
+
+# Result of the startup index reconciliation and query plan checks
+index_report = {"indexes": [], "brands_backfilled": 0, "query_plans": []}
+
+async def reconcile_indexes():
+    try:
+        index_report["indexes"] = await ensure_indexes()
+        index_report["brands_backfilled"] = await backfill_search_keys()
+        index_report["query_plans"] = await check_query_plans()
+    except Exception:
+        # Don't keep the API down over this; the report shows it never ran
+        logger.exception("Index reconciliation failed")
+        return
+    for index in index_report["indexes"]:
+        if index["action"] == "outdated":
+            logger.warning("Index %s on %s is outdated; run python -m app.migrations.rebuild_indexes",
+                           index["name"], index["collection"])
+    for plan in index_report["query_plans"]:
+        if plan["collscan"]:
+            logger.warning("Hot query '%s' on %s uses a COLLSCAN", plan["query"], plan["collection"])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if ENSURE_INDEXES:
+        await reconcile_indexes()
+    impression_buffer.start()
+    render_job_runner.start()
+    maintenance_scheduler.start()
+    yield
+    await maintenance_scheduler.stop()
+    await render_job_runner.stop()
+    # Write out buffered ad impressions before the worker exits
+    await impression_buffer.stop()
+    # Let in-flight renders finish before the worker exits; waiting on the pool blocks,
+    # so it happens off the event loop
+    await asyncio.to_thread(render_executor.shutdown)
+    await ad_image_fetcher.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Adding CORS Middleware to allow cross-origin requests during development
 app.add_middleware(
@@ -13,8 +71,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods (GET, POST, etc.)
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["X-Next-Cursor", "X-Mongo-Bytes-Read"],  # Lets browser clients read these headers
 )
 
+# Reports how many bytes each request read from Mongo
+app.add_middleware(read_metrics.ReadMetricsMiddleware)
+
+# Per-route latency histograms, exported on /metrics
+app.add_middleware(RequestMetricsMiddleware)
+
 # Including routers for different parts of the application
 app.include_router(restaurant.router, prefix="/restaurants", tags=["restaurants"])
 app.include_router(menu.router, prefix="/menus", tags=["menus"])
@@ -22,11 +87,43 @@ app.include_router(category.router, prefix="/categories", tags=["categories"])
 app.include_router(dish.router, tags=["dishes"])
 app.include_router(ads.router, prefix="/ads", tags=["ads"])
 app.include_router(brand.router, prefix="/brands", tags=["brands"])
+app.include_router(render_jobs.router, tags=["render_jobs"])
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Restaurant API"}
 
+@app.get("/indexes")
+def get_index_report():
+    return index_report
+
+@app.get("/stats/mongo_reads")
+def mongo_read_stats():
+    return read_metrics.stats()
+
+# Runs, timings and last results of the background maintenance tasks
+@app.get("/stats/maintenance")
+def maintenance_stats():
+    return maintenance_scheduler.stats()
+
+# Prometheus scrape endpoint: request latency, Mongo command timings and render stages
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_latest()
+    return Response(body, media_type=content_type)
+
+@app.get("/render/stats")
+def render_stats():
+    return {
+        "executor": render_executor.stats(),
+        "cache": render_cache.stats(),
+        "pdf_assembly": menu_pdf_assembler.stats(),
+        "ad_images": ad_image_fetcher.stats(),
+        "ad_creatives": ad_creative_store.stats(),
+        "qr_codes": qr_code_cache.stats(),
+        "jobs": render_job_runner.stats(),
+    }
+
 # This block is only needed for running the app directly from Python (for local development)
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))  # Use PORT from the environment or default to 8000
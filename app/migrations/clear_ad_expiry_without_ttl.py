@@ -0,0 +1,35 @@
+"""Unset expires_at on ads that were saved without a TTL.
+
+POST /ads/brands/{id}/ads used to set expires_at to the creation time when ttl was
+0 (the default), so those ads look expired: the TTL index on expires_at and the
+expiry sweep would delete them. Safe to run while the API is serving traffic, and
+safe to re-run:
+
+    python -m app.migrations.clear_ad_expiry_without_ttl
+
+Run it before deploying the TTL index and the sweep. If they are already live, set
+AD_EXPIRY_SWEEP_SECONDS=0 and ENSURE_INDEXES=0 on the workers until it has run.
+"""
+import argparse
+import asyncio
+
+from app.db import db
+
+
+async def migrate():
+    """Returns how many ads were fixed."""
+    result = await db.ads.update_many(
+        {"ttl": {"$not": {"$gt": 0}}, "expires_at": {"$ne": None}},
+        {"$unset": {"expires_at": ""}},
+    )
+    print(f"fixed={result.modified_count}")
+    return result.modified_count
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__.splitlines()[0]).parse_args()
+    asyncio.run(migrate())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Process the creatives of ads onboarded before creatives were preprocessed.
+
+Safe to run while the API is serving traffic, and safe to re-run; only ads
+without an "ad_creative" are touched:
+
+    python -m app.migrations.process_ad_creatives --concurrency 8
+
+Until an ad is processed its renders keep fetching the original image. Menus
+already published with the original can then be re-rendered with
+python -m app.rerender --force.
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import HTTPException
+
+from app.db import db
+from app.utils.ad_creatives import ingest_creative
+from app.utils.image_fetcher import ad_image_fetcher
+
+
+async def process_ad(ad):
+    """Process one ad's creative; returns "processed" or "failed"."""
+    try:
+        creative = await ingest_creative(ad["ad_image_url"])
+    except HTTPException as e:
+        print(f"{ad['_id']}: {e.detail}")
+        return "failed"
+    # Only if the image wasn't changed meanwhile
+    await db.ads.update_one(
+        {"_id": ad["_id"], "ad_image_url": ad["ad_image_url"]},
+        {"$set": {"ad_creative": creative}},
+    )
+    return "processed"
+
+
+async def migrate(concurrency=8):
+    counts = {"processed": 0, "failed": 0}
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(ad):
+        async with semaphore:
+            counts[await process_ad(ad)] += 1
+
+    ads = await db.ads.find(
+        {"ad_creative": None, "ad_image_url": {"$nin": [None, ""]}}, {"ad_image_url": 1}
+    ).to_list(None)
+    await asyncio.gather(*(run(ad) for ad in ads))
+    elapsed = time.perf_counter() - started
+    print(f"processed={counts['processed']} failed={counts['failed']} "
+          f"({counts['processed'] / max(elapsed, 1e-9):.1f} ads/s)")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=8, help="images fetched and processed at once")
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            return await migrate(concurrency=args.concurrency)
+        finally:
+            await ad_image_fetcher.close()
+
+    print(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Rebuild indexes whose definition changed, and create missing ones.
+
+Workers only report outdated indexes at startup (see GET /indexes). Run this once
+per deploy that changes an index, from a single process:
+
+    python -m app.migrations.rebuild_indexes
+
+Each outdated index is dropped and recreated, so queries that need it run without
+it until the build finishes.
+"""
+import argparse
+import asyncio
+
+from app.indexes import ensure_indexes
+
+
+async def migrate():
+    report = await ensure_indexes(rebuild=True)
+    for index in report:
+        print(f"{index['collection']}.{index['name']}: {index['action']}")
+    return report
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__.splitlines()[0]).parse_args()
+    asyncio.run(migrate())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Move menus embedded in restaurant documents into the menus collection.
+
+Safe to run while the API is serving traffic, and safe to re-run:
+
+    python -m app.migrations.split_menus --batch-size 100
+
+Each menu is first copied with a "pending" flag (the API keeps using the embedded
+original), then pulled from the restaurant only if its version is unchanged, and
+finally un-flagged. If the menu was edited in between, the copy is discarded and
+the menu is retried on the next pass.
+"""
+import argparse
+import asyncio
+import time
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from app.db import db
+from app.utils.menu_store import menus_collection
+
+MAX_PASSES = 5
+
+
+async def migrate_menu(restaurant_id, menu):
+    """Move one embedded menu; returns "moved", "retry" or "skipped"."""
+    if not menu.get("id"):
+        # Menus without an id can't be addressed by the API; give them one while moving
+        menu = {**menu, "id": str(ObjectId())}
+        result = await db.restaurants.update_one(
+            {"_id": restaurant_id, "menus": {"$elemMatch": {"id": None, "name": menu.get("name")}}},
+            {"$set": {"menus.$.id": menu["id"]}},
+        )
+        if result.modified_count == 0:
+            return "retry"
+
+    version = menu.get("version", 0)
+    fields = {k: v for k, v in menu.items() if k != "id"}
+    try:
+        await menus_collection.insert_one({
+            "_id": menu["id"], "restaurant_id": restaurant_id, **fields, "version": version, "pending": True,
+        })
+    except DuplicateKeyError:
+        existing = await menus_collection.find_one({"_id": menu["id"]}, {"pending": 1})
+        if existing and not existing.get("pending"):
+            # Already live in the collection; the embedded copy is a leftover
+            await db.restaurants.update_one({"_id": restaurant_id}, {"$pull": {"menus": {"id": menu["id"]}}})
+            return "skipped"
+        # A pending copy from an interrupted run; replace it with the current content
+        await menus_collection.replace_one(
+            {"_id": menu["id"]},
+            {"restaurant_id": restaurant_id, **fields, "version": version, "pending": True},
+        )
+
+    version_condition = {"$in": [0, None]} if version == 0 else version
+    pulled = await db.restaurants.update_one(
+        {"_id": restaurant_id, "menus": {"$elemMatch": {"id": menu["id"], "version": version_condition}}},
+        {"$pull": {"menus": {"id": menu["id"]}}},
+    )
+    if pulled.modified_count:
+        await menus_collection.update_one({"_id": menu["id"]}, {"$unset": {"pending": ""}})
+        return "moved"
+
+    # Edited while we were copying it: the embedded menu is still authoritative
+    await menus_collection.delete_one({"_id": menu["id"], "pending": True})
+    return "retry"
+
+
+async def migrate(batch_size=100, max_passes=MAX_PASSES):
+    counts = {"moved": 0, "retry": 0, "skipped": 0}
+    started = time.perf_counter()
+    for _ in range(max_passes):
+        last_id = None
+        retries = 0
+        while True:
+            query = {"menus.0": {"$exists": True}}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            restaurants = await db.restaurants.find(query, {"menus": 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+            if not restaurants:
+                break
+            for restaurant in restaurants:
+                for menu in restaurant["menus"]:
+                    outcome = await migrate_menu(restaurant["_id"], menu)
+                    counts[outcome] += 1
+                    retries += outcome == "retry"
+            last_id = restaurants[-1]["_id"]
+            elapsed = time.perf_counter() - started
+            print(f"moved={counts['moved']} retried={counts['retry']} skipped={counts['skipped']} "
+                  f"({counts['moved'] / max(elapsed, 1e-9):.1f} menus/s)")
+        if retries == 0:
+            break
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=100, help="restaurants read per batch")
+    args = parser.parse_args()
+    print(asyncio.run(migrate(batch_size=args.batch_size)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 
 class Dish(BaseModel):
     name: str
-    price: float
+    price: float = Field(allow_inf_nan=False)  # NaN/inf would be stored and served as invalid JSON
 
 class Category(BaseModel):
     name: str
@@ -0,0 +1,261 @@
+"""Re-render every menu whose published PDF/QR code is out of date.
+
+A render is stale when the menu was edited since (its version moved on), when
+PDF_LAYOUT_VERSION was bumped or the menu's layout changed (including a new
+PDF_DEFAULT_LAYOUT), or when the set of live ads changed. Only those
+menus are rendered, several at a time, so the work spreads over every core of
+the render pool:
+
+    python -m app.rerender --base-url https://api.example.com --concurrency 16
+
+POST /render_jobs/rerender_stale queues the same menus as render jobs instead,
+from a scan that runs in the background (see start_stale_scan).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.db import db
+from app.utils.ad_index import ad_index
+from app.utils.impressions import impression_buffer
+from app.utils.menu_render import menu_renders_collection, render_menu_qr
+from app.utils.menu_store import menus_collection
+from app.utils.pdf_layouts import menu_layout
+from app.utils.render_executor import render_executor
+from app.utils.render_jobs import submit_jobs
+from app.utils.utils import PDF_LAYOUT_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Menus read (and render records looked up) per batch while scanning
+SCAN_BATCH_SIZE = 500
+
+# Default number of menus rendered at once; a little above the pool size keeps every core busy
+DEFAULT_CONCURRENCY = render_executor.workers * 2
+
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://localhost:8000")
+
+# Progress of background scans, so any API worker can report on one; finished scans
+# are removed by a TTL index, like finished render jobs (see app.indexes)
+rerender_scans_collection = db["rerender_scans"]
+
+# Running scan tasks, referenced so they aren't garbage-collected mid-scan
+_scan_tasks = set()
+
+
+def stale_reason(menu_version, render, ads_fingerprint, layout="classic"):
+    """Why a menu needs re-rendering, or None if its artifacts are current."""
+    if render is None:
+        return "never_rendered"
+    if render.get("menu_version", 0) != menu_version:
+        return "content"
+    if render.get("layout_version") != PDF_LAYOUT_VERSION or render.get("layout", "classic") != layout:
+        return "layout"
+    if render.get("ads_fingerprint") != ads_fingerprint:
+        return "ads"
+    return None
+
+
+async def _menu_batches():
+    # Menus in their own collection, then menus still embedded in restaurants
+    last_id = None
+    while True:
+        query = {"pending": {"$ne": True}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await menus_collection.find(query, {"restaurant_id": 1, "version": 1, "pdf_layout": 1}).sort("_id", 1) \
+            .limit(SCAN_BATCH_SIZE).to_list(SCAN_BATCH_SIZE)
+        if not docs:
+            break
+        yield [(str(doc["restaurant_id"]), doc["_id"], doc.get("version", 0), menu_layout(doc)) for doc in docs]
+        last_id = docs[-1]["_id"]
+
+    last_id = None
+    while True:
+        query = {"menus.0": {"$exists": True}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        restaurants = await db.restaurants.find(query, {"menus.id": 1, "menus.version": 1, "menus.pdf_layout": 1}).sort("_id", 1) \
+            .limit(SCAN_BATCH_SIZE).to_list(SCAN_BATCH_SIZE)
+        if not restaurants:
+            break
+        yield [
+            (str(restaurant["_id"]), menu["id"], menu.get("version", 0), menu_layout(menu))
+            for restaurant in restaurants for menu in restaurant["menus"] if menu.get("id")
+        ]
+        last_id = restaurants[-1]["_id"]
+
+
+async def find_stale_menus(force=False):
+    """Yield (restaurant_id, menu_id, reason) for every menu that needs a new render."""
+    # Make sure the live-ad set is current before comparing fingerprints
+    await ad_index.resync()
+    ads_fingerprint = ad_index.fingerprint()
+    async for batch in _menu_batches():
+        renders = {
+            render["_id"]: render
+            async for render in menu_renders_collection.find({"_id": {"$in": [menu_id for _, menu_id, _, _ in batch]}})
+        }
+        for restaurant_id, menu_id, version, layout in batch:
+            reason = "forced" if force else stale_reason(version, renders.get(menu_id), ads_fingerprint, layout)
+            if reason:
+                yield restaurant_id, menu_id, reason
+
+
+def scan_view(scan):
+    """The public representation of a scan document."""
+    view = {
+        "scan_id": str(scan["_id"]),
+        "status": scan["status"],
+        "found": scan["found"],
+        "queued": scan["queued"],
+        "reasons": scan["reasons"],
+        "started_at": scan["started_at"],
+        "finished_at": scan.get("finished_at"),
+    }
+    if scan["status"] == "failed":
+        view["error"] = scan.get("error")
+    return view
+
+
+async def start_stale_scan(base_url, force=False):
+    """Start queueing a render job for every stale menu in the background; returns the scan document.
+
+    Jobs are inserted a batch at a time as the scan goes, so renders start before
+    it finishes.
+    """
+    scan = {"status": "running", "base_url": base_url, "force": force, "found": 0, "queued": 0, "reasons": {},
+            "started_at": datetime.utcnow()}
+    scan["_id"] = (await rerender_scans_collection.insert_one(scan)).inserted_id
+    task = asyncio.get_running_loop().create_task(_run_scan(scan))
+    _scan_tasks.add(task)
+    task.add_done_callback(_scan_tasks.discard)
+    return scan
+
+
+async def _run_scan(scan):
+    progress = {"found": 0, "queued": 0, "reasons": {}}
+    batch = []
+
+    async def submit_batch():
+        progress["queued"] += await submit_jobs(batch, scan["base_url"])
+        batch.clear()
+        await rerender_scans_collection.update_one({"_id": scan["_id"]}, {"$set": progress})
+
+    try:
+        async for restaurant_id, menu_id, reason in find_stale_menus(scan["force"]):
+            progress["found"] += 1
+            progress["reasons"][reason] = progress["reasons"].get(reason, 0) + 1
+            batch.append((restaurant_id, menu_id))
+            if len(batch) == SCAN_BATCH_SIZE:
+                await submit_batch()
+        await submit_batch()
+    except Exception as e:
+        logger.exception("Stale menu scan %s failed", scan["_id"])
+        finished = {"status": "failed", "error": str(e)}
+    else:
+        finished = {"status": "done"}
+    await rerender_scans_collection.update_one(
+        {"_id": scan["_id"]}, {"$set": {**finished, "finished_at": datetime.utcnow()}}
+    )
+
+
+async def get_scan(scan_id):
+    try:
+        scan_oid = ObjectId(scan_id)
+    except Exception:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    scan = await rerender_scans_collection.find_one({"_id": scan_oid})
+    if not scan:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    return scan
+
+
+async def rerender_stale(base_url=PUBLIC_BASE_URL, concurrency=DEFAULT_CONCURRENCY, force=False, progress_seconds=5):
+    """Render every stale menu with up to `concurrency` renders in flight; returns counts."""
+    counts = {"rendered": 0, "failed": 0, "reasons": {}}
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    started = time.perf_counter()
+
+    def report(final=False):
+        elapsed = time.perf_counter() - started
+        done = counts["rendered"] + counts["failed"]
+        print(f"{'done' if final else 'progress'}: rendered={counts['rendered']} failed={counts['failed']} "
+              f"found={sum(counts['reasons'].values())} ({done / max(elapsed, 1e-9):.1f} menus/s)")
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            restaurant_id, menu_id = item
+            for attempt in range(5):
+                try:
+                    await render_menu_qr(restaurant_id, menu_id, base_url)
+                    counts["rendered"] += 1
+                    break
+                except HTTPException as e:
+                    if e.status_code != 503:
+                        counts["failed"] += 1
+                        print(f"{menu_id}: {e.detail}")
+                        break
+                    # Render pool saturated by API traffic; back off and retry
+                    await asyncio.sleep(0.5 * (attempt + 1))
+                except Exception as e:
+                    counts["failed"] += 1
+                    print(f"{menu_id}: {e}")
+                    break
+            else:
+                counts["failed"] += 1
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(progress_seconds)
+            report()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    progress = asyncio.create_task(reporter())
+    try:
+        async for restaurant_id, menu_id, reason in find_stale_menus(force):
+            counts["reasons"][reason] = counts["reasons"].get(reason, 0) + 1
+            await queue.put((restaurant_id, menu_id))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        progress.cancel()
+        for task in workers:
+            task.cancel()
+
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    counts["menus_per_second"] = round((counts["rendered"] + counts["failed"]) / max(counts["seconds"], 1e-9), 2)
+    report(final=True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default=PUBLIC_BASE_URL, help="public API URL encoded in the QR codes")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="menus rendered at once")
+    parser.add_argument("--force", action="store_true", help="re-render every menu, stale or not")
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            return await rerender_stale(args.base_url.rstrip("/"), args.concurrency, args.force)
+        finally:
+            # Renders claim ads, so write out their impressions before exiting
+            await impression_buffer.flush()
+            render_executor.shutdown()
+
+    print(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,38 @@
 from fastapi import APIRouter, HTTPException , Body
+from app.utils.responses import BSONRoute
 from app.models import Ad
 from app.db import db
 from bson import ObjectId
 from datetime import datetime , timedelta
+from app.utils.ad_index import ad_index, not_expired
+from app.utils.impressions import impression_buffer
+from app.utils.ad_creatives import ingest_creative
 
-router = APIRouter()
+router = APIRouter(route_class=BSONRoute)
 
 # Onboard a new ad
 @router.post("/onboardAd")
 async def create_ad(ad: Ad):
-    ad.last_served = None  # Initialize with no last served
-    ad.impression_count = 0  # Initialize the impression count
-    result = await db.ads.insert_one(ad.dict())
+    ad_data = ad.dict()
+    ad_data["last_served"] = None  # Initialize with no last served
+    ad_data["impression_count"] = 0  # Initialize the impression count
+    # Fetch and shrink the image now so renders never download the original
+    ad_data["ad_creative"] = await ingest_creative(ad.ad_image_url)
+    result = await db.ads.insert_one(ad_data)
+    ad_index.upsert(ad_data)  # insert_one sets ad_data["_id"]
     return {"message": "Ad added successfully", "ad_id": str(result.inserted_id)}
 
-# Fetch all ads (for management UI)
+# Fetch all live ads (for management UI)
 @router.get("/ads")
 async def get_ads():
-    ads = await db.ads.find().to_list(100)
+    ads = await db.ads.find(not_expired(datetime.utcnow())).to_list(100)
     return [ad for ad in ads]
 
+# Impression buffer backlog and flush latency
+@router.get("/impressions/stats")
+async def get_impression_stats():
+    return impression_buffer.stats()
+
 @router.post("/brands/{brand_id}/ads")
 async def add_ad_to_brand(brand_id: str, ad: Ad = Body(...)):
     # Check if brand exists
@@ -27,8 +40,10 @@ async def add_ad_to_brand(brand_id: str, ad: Ad = Body(...)):
     if not brand:
         raise HTTPException(status_code=404, detail="Brand not found")
     
-    # Set up the ad with TTL
-    expiration_date = datetime.utcnow() + timedelta(seconds=ad.ttl)
+    # Set up the ad with TTL; ads without one never expire
+    expiration_date = None
+    if ad.ttl and ad.ttl > 0:
+        expiration_date = datetime.utcnow() + timedelta(seconds=ad.ttl)
     ad_data = {
         "ad_name": ad.ad_name,
         "bid_price": ad.bid_price,
@@ -38,10 +53,12 @@ async def add_ad_to_brand(brand_id: str, ad: Ad = Body(...)):
         "created_at": ad.created_at,
         "expires_at": expiration_date,
         "impression_count": ad.impression_count,
-        "brand_id": ObjectId(brand_id)  # Store the reference to the brand
+        "brand_id": ObjectId(brand_id),  # Store the reference to the brand
+        "ad_creative": await ingest_creative(ad.ad_image_url),
     }
 
     # Insert the ad into the ads collection
     result = await db.ads.insert_one(ad_data)
+    ad_index.upsert(ad_data)
     
     return {"message": "Ad added successfully", "ad_id": str(result.inserted_id)}
\ No newline at end of file
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from app.utils.responses import BSONRoute
 from pydantic import BaseModel
 from bson import ObjectId
 from typing import Optional
 from app.db import db
 from app.models import Ad
+from app.utils.ad_index import ad_index, not_expired
+from app.utils.ad_creatives import ingest_creative
+from app.utils.brand_search import search_brands, search_keys_for, DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
 from datetime import datetime, timedelta
 
-router = APIRouter()
+router = APIRouter(route_class=BSONRoute)
 
 # Brand Model
 class Brand(BaseModel):
@@ -18,14 +22,15 @@ class Brand(BaseModel):
 async def create_brand(brand: Brand):
     result = await db.brands.insert_one({
         "brand_name": brand.brand_name,
-        "metadata": brand.metadata
+        "metadata": brand.metadata,
+        "search_keys": search_keys_for(brand.brand_name),  # Powers the indexed prefix search
     })
     return {"message": "Brand onboarded successfully", "brand_id": str(result.inserted_id)}
 
 # Search brands by name
 @router.get("/searchBrand/{name}")
-async def search_brand(name: str):
-    brands = await db.brands.find({"brand_name": {"$regex": name, "$options": "i"}}).to_list(10)
+async def search_brand(name: str, limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT)):
+    brands = await search_brands(name, limit)
     if not brands:
         raise HTTPException(status_code=404, detail="No brands found")
     return brands
@@ -47,8 +52,10 @@ async def add_ad_to_brand(brand_id: str, ad: Ad):
     new_ad = ad.dict()
     new_ad['brand_id'] = brand_id
     new_ad['expires_at'] = expiration_time  # Store the expiration time in the ad
+    new_ad['ad_creative'] = await ingest_creative(ad.ad_image_url)
 
     result = await db.ads.insert_one(new_ad)
+    ad_index.upsert(new_ad)
 
     return {"message": "Ad added successfully", "ad_id": str(result.inserted_id)}
 
@@ -77,36 +84,18 @@ async def add_ad_to_brand(brand_id: str, ad: Ad):
 async def get_ads_for_brand(brand_id: str):
     # Fetch ads excluding those with expired TTL
     current_time = datetime.utcnow()
-    ads = await db.ads.find({
-        "brand_id": brand_id,
-        "$or": [{"expires_at": None}, {"expires_at": {"$gte": current_time}}]
-    }).to_list(100)
+    ads = await db.ads.find({"brand_id": brand_id, **not_expired(current_time)}).to_list(100)
 
     if not ads:
         raise HTTPException(status_code=404, detail="No ads found or all ads expired")
 
     return ads
 
-# TTL Cleanup - Can be used as a background task (optional)
-async def ttl_cleanup():
-    current_time = datetime.utcnow()
-    result = await db.ads.delete_many({"expires_at": {"$lte": current_time}})
-    return result.deleted_count
-
-
-# Utility function to convert ObjectId to string
-def convert_objectid_to_str(data):
-    if isinstance(data, list):
-        return [convert_objectid_to_str(item) for item in data]
-    if isinstance(data, dict):
-        return {key: (str(value) if isinstance(value, ObjectId) else value) for key, value in data.items()}
-    return data
-
 # Get all brands
 @router.get("/getAllBrands")
 async def get_brands():
     brands = await db.brands.find().to_list(100)
-    return convert_objectid_to_str(brands)
+    return brands
 
 @router.get("/{brand_id}/ads")
 async def get_ads_for_brand(brand_id: str):
@@ -1,6 +1,7 @@
 from fastapi import APIRouter
+from app.utils.responses import BSONRoute
 
-router = APIRouter()
+router = APIRouter(route_class=BSONRoute)
 
 @router.get("/")
 async def get_categories():
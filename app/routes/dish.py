@@ -1,10 +1,17 @@
-from fastapi import APIRouter,HTTPException
+from fastapi import APIRouter,HTTPException, UploadFile, File
+from app.utils.responses import BSONRoute
+from fastapi.concurrency import run_in_threadpool
 from app.models import Restaurant, Menu, Category, Dish
 from app.db import db
 from bson import ObjectId
-from app.utils.utils import obj_to_str
+from app.utils.menu_store import (
+    update_menu, rewrite_menu, remove_dish_at, first_category_positions, edit_first_categories,
+    category_guard,
+)
+from app.utils.menu_import import iter_rows, next_chunk, validate_chunk
+from typing import Optional
 
-router = APIRouter()
+router = APIRouter(route_class=BSONRoute)
 
 @router.get("/")
 async def get_dishes():
@@ -15,96 +22,126 @@ async def create_dish(name: str, price: float):
     return {"message": f"Dish {name} with price {price} created"}
 
 @router.post("/restaurants/{restaurant_id}/menus/{menu_id}/categories/{category_name}/dishes")
-async def add_dish(restaurant_id: str, menu_id: str, category_name: str, dish: Dish):
-    print(f"Received request to add dish to category: {category_name} in menu: {menu_id} for restaurant: {restaurant_id}")
-    # Fetch the restaurant by ID
-    restaurant = await db.restaurants.find_one({"_id": ObjectId(restaurant_id)})
-    if not restaurant:
-        raise HTTPException(status_code=404, detail="Restaurant not found")
-
-    # Find the menu by menu_id
-    menu = next((menu for menu in restaurant["menus"] if menu["id"] == menu_id), None)
-    if not menu:
-        raise HTTPException(status_code=404, detail="Menu not found")
-
-    # Find the category by name
-    category = next((cat for cat in menu["categories"] if cat["name"] == category_name), None)
-    if not category:
-        raise HTTPException(status_code=404, detail="Category not found")
-
-    # Add the new dish to the category
+async def add_dish(restaurant_id: str, menu_id: str, category_name: str, dish: Dish, expected_version: Optional[int] = None):
+    # Append the new dish to the (first) category with that name, in place
     new_dish = dish.dict()
-    category["dishes"].append(new_dish)
 
-    # Update the restaurant document in the database
-    await db.restaurants.update_one(
-        {"_id": ObjectId(restaurant_id)},
-        {"$set": {"menus": restaurant["menus"]}}
-    )
+    async def push(indexes):
+        await update_menu(
+            restaurant_id, menu_id,
+            {"$push": {f"categories.{indexes[category_name]}.dishes": new_dish}},
+            expected_version=expected_version,
+            menu_conditions=category_guard(indexes),
+            not_found_detail="Category not found",
+        )
+
+    await edit_first_categories(restaurant_id, menu_id, [category_name], push)
 
     return new_dish
 
 @router.delete("/restaurants/{restaurant_id}/menus/{menu_id}/categories/{category_name}/dishes/{dish_index}")
-async def delete_dish(restaurant_id: str, menu_id: str, category_name: str, dish_index: int):
-    # Fetch the restaurant by ID
-    restaurant = await db.restaurants.find_one({"_id": ObjectId(restaurant_id)})
-    if not restaurant:
-        raise HTTPException(status_code=404, detail="Restaurant not found")
-
-    # Find the menu by menu_id
-    menu = next((menu for menu in restaurant["menus"] if menu["id"] == menu_id), None)
-    if not menu:
-        raise HTTPException(status_code=404, detail="Menu not found")
-
-    # Find the category by name
-    category = next((cat for cat in menu["categories"] if cat["name"] == category_name), None)
-    if not category:
-        raise HTTPException(status_code=404, detail="Category not found")
-
+async def delete_dish(restaurant_id: str, menu_id: str, category_name: str, dish_index: int, expected_version: Optional[int] = None):
     # Ensure the dish index is valid
-    if dish_index < 0 or dish_index >= len(category["dishes"]):
+    if dish_index < 0:
         raise HTTPException(status_code=404, detail="Dish not found")
 
-    # Remove the dish
-    category["dishes"].pop(dish_index)
+    # Remove the dish by index in a single server-side update
+    async def remove(indexes):
+        await rewrite_menu(
+            restaurant_id, menu_id,
+            remove_dish_at(indexes[category_name], dish_index),
+            expected_version=expected_version,
+            menu_conditions=_dish_exists(indexes, category_name, dish_index),
+            not_found_detail="Dish not found",
+        )
 
-    # Update the restaurant document in the database
-    await db.restaurants.update_one(
-        {"_id": ObjectId(restaurant_id)},
-        {"$set": {"menus": restaurant["menus"]}}
-    )
+    await edit_first_categories(restaurant_id, menu_id, [category_name], remove)
 
     return {"message": "Dish deleted successfully"}
 
 
 @router.put("/restaurants/{restaurant_id}/menus/{menu_id}/categories/{category_name}/dishes/{dish_index}")
-async def update_dish(restaurant_id: str, menu_id: str, category_name: str, dish_index: int, updated_dish: Dish):
-    # Fetch the restaurant by ID
-    restaurant = await db.restaurants.find_one({"_id": ObjectId(restaurant_id)})
-    if not restaurant:
-        raise HTTPException(status_code=404, detail="Restaurant not found")
-
-    # Find the menu by menu_id
-    menu = next((menu for menu in restaurant["menus"] if menu["id"] == menu_id), None)
-    if not menu:
-        raise HTTPException(status_code=404, detail="Menu not found")
-
-    # Find the category by name
-    category = next((cat for cat in menu["categories"] if cat["name"] == category_name), None)
-    if not category:
-        raise HTTPException(status_code=404, detail="Category not found")
-
+async def update_dish(restaurant_id: str, menu_id: str, category_name: str, dish_index: int, updated_dish: Dish, expected_version: Optional[int] = None):
     # Ensure the dish index is valid
-    if dish_index < 0 or dish_index >= len(category["dishes"]):
+    if dish_index < 0:
         raise HTTPException(status_code=404, detail="Dish not found")
 
-    # Update the dish information
-    category["dishes"][dish_index] = updated_dish.dict()
+    # Replace just that dish
+    async def replace(indexes):
+        await update_menu(
+            restaurant_id, menu_id,
+            {"$set": {f"categories.{indexes[category_name]}.dishes.{dish_index}": updated_dish.dict()}},
+            expected_version=expected_version,
+            menu_conditions=_dish_exists(indexes, category_name, dish_index),
+            not_found_detail="Dish not found",
+        )
 
-    # Update the restaurant document in the database
-    await db.restaurants.update_one(
-        {"_id": ObjectId(restaurant_id)},
-        {"$set": {"menus": restaurant["menus"]}}
-    )
+    await edit_first_categories(restaurant_id, menu_id, [category_name], replace)
 
     return {"message": "Dish updated successfully"}
+
+
+def _dish_exists(indexes, category_name, dish_index):
+    return {
+        **category_guard(indexes),
+        f"categories.{indexes[category_name]}.dishes.{dish_index}": {"$exists": True},
+    }
+
+
+@router.post("/restaurants/{restaurant_id}/menus/{menu_id}/dishes/import")
+async def import_dishes(restaurant_id: str, menu_id: str, file: UploadFile = File(...)):
+    """Bulk import dishes from a CSV or XLSX file with category, name and price columns.
+
+    Rows are streamed, validated and written in chunks; invalid rows are skipped
+    and reported back by row number.
+    """
+    known_categories = set(await first_category_positions(restaurant_id, menu_id))
+
+    imported = 0
+    errors = []
+    try:
+        rows = iter_rows(file.file, file.filename or "")
+        # Parse first chunk up front so a bad header is rejected before any write
+        chunk = await run_in_threadpool(next_chunk, rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    while chunk:
+        dishes_by_category, chunk_errors = validate_chunk(chunk)
+        errors.extend(chunk_errors)
+
+        existing = {name: dishes for name, dishes in dishes_by_category.items() if name in known_categories}
+        new = {name: dishes for name, dishes in dishes_by_category.items() if name not in known_categories}
+
+        # One write for dishes going into existing categories...
+        if existing:
+            async def push(indexes):
+                await update_menu(
+                    restaurant_id, menu_id,
+                    {"$push": {
+                        f"categories.{indexes[name]}.dishes": {"$each": dishes}
+                        for name, dishes in existing.items()
+                    }},
+                    menu_conditions=category_guard(indexes),
+                    not_found_detail="Category not found",
+                )
+
+            await edit_first_categories(restaurant_id, menu_id, list(existing), push)
+        # ...and one for categories that don't exist yet
+        if new:
+            await update_menu(
+                restaurant_id, menu_id,
+                {"$push": {"categories": {
+                    "$each": [{"name": name, "dishes": dishes} for name, dishes in new.items()]
+                }}},
+            )
+            known_categories.update(new)
+        imported += sum(len(dishes) for dishes in dishes_by_category.values())
+
+        try:
+            chunk = await run_in_threadpool(next_chunk, rows)
+        except ValueError as e:
+            errors.append({"row": None, "errors": [str(e)]})
+            break
+
+    return {"imported": imported, "failed": len(errors), "errors": errors}
@@ -1,94 +1,108 @@
 from app.db import db
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
+from app.utils.responses import BSONRoute
 from bson import ObjectId
-import qrcode
-import pdfkit
-import os
-from fastapi.responses import FileResponse
+from typing import Optional
+import logging
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from app.utils.pdf_delivery import PDF_DELIVERY_MODE, render_pdf_on_demand
+from app.utils.http_cache import etag_matches, file_etag, not_modified, PDF_CACHE_CONTROL, QR_CACHE_CONTROL
 from app.models import Menu  # Assuming Menu is also needed for menu routes
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from app.utils.menu_store import insert_menu, list_menus
+from app.utils.menu_render import menu_renders_collection, pdf_artifact_name, qr_artifact_name
+from app.utils.qr_codes import qr_code_cache, QR_FORMATS, QR_PNG_SIZES
+from app.utils.storage import artifact_store
 
-router = APIRouter()
+router = APIRouter(route_class=BSONRoute)
 
-# Directory where PDF and QR codes are saved
-FILE_DIR = './generated_files/'
-
-# Ensure the directory exists
-os.makedirs(FILE_DIR, exist_ok=True)
+logger = logging.getLogger(__name__)
 
 @router.post("/{restaurant_id}/menus")
 async def create_menu(restaurant_id: str, menu: Menu):
     try:
-        restaurant = await db.restaurants.find_one({"_id": ObjectId(restaurant_id)})
-        if not restaurant:
-            raise HTTPException(status_code=404, detail="Restaurant not found")
-        
-        result = await db.restaurants.update_one(
-            {"_id": ObjectId(restaurant_id)},
-            {"$push": {"menus": menu.dict()}}
-        )
-        return {"message": "Menu added successfully", "menu_id": menu.name}
+        menu_with_id = {**menu.dict(), "id": str(ObjectId()), "version": 0}
+        await insert_menu(restaurant_id, menu_with_id)
+        return {"message": "Menu added successfully", "menu_id": menu_with_id["id"]}
     
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error: {e}")
+        logger.exception("Failed to create menu for restaurant %s", restaurant_id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{restaurant_id}/menus")
 async def get_menus(restaurant_id: str):
-    restaurant = await db.restaurants.find_one({"_id": ObjectId(restaurant_id)})
-    if not restaurant:
+    menus = await list_menus(restaurant_id)
+    if menus is None:
         raise HTTPException(status_code=404, detail="Restaurant not found")
-    return restaurant.get("menus", [])
-
-# Generate PDF for the menu using ReportLab
-def generate_menu_pdf(menu_data, file_path):
-    c = canvas.Canvas(file_path, pagesize=letter)
-    
-    # Add menu name and handle missing 'location'
-    c.drawString(100, 750, f"Menu Name: {menu_data.get('name', 'Unknown Menu')}")
-    
-    # Since 'location' is not part of 'menu_data', default to a fallback value
-    c.drawString(100, 730, "Location: Location not specified")  # Hardcoded fallback value
-
-    y = 700
-    # Add categories and dishes
-    for category in menu_data.get("categories", []):
-        c.drawString(100, y, f"Category: {category.get('name', 'Unnamed Category')}")
-        y -= 20
-        for dish in category.get("dishes", []):
-            c.drawString(120, y, f"Dish: {dish.get('name', 'Unnamed Dish')}, Price: {dish.get('price', 'N/A')}")
-            y -= 20
-
-    c.save()
-
-# Generate QR code
-def generate_qr_code(url, file_path):
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-    img = qr.make_image(fill='black', back_color='white')
-    img.save(file_path)
+    return menus
 
 # Endpoint to download the generated PDF
 @router.get("/{menu_id}/download_pdf")
-async def download_pdf(menu_id: str):
-    print(f"dpdf")
-    pdf_file_path = f"{FILE_DIR}menu_{menu_id}.pdf"
-    if not os.path.exists(pdf_file_path):
-        raise HTTPException(status_code=404, detail="PDF not found")
-    return FileResponse(pdf_file_path, media_type='application/pdf')
+async def download_pdf(menu_id: str, request: Request):
+    if PDF_DELIVERY_MODE == "on_demand":
+        # Render in memory and send the bytes back; nothing touches the local disk
+        pdf_bytes, etag = await render_pdf_on_demand(menu_id, lambda etag: etag_matches(request, etag))
+        if pdf_bytes is None:
+            return not_modified(etag, PDF_CACHE_CONTROL)
+        return Response(pdf_bytes, media_type='application/pdf',
+                        headers={"ETag": etag, "Cache-Control": PDF_CACHE_CONTROL})
+
+    name = pdf_artifact_name(menu_id)
+    # With object storage, send the client straight to the bucket so the bytes skip this worker
+    url = await artifact_store.presigned_url(name)
+    if url:
+        if not await artifact_store.exists(name):
+            raise HTTPException(status_code=404, detail="PDF not found")
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
+    return await _artifact_response(request, name, 'application/pdf', PDF_CACHE_CONTROL, "PDF not found")
 
 # Endpoint to download the generated QR code
 @router.get("/{menu_id}/download_qr")
-async def download_qr(menu_id: str):
-    qr_file_path = f"{FILE_DIR}qr_{menu_id}.png"
-    if not os.path.exists(qr_file_path):
+async def download_qr(
+    menu_id: str,
+    request: Request,
+    format: str = Query("png", pattern="^(png|svg)$"),
+    size: Optional[int] = Query(None, description=f"PNG width in pixels, one of {list(QR_PNG_SIZES)}"),
+):
+    if format == "png" and size is None:
+        return await _artifact_response(request, qr_artifact_name(menu_id), 'image/png', QR_CACHE_CONTROL,
+                                        "QR Code not found")
+
+    if format == "png" and size not in QR_PNG_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {list(QR_PNG_SIZES)}")
+    # Other variants are rendered from the same payload on first request, then served from the QR cache
+    render = await menu_renders_collection.find_one({"_id": menu_id}, {"qr_payload": 1})
+    if render is None and not await artifact_store.exists(qr_artifact_name(menu_id)):
         raise HTTPException(status_code=404, detail="QR Code not found")
-    print(f"Serving QR code from {qr_file_path}")  # Debug: Add this line to check the path
-    return FileResponse(qr_file_path, media_type='image/png')
+    payload = (render or {}).get("qr_payload") or f"{str(request.base_url).rstrip('/')}/menus/{menu_id}/download_pdf"
+    path = await qr_code_cache.get(payload, format, size)
+    return await _file_response(request, path, QR_FORMATS[format], QR_CACHE_CONTROL)
+
+async def _artifact_response(request, name, media_type, cache_control, not_found_detail):
+    path = artifact_store.local_path(name)
+    if path is not None:
+        return await _file_response(request, path, media_type, cache_control, not_found_detail)
+
+    stat = await artifact_store.stat(name)
+    if stat is None:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    if etag_matches(request, stat["etag"]):
+        return not_modified(stat["etag"], cache_control)
+    data = await artifact_store.get(name)
+    if data is None:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    return Response(data, media_type=media_type, headers={"ETag": stat["etag"], "Cache-Control": cache_control})
+
+async def _file_response(request, file_path, media_type, cache_control, not_found_detail="File not found"):
+    # Answer conditional requests from the file alone, without touching Mongo. Hashing
+    # a changed file reads all of it, so it happens in the threadpool.
+    try:
+        etag = await run_in_threadpool(file_etag, file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    return FileResponse(file_path, media_type=media_type,
+                        headers={"ETag": etag, "Cache-Control": cache_control})
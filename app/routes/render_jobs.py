@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Request
+from app.utils.responses import BSONRoute
+from app.utils.menu_store import get_menu
+from app.utils.render_jobs import submit_job, get_job, job_view
+from app.rerender import start_stale_scan, get_scan, scan_view
+
+router = APIRouter(route_class=BSONRoute)
+
+# Queue a render of the menu PDF and QR code; returns immediately with a job to poll
+@router.post("/restaurants/{restaurant_id}/menus/{menu_id}/render_jobs", status_code=202)
+async def create_render_job(restaurant_id: str, menu_id: str, request: Request):
+    # Fail fast on unknown menus instead of queueing a job that can only fail
+    await get_menu(restaurant_id, menu_id, fields=["id"])
+    job = await submit_job(restaurant_id, menu_id, str(request.base_url).rstrip("/"))
+    view = job_view(job)
+    view["status_url"] = str(request.url_for("get_render_job", job_id=view["job_id"]))
+    return view
+
+# Queue a render job for every menu whose PDF is out of date (menu edited, layout or ads changed).
+# The scan runs in the background; returns immediately with the scan to poll
+@router.post("/render_jobs/rerender_stale", status_code=202)
+async def rerender_stale_menus(request: Request, force: bool = False):
+    scan = await start_stale_scan(str(request.base_url).rstrip("/"), force)
+    view = scan_view(scan)
+    view["status_url"] = str(request.url_for("get_rerender_scan", scan_id=view["scan_id"]))
+    return view
+
+# Poll a stale-menu scan: running, done or failed, with how many menus it found and queued
+@router.get("/render_jobs/rerender_stale/{scan_id}")
+async def get_rerender_scan(scan_id: str):
+    return scan_view(await get_scan(scan_id))
+
+# Poll a render job: queued, running, done (with the artifact URLs) or failed
+@router.get("/render_jobs/{job_id}")
+async def get_render_job(job_id: str):
+    return job_view(await get_job(job_id))
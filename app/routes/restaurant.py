@@ -1,16 +1,26 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Query
+from app.utils.responses import BSONRoute, BSONJSONResponse, encode_json
+from fastapi.responses import StreamingResponse
 from app.models import Restaurant, Menu, Category, Dish
 from app.db import db
-from app.utils.utils import get_next_ad
 from bson import ObjectId
-from app.utils.utils import obj_to_str,generate_menu_pdf, generate_qr_code,FILE_DIR
-from pydantic import BaseModel
+from app.utils.menu_render import render_menu_qr
+from app.utils.pdf_layouts import PDF_LAYOUTS
+from app.utils.http_cache import make_etag, etag_matches, not_modified, MENUS_CACHE_CONTROL
+from app.utils.menu_store import (
+    update_menu, rewrite_menu, remove_category_at, list_menus, insert_menu, attach_menus,
+)
+from pydantic import BaseModel, Field
+from typing import Optional
 
 class MenuNameUpdate(BaseModel):
     new_name: str
     welcome_text: str
 
-router = APIRouter()
+class MenuLayoutUpdate(BaseModel):
+    layout: str = Field(pattern=f"^({'|'.join(PDF_LAYOUTS)})$")
+
+router = APIRouter(route_class=BSONRoute)
 
 # Restaurant CRUD Operations
 @router.post("/")
@@ -18,165 +28,189 @@ async def create_restaurant(restaurant: Restaurant):
     result = await db.restaurants.insert_one(restaurant.dict())
     return {"id": str(result.inserted_id)}
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NDJSON_BATCH_SIZE = 100  # Restaurants per menus lookup when streaming
+
 @router.get("/")
-async def get_restaurants():
-    restaurants = await db.restaurants.find().to_list(100)
-    return [obj_to_str(rest) for rest in restaurants]
+async def get_restaurants(
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    summary: bool = False,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """List restaurants ordered by _id, one page at a time.
+
+    Pass the X-Next-Cursor header of a page as `after` to get the next one.
+    `summary=true` leaves out menus, and `fields` (comma separated) returns only the
+    named fields. `format=ndjson` streams one document per line as the cursor yields
+    them; it is unbounded unless `limit` is given.
+    """
+    query = {}
+    if after:
+        try:
+            query["_id"] = {"$gt": ObjectId(after)}
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Menus stored in their own collection are only looked up when the caller wants them;
+    # menu_fields narrows them for fields=menus.<field>
+    projection, with_menus, menu_fields = None, not summary, None
+    if fields:
+        projection = {field.strip(): 1 for field in fields.split(",") if field.strip()}
+        menu_fields = [field[len("menus."):] for field in projection if field.startswith("menus.")]
+        with_menus = "menus" in projection or bool(menu_fields)
+        if "menus" in projection:
+            menu_fields = None
+    elif summary:
+        projection = {"menus": 0}
+
+    cursor = db.restaurants.find(query, projection).sort("_id", 1)
+
+    if format == "ndjson":
+        if limit:
+            cursor = cursor.limit(limit)
+
+        async def stream():
+            batch = []
+            async for rest in cursor:
+                batch.append(rest)
+                if len(batch) == NDJSON_BATCH_SIZE:
+                    for item in await _with_menus(batch, with_menus, menu_fields):
+                        yield encode_json(item) + "\n"
+                    batch = []
+            for item in await _with_menus(batch, with_menus, menu_fields):
+                yield encode_json(item) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    restaurants = await cursor.limit(limit).to_list(limit)
+    headers = {}
+    if len(restaurants) == limit:
+        headers["X-Next-Cursor"] = str(restaurants[-1]["_id"])
+    return BSONJSONResponse(await _with_menus(restaurants, with_menus, menu_fields), headers=headers)
+
+async def _with_menus(restaurants, with_menus, menu_fields):
+    if with_menus:
+        await attach_menus(restaurants, menu_fields)
+    return restaurants
 
 @router.get("/{restaurant_id}")
 async def get_restaurant(restaurant_id: str):
     restaurant = await db.restaurants.find_one({"_id": ObjectId(restaurant_id)})
     if restaurant:
-        return obj_to_str(restaurant)
+        await attach_menus([restaurant])
+        return restaurant
     raise HTTPException(status_code=404, detail="Restaurant not found")
 
 # Menu Operations within a Restaurant
 @router.post("/{restaurant_id}/menus")
 async def create_menu(restaurant_id: str, menu: Menu):
     # Create a unique ID for the menu
-    menu_with_id = {**menu.dict(), "id": str(ObjectId())}
+    menu_with_id = {**menu.dict(), "id": str(ObjectId()), "version": 0}
     
-    result = await db.restaurants.update_one(
-        {"_id": ObjectId(restaurant_id)},
-        {"$push": {"menus": menu_with_id}}
-    )
-    
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Restaurant not found")
+    await insert_menu(restaurant_id, menu_with_id)
     
     return {"message": "Menu added successfully", "menu_id": menu_with_id["id"]}
 
 @router.get("/{restaurant_id}/menus")
-async def get_menus(restaurant_id: str):
-    restaurant = await db.restaurants.find_one({"_id": ObjectId(restaurant_id)})
-    if not restaurant:
+async def get_menus(restaurant_id: str, request: Request):
+    # Conditional requests are answered from ids + versions alone; anything else reads
+    # the menus once and takes the ETag from that same read
+    if request.headers.get("if-none-match"):
+        versions = await list_menus(restaurant_id, projection=["id", "version"])
+        if versions is None:
+            raise HTTPException(status_code=404, detail="Restaurant not found")
+        etag = _menus_etag(versions)
+        if etag_matches(request, etag):
+            return not_modified(etag, MENUS_CACHE_CONTROL)
+
+    menus = await list_menus(restaurant_id)
+    if menus is None:
         raise HTTPException(status_code=404, detail="Restaurant not found")
-    return restaurant.get("menus", [])
+    etag = _menus_etag(menus)
+    return BSONJSONResponse(menus, headers={"ETag": etag, "Cache-Control": MENUS_CACHE_CONTROL})
 
-@router.post("/{restaurant_id}/menus/{menu_id}/categories")
-async def add_category(restaurant_id: str, menu_id: str, category: Category):
-    # Find the restaurant by restaurant_id
-    restaurant = await db.restaurants.find_one({"_id": ObjectId(restaurant_id)})
-    if not restaurant:
-        raise HTTPException(status_code=404, detail="Restaurant not found")
-    
-    # Find the menu by menu_id
-    menu = next((menu for menu in restaurant["menus"] if menu["id"] == menu_id), None)
-    if not menu:
-        raise HTTPException(status_code=404, detail="Menu not found")
-
-    # Add the category to the menu
-    new_category = category.dict()
-    menu["categories"].append(new_category)
+def _menus_etag(menus):
+    # Every menu edit bumps its version, so ids + versions identify the menus' content
+    return make_etag(*[(menu.get("id"), menu.get("version", 0)) for menu in menus])
 
-    # Update the restaurant document with the new category
-    await db.restaurants.update_one({"_id": ObjectId(restaurant_id)}, {"$set": {"menus": restaurant["menus"]}})
+@router.post("/{restaurant_id}/menus/{menu_id}/categories")
+async def add_category(restaurant_id: str, menu_id: str, category: Category, expected_version: Optional[int] = None):
+    # Append the category to the menu in place
+    await update_menu(
+        restaurant_id, menu_id,
+        {"$push": {"categories": category.dict()}},
+        expected_version=expected_version,
+    )
 
     return {"message": "Category added successfully"}
 
 @router.put("/{restaurant_id}/menus/{menu_id}/categories/{category_index}")
-async def update_category(restaurant_id: str, menu_id: str, category_index: int, updated_category: Category):
-    # Fetch the restaurant by ID
-    restaurant = await db.restaurants.find_one({"_id": ObjectId(restaurant_id)})
-    if not restaurant:
-        raise HTTPException(status_code=404, detail="Restaurant not found")
-
-    # Find the menu by menu_id
-    menu = next((menu for menu in restaurant["menus"] if menu["id"] == menu_id), None)
-    if not menu:
-        raise HTTPException(status_code=404, detail="Menu not found")
-
+async def update_category(restaurant_id: str, menu_id: str, category_index: int, updated_category: Category, expected_version: Optional[int] = None):
     # Ensure the category index is valid
-    if category_index < 0 or category_index >= len(menu["categories"]):
+    if category_index < 0:
         raise HTTPException(status_code=404, detail="Category not found")
 
-    # Update the category
-    menu["categories"][category_index]["name"] = updated_category.name
-
-    # Save the updated menu
-    await db.restaurants.update_one({"_id": ObjectId(restaurant_id)}, {"$set": {"menus": restaurant["menus"]}})
+    # Update only the category name, and only if a category exists at that index
+    await update_menu(
+        restaurant_id, menu_id,
+        {"$set": {f"categories.{category_index}.name": updated_category.name}},
+        expected_version=expected_version,
+        menu_conditions={f"categories.{category_index}": {"$exists": True}},
+        not_found_detail="Category not found",
+    )
 
     return {"message": "Category updated successfully"}
 
 @router.delete("/{restaurant_id}/menus/{menu_id}/categories/{category_index}")
-async def delete_category(restaurant_id: str, menu_id: str, category_index: int):
-    # Fetch the restaurant by ID
-    restaurant = await db.restaurants.find_one({"_id": ObjectId(restaurant_id)})
-    if not restaurant:
-        raise HTTPException(status_code=404, detail="Restaurant not found")
-
-    # Find the menu by menu_id
-    menu = next((menu for menu in restaurant["menus"] if menu["id"] == menu_id), None)
-    if not menu:
-        raise HTTPException(status_code=404, detail="Menu not found")
-
+async def delete_category(restaurant_id: str, menu_id: str, category_index: int, expected_version: Optional[int] = None):
     # Ensure the category index is valid
-    if category_index < 0 or category_index >= len(menu["categories"]):
+    if category_index < 0:
         raise HTTPException(status_code=404, detail="Category not found")
 
-    # Remove the category by index
-    del menu["categories"][category_index]
-
-    # Update the restaurant document in the database
-    await db.restaurants.update_one(
-        {"_id": ObjectId(restaurant_id)}, 
-        {"$set": {"menus": restaurant["menus"]}}
+    # Remove the category by index in a single server-side update
+    await rewrite_menu(
+        restaurant_id, menu_id,
+        remove_category_at(category_index),
+        expected_version=expected_version,
+        menu_conditions={f"categories.{category_index}": {"$exists": True}},
+        not_found_detail="Category not found",
     )
 
     return {"message": "Category deleted successfully"}
 
 @router.get("/{restaurant_id}/menus/{menu_id}/generate_qr")
 async def generate_menu_qr(restaurant_id: str, menu_id: str, request: Request):
-    restaurant = await db.restaurants.find_one({"_id": ObjectId(restaurant_id)})
-    if not restaurant:
-        raise HTTPException(status_code=404, detail="Restaurant not found")
-    
-    menu = next((menu for menu in restaurant["menus"] if menu["id"] == menu_id), None)
-    if not menu:
-        raise HTTPException(status_code=404, detail="Menu not found")
-    
-    # Fetch the next ad to insert
-    ad = await get_next_ad()
-
-    # Ensure that only the necessary ad information is passed as strings
-    ad_name = ad.get("ad_name", "")
-    ad_image_url = ad.get("ad_image_url", "")
-
-    # Generate the PDF of the menu with the ad
-    pdf_file_path = f"{FILE_DIR}menu_{menu_id}.pdf"
-    generate_menu_pdf(menu, ad, pdf_file_path)  # Include the ad name and image URL in the PDF
-    
-    # URL where the PDF will be served
-    base_url = str(request.base_url).rstrip("/")
-    pdf_url = f"{base_url}/menus/{menu_id}/download_pdf"
-    
-    # Generate the QR code linking to the PDF
-    qr_file_path = f"{FILE_DIR}qr_{menu_id}.png"
-    generate_qr_code(pdf_url, qr_file_path)
-
-    return {
-        "message": "QR Code and PDF generated",
-        "pdf_url": pdf_url,
-        "qr_code_url": f"{base_url}/menus/{menu_id}/download_qr"
-    }
+    # Renders while the client waits; POST .../render_jobs queues the same work instead
+    urls = await render_menu_qr(restaurant_id, menu_id, str(request.base_url).rstrip("/"))
+    return {"message": "QR Code and PDF generated", **urls}
 
 @router.put("/{restaurant_id}/menus/{menu_id}")
-async def update_menu_name(restaurant_id: str, menu_id: str, data: MenuNameUpdate):
-    restaurant = await db.restaurants.find_one({"_id": ObjectId(restaurant_id)})
-    if not restaurant:
-        raise HTTPException(status_code=404, detail="Restaurant not found")
-
-    menu = next((menu for menu in restaurant["menus"] if menu["id"] == menu_id), None)
-    if not menu:
-        raise HTTPException(status_code=404, detail="Menu not found")
+async def update_menu_name(restaurant_id: str, menu_id: str, data: MenuNameUpdate, expected_version: Optional[int] = None):
+    await update_menu(
+        restaurant_id, menu_id,
+        {"$set": {
+            "name": data.new_name,  # Update the menu name
+            "welcome_text": data.welcome_text,  # Update the welcome text
+        }},
+        expected_version=expected_version,
+    )
 
-    menu["name"] = data.new_name  # Update the menu name
-    menu["welcome_text"] = data.welcome_text  # Update the welcome text
+    return {"message": "Menu name and welcome text updated successfully"}
 
-    # Save the updated restaurant document
-    await db.restaurants.update_one({"_id": ObjectId(restaurant_id)}, {"$set": {"menus": restaurant["menus"]}})
+@router.put("/{restaurant_id}/menus/{menu_id}/layout")
+async def update_menu_layout(restaurant_id: str, menu_id: str, data: MenuLayoutUpdate, expected_version: Optional[int] = None):
+    # Takes effect on the next render; the version bump marks the published PDF stale
+    await update_menu(
+        restaurant_id, menu_id,
+        {"$set": {"pdf_layout": data.layout}},
+        expected_version=expected_version,
+    )
 
-    return {"message": "Menu name and welcome text updated successfully"}
+    return {"message": "Menu layout updated successfully", "layout": data.layout}
 
 @router.put("/{restaurant_id}")
 async def update_restaurant_name(restaurant_id: str, updated_data: dict):
@@ -0,0 +1,263 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from bson import Binary
+from fastapi import HTTPException
+from PIL import Image, ImageOps, UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
+
+from app.db import db
+from app.utils.image_fetcher import ad_image_fetcher
+from app.utils.metrics import observe_stage
+from app.utils.utils import FILE_DIR, AD_IMAGE_WIDTH, AD_IMAGE_HEIGHT
+
+# Ad creatives are fetched once, when the ad is onboarded, and stored already resized
+# to the box the PDF draws them in. Renders then embed a small JPEG (which ReportLab
+# passes through without re-encoding) instead of downloading the original each time.
+#
+# Processed creatives are content-addressed: the ad document keeps a small
+# "ad_creative" reference, the bytes live in the ad_creatives collection so every
+# worker can load them, and each worker keeps a disk and memory copy.
+ad_creatives_collection = db["ad_creatives"]
+
+AD_CREATIVE_DIR = os.path.join(FILE_DIR, "ad_creatives")
+
+# Pixel density the creative is stored at (200x150 points at 150 DPI is 417x312 pixels)
+AD_CREATIVE_DPI = int(os.getenv("AD_CREATIVE_DPI", 150))
+
+AD_CREATIVE_JPEG_QUALITY = int(os.getenv("AD_CREATIVE_JPEG_QUALITY", 85))
+
+# Originals larger than this are rejected at onboarding
+AD_CREATIVE_MAX_SOURCE_BYTES = int(os.getenv("AD_CREATIVE_MAX_SOURCE_BYTES", 20 * 1024 * 1024))
+
+# Number of processed creatives kept in memory
+AD_CREATIVE_MEMORY_ENTRIES = int(os.getenv("AD_CREATIVE_MEMORY_ENTRIES", 256))
+
+# Creatives no ad refers to are deleted once they are this old (so an ad that is
+# still being onboarded doesn't lose its creative)
+AD_CREATIVE_UNUSED_GRACE_SECONDS = int(os.getenv("AD_CREATIVE_UNUSED_GRACE_SECONDS", 3600))
+
+os.makedirs(AD_CREATIVE_DIR, exist_ok=True)
+
+
+def creative_pixel_size(dpi=AD_CREATIVE_DPI):
+    return round(AD_IMAGE_WIDTH * dpi / 72), round(AD_IMAGE_HEIGHT * dpi / 72)
+
+
+def process_creative(source_bytes, dpi=AD_CREATIVE_DPI, quality=AD_CREATIVE_JPEG_QUALITY):
+    """Resize an original creative to the embedded size; returns (jpeg_bytes, info).
+
+    Raises ValueError if the bytes aren't an image Pillow can read.
+    """
+    size = creative_pixel_size(dpi)
+    try:
+        image = Image.open(BytesIO(source_bytes))
+        source_size = image.size
+        # JPEGs can be decoded at a fraction of their size, which is much cheaper
+        image.draft("RGB", size)
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            # Flatten transparency onto the white page
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        # The PDF stretches the image to fill its box, so match that exactly
+        image = image.resize(size, Image.LANCZOS)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ValueError("not a supported image format") from e
+
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    data = buffer.getvalue()
+    info = {
+        "id": hashlib.sha256(data).hexdigest()[:32],
+        "format": "jpeg",
+        "width": size[0],
+        "height": size[1],
+        "bytes": len(data),
+        "source_width": source_size[0],
+        "source_height": source_size[1],
+        "source_bytes": len(source_bytes),
+    }
+    return data, info
+
+
+class AdCreativeStore:
+    """Processed creatives by id, read from memory, then disk, then Mongo."""
+
+    def __init__(self, cache_dir=AD_CREATIVE_DIR, max_entries=AD_CREATIVE_MEMORY_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._memory = OrderedDict()  # creative id -> bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.missing = 0
+        self.fallbacks = 0
+
+    def _path(self, creative_id):
+        return os.path.join(self.cache_dir, f"{creative_id}.jpg")
+
+    def _remember(self, creative_id, data):
+        with self._lock:
+            self._memory[creative_id] = data
+            self._memory.move_to_end(creative_id)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _read_disk(self, creative_id):
+        try:
+            with open(self._path(creative_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, creative_id, data):
+        path = self._path(creative_id)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    async def save(self, data, info, source_url):
+        """Store a processed creative; saving the same bytes twice is a no-op."""
+        await ad_creatives_collection.update_one(
+            {"_id": info["id"]},
+            {"$setOnInsert": {
+                "data": Binary(data),
+                "content_type": "image/jpeg",
+                "width": info["width"],
+                "height": info["height"],
+                "source_url": source_url,
+                "created_at": datetime.utcnow(),
+            }},
+            upsert=True,
+        )
+        await run_in_threadpool(self._write_disk, info["id"], data)
+        self._remember(info["id"], data)
+
+    async def get(self, creative_id):
+        """Return a processed creative's bytes, or None if it doesn't exist."""
+        with self._lock:
+            data = self._memory.get(creative_id)
+            if data is not None:
+                self.hits += 1
+                self._memory.move_to_end(creative_id)
+                return data
+        data = await run_in_threadpool(self._read_disk, creative_id)
+        if data is None:
+            # First use on this worker: one read from Mongo, then it's on local disk
+            doc = await ad_creatives_collection.find_one({"_id": creative_id}, {"data": 1})
+            if doc is None:
+                with self._lock:
+                    self.missing += 1
+                return None
+            data = bytes(doc["data"])
+            await run_in_threadpool(self._write_disk, creative_id, data)
+        with self._lock:
+            self.loads += 1
+        self._remember(creative_id, data)
+        return data
+
+    def _disk_ids(self):
+        return [name[:-len(".jpg")] for name in os.listdir(self.cache_dir) if name.endswith(".jpg")]
+
+    def _remove_disk(self, creative_ids):
+        for creative_id in creative_ids:
+            try:
+                os.remove(self._path(creative_id))
+            except FileNotFoundError:
+                pass
+
+    async def delete_unused(self, grace_seconds=AD_CREATIVE_UNUSED_GRACE_SECONDS, batch_size=500):
+        """Delete creatives no ad refers to any more; returns {"deleted", "removed_local"}.
+
+        Removes them from Mongo, then drops this worker's copies of any creative that
+        is no longer in Mongo (other workers clean up their own disk the same way).
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+        old_ids = [doc["_id"] async for doc in ad_creatives_collection.find({"created_at": {"$lt": cutoff}}, {"_id": 1})]
+        deleted = 0
+        for start in range(0, len(old_ids), batch_size):
+            ids = old_ids[start:start + batch_size]
+            used = set(await db.ads.distinct("ad_creative.id", {"ad_creative.id": {"$in": ids}}))
+            unused = [creative_id for creative_id in ids if creative_id not in used]
+            if unused:
+                result = await ad_creatives_collection.delete_many({"_id": {"$in": unused}})
+                deleted += result.deleted_count
+
+        local_ids = await run_in_threadpool(self._disk_ids)
+        with self._lock:
+            local_ids = set(local_ids) | set(self._memory)
+        stored = set()
+        local_ids = list(local_ids)
+        for start in range(0, len(local_ids), batch_size):
+            ids = local_ids[start:start + batch_size]
+            stored.update(await ad_creatives_collection.distinct("_id", {"_id": {"$in": ids}}))
+        gone = [creative_id for creative_id in local_ids if creative_id not in stored]
+        with self._lock:
+            for creative_id in gone:
+                self._memory.pop(creative_id, None)
+        await run_in_threadpool(self._remove_disk, gone)
+        return {"deleted": deleted, "removed_local": len(gone)}
+
+    def record_fallback(self):
+        """Count a render that had to use the ad's original image instead of a creative."""
+        with self._lock:
+            self.fallbacks += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "hits": self.hits,
+                "loads": self.loads,
+                "missing": self.missing,
+                "fallbacks": self.fallbacks,
+            }
+
+
+ad_creative_store = AdCreativeStore()
+
+
+async def ingest_creative(image_url):
+    """Fetch, process and store an ad's creative; returns the ad's "ad_creative" field.
+
+    Called at onboarding, so a URL that can't be fetched or isn't an image is
+    reported to the client rather than discovered at render time.
+    """
+    try:
+        source_bytes = await ad_image_fetcher.download(image_url, AD_CREATIVE_MAX_SOURCE_BYTES)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Could not fetch ad image: {e}")
+    try:
+        data, info = await run_in_threadpool(process_creative, source_bytes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Could not process ad image: {e}")
+    await ad_creative_store.save(data, info, image_url)
+    return info
+
+
+async def load_ad_image(ad):
+    """Bytes of the image to embed for an ad, or None if there isn't one.
+
+    Ads onboarded before creatives were processed still have their original
+    fetched (and cached) by ad_image_fetcher.
+    """
+    if not ad.get("ad_image_url"):
+        return None
+    creative = ad.get("ad_creative")
+    if creative:
+        with observe_stage("image_fetch"):
+            data = await ad_creative_store.get(creative["id"])
+        if data is not None:
+            return data
+    ad_creative_store.record_fallback()
+    return await ad_image_fetcher.fetch(ad.get("ad_image_url"))
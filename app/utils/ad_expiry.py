@@ -0,0 +1,41 @@
+import os
+from datetime import datetime
+
+from app.db import db
+from app.utils.ad_index import ad_index
+from app.utils.metrics import EXPIRED_ADS_DELETED
+
+# Expired ads are deleted by the TTL index on expires_at (see app.indexes), but Mongo's
+# TTL monitor only wakes up once a minute, falls behind under load and is absent when
+# indexes are managed elsewhere. The sweep deletes them on our own schedule too, and
+# drops them from the in-memory ad index.
+
+# Seconds between sweeps; 0 disables the sweep
+AD_EXPIRY_SWEEP_SECONDS = float(os.getenv("AD_EXPIRY_SWEEP_SECONDS", 60))
+
+# Ads deleted per delete_many, so a large backlog never turns into one long write
+AD_EXPIRY_SWEEP_BATCH_SIZE = int(os.getenv("AD_EXPIRY_SWEEP_BATCH_SIZE", 500))
+
+# Batches per sweep; whatever is left waits for the next sweep
+AD_EXPIRY_SWEEP_MAX_BATCHES = int(os.getenv("AD_EXPIRY_SWEEP_MAX_BATCHES", 20))
+
+
+async def sweep_expired_ads(batch_size=AD_EXPIRY_SWEEP_BATCH_SIZE, max_batches=AD_EXPIRY_SWEEP_MAX_BATCHES):
+    """Delete ads whose expires_at has passed, in batches; returns {"deleted", "batches"}."""
+    now = datetime.utcnow()
+    expired = {"expires_at": {"$lte": now}}
+    deleted = batches = 0
+    while batches < max_batches:
+        ids = [ad["_id"] async for ad in db.ads.find(expired, {"_id": 1}).limit(batch_size)]
+        if not ids:
+            break
+        # Re-check expires_at in case an ad was extended since it was found
+        result = await db.ads.delete_many({"_id": {"$in": ids}, **expired})
+        for ad_id in ids:
+            ad_index.remove(ad_id)
+        deleted += result.deleted_count
+        batches += 1
+        EXPIRED_ADS_DELETED.inc(result.deleted_count)
+        if len(ids) < batch_size:
+            break
+    return {"deleted": deleted, "batches": batches}
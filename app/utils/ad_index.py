@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import heapq
+import os
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app.db import db
+from app.utils.impressions import impression_buffer
+
+ROTATION_PERIOD_SECONDS = 300
+
+# How often the index picks up ads added or served by other workers
+AD_INDEX_RESYNC_SECONDS = int(os.getenv("AD_INDEX_RESYNC_SECONDS", 60))
+
+# How often the index is reloaded in full instead; refreshes miss bid_price changes
+# and deleted ads, so this bounds how long those go unnoticed
+AD_INDEX_FULL_RESYNC_SECONDS = int(os.getenv("AD_INDEX_FULL_RESYNC_SECONDS", 600))
+
+# A refresh looks this far behind the previous one, for ObjectId timestamps' one-second
+# resolution and clock skew between workers; re-reading an ad is harmless
+REFRESH_OVERLAP_SECONDS = 5
+
+# Only the fields needed to rank ads are kept in memory
+AD_INDEX_PROJECTION = {"bid_price": 1, "last_served": 1, "expires_at": 1}
+
+
+def not_expired(now):
+    return {"$or": [{"expires_at": None}, {"expires_at": {"$gt": now}}]}
+
+
+class AdIndex:
+    """In-memory priority index of ads, ordered by bid (desc) then last_served (asc).
+
+    Ads are split between a "ready" heap (out of cooldown) and a "cooling" heap keyed
+    by when their rotation period ends, so picking the next ad is O(log n). Heap
+    entries are invalidated lazily via a per-ad generation number. The chosen ad is
+    claimed with an atomic find-and-modify, so concurrent requests (or workers) can't
+    both serve the same rotated ad; its impression is counted via impression_buffer.
+
+    The index is loaded in full every full_resync_seconds, and in between refreshed
+    with just the ads created or served since the last refresh. Expired ads drop out
+    lazily and deleted ones when a claim misses them (or at the next full load).
+    Only one load or refresh runs at a time; callers arriving meanwhile wait for it
+    instead of starting their own.
+    """
+
+    def __init__(self, rotation_seconds=ROTATION_PERIOD_SECONDS, resync_seconds=AD_INDEX_RESYNC_SECONDS,
+                 full_resync_seconds=AD_INDEX_FULL_RESYNC_SECONDS):
+        self.rotation = timedelta(seconds=rotation_seconds)
+        self.resync_seconds = resync_seconds
+        self.full_resync_seconds = full_resync_seconds
+        self._ads = {}  # ad id -> state dict
+        self._ready = []  # (-bid, last_served_ts, id, generation)
+        self._cooling = []  # (available_at_ts, id, generation)
+        self._by_bid = []  # every live ad, used when all ads are cooling down
+        self._generation = 0
+        self._synced_at = None  # time.monotonic() of the last load or refresh
+        self._loaded_at = None  # time.monotonic() of the last full load
+        self._synced_since = None  # datetime the next refresh reads changes from
+        self._syncing = None  # the load or refresh in progress, shared by callers
+
+    # -- maintenance --
+
+    def upsert(self, ad):
+        """Add or refresh an ad from a Mongo document (only the ranking fields are used)."""
+        self._generation += 1
+        ad_id = ad["_id"]
+        state = {
+            "bid": float(ad.get("bid_price") or 0),
+            "last_served": ad.get("last_served"),
+            "expires_at": ad.get("expires_at"),
+            "generation": self._generation,
+        }
+        self._ads[ad_id] = state
+        rank = (-state["bid"], self._served_ts(state), str(ad_id), ad_id, state["generation"])
+        heapq.heappush(self._by_bid, rank)
+        available_at = self._available_at(state)
+        if available_at is None:
+            heapq.heappush(self._ready, rank)
+        else:
+            heapq.heappush(self._cooling, (available_at, str(ad_id), ad_id, state["generation"]))
+
+    def remove(self, ad_id):
+        # Heap entries are dropped lazily once their generation no longer matches
+        self._ads.pop(ad_id, None)
+
+    async def _single_flight(self, sync):
+        if self._syncing is None:
+            self._syncing = asyncio.ensure_future(sync())
+            self._syncing.add_done_callback(lambda _: setattr(self, "_syncing", None))
+        # A caller giving up must not cancel the sync the others are waiting on
+        await asyncio.shield(self._syncing)
+
+    async def _load(self):
+        started = datetime.utcnow()
+        ads = await db.ads.find(not_expired(started), AD_INDEX_PROJECTION).to_list(None)
+        # Build the new heaps aside and swap them in at once, so claims never see a half-filled index
+        fresh = AdIndex(self.rotation.total_seconds(), self.resync_seconds, self.full_resync_seconds)
+        fresh._generation = self._generation
+        for ad in ads:
+            fresh.upsert(ad)
+        self._ads, self._ready, self._cooling, self._by_bid = fresh._ads, fresh._ready, fresh._cooling, fresh._by_bid
+        self._generation = fresh._generation
+        self._synced_since = started
+        self._synced_at = self._loaded_at = time.monotonic()
+
+    async def _refresh(self):
+        started = datetime.utcnow()
+        since = self._synced_since - timedelta(seconds=REFRESH_OVERLAP_SECONDS)
+        ads = await db.ads.find(
+            {"$and": [
+                not_expired(started),
+                {"$or": [{"_id": {"$gte": ObjectId.from_datetime(since)}}, {"last_served": {"$gte": since}}]},
+            ]},
+            AD_INDEX_PROJECTION,
+        ).to_list(None)
+        for ad in ads:
+            self.upsert(ad)
+        self._synced_since = started
+        self._synced_at = time.monotonic()
+
+    async def resync(self):
+        """Reload every live ad from Mongo (e.g. before fingerprinting the live-ad set)."""
+        await self._single_flight(self._load)
+
+    async def refresh(self):
+        """Load the index if it never was or a full load is due, otherwise pick up ads created or served since."""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.full_resync_seconds:
+            await self._single_flight(self._load)
+        else:
+            await self._single_flight(self._refresh)
+
+    def fingerprint(self):
+        """Short hash of the set of live ads; changes whenever an ad is added, removed or expires."""
+        now = datetime.utcnow()
+        live = sorted(
+            str(ad_id) for ad_id, state in self._ads.items()
+            if state["expires_at"] is None or state["expires_at"] > now
+        )
+        return hashlib.sha1(",".join(live).encode("utf-8")).hexdigest()[:16]
+
+    def _served_ts(self, state):
+        # Never-served ads sort first, like nulls in an ascending Mongo sort
+        last_served = state["last_served"]
+        return last_served.timestamp() if last_served else float("-inf")
+
+    def _available_at(self, state):
+        last_served = state["last_served"]
+        if last_served is None:
+            return None
+        return (last_served + self.rotation).timestamp()
+
+    def _live(self, ad_id, generation, now):
+        state = self._ads.get(ad_id)
+        if state is None or state["generation"] != generation:
+            return False
+        if state["expires_at"] is not None and state["expires_at"] <= now:
+            self.remove(ad_id)
+            return False
+        return True
+
+    def _top(self, heap, now):
+        while heap and not self._live(heap[0][3], heap[0][4], now):
+            heapq.heappop(heap)
+        return heap[0][3] if heap else None
+
+    def _promote_cooled(self, now):
+        now_ts = now.timestamp()
+        while self._cooling and self._cooling[0][0] <= now_ts:
+            _, _, ad_id, generation = heapq.heappop(self._cooling)
+            state = self._ads.get(ad_id)
+            if state is not None and state["generation"] == generation:
+                heapq.heappush(self._ready, (-state["bid"], self._served_ts(state), str(ad_id), ad_id, generation))
+
+    # -- selection --
+
+    async def claim_next(self):
+        """Atomically claim the next ad to serve, or return None if there are no live ads."""
+        if self._synced_at is None or time.monotonic() - self._synced_at >= self.resync_seconds:
+            await self.refresh()
+
+        # A lost race moves the ad out of _ready (or out of the index), so this ends
+        # once a claim succeeds or no ad is ready any more
+        tried = set()
+        while True:
+            now = datetime.utcnow()
+            self._promote_cooled(now)
+            ad_id = self._top(self._ready, now)
+            if ad_id is None:
+                break
+            if ad_id in tried:
+                # Lost the race for it already and it still looks ready; let the others go first
+                heapq.heappop(self._ready)
+                continue
+            tried.add(ad_id)
+            ad = await db.ads.find_one_and_update(
+                {
+                    "_id": ad_id,
+                    "$and": [
+                        not_expired(now),
+                        {"$or": [{"last_served": None}, {"last_served": {"$lte": now - self.rotation}}]},
+                    ],
+                },
+                {"$set": {"last_served": now}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if ad is not None:
+                self.upsert(ad)
+                impression_buffer.record(ad_id)
+                return ad
+            # Someone else served (or removed) it first; refresh our copy and try the next one
+            current = await db.ads.find_one({"_id": ad_id, **not_expired(now)}, AD_INDEX_PROJECTION)
+            if current is None:
+                self.remove(ad_id)
+            else:
+                self.upsert(current)
+
+        # Every ad is cooling down, so fall back to the highest bid regardless of last_served
+        while True:
+            now = datetime.utcnow()
+            ad_id = self._top(self._by_bid, now)
+            if ad_id is None:
+                return None
+            ad = await db.ads.find_one_and_update(
+                {"_id": ad_id, **not_expired(now)},
+                {"$set": {"last_served": now}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if ad is not None:
+                self.upsert(ad)
+                impression_buffer.record(ad_id)
+                return ad
+            self.remove(ad_id)
+
+
+ad_index = AdIndex()
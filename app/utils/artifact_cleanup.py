@@ -0,0 +1,21 @@
+import os
+
+from app.utils.ad_creatives import ad_creative_store
+from app.utils.image_fetcher import ad_image_fetcher
+from app.utils.menu_render import delete_orphaned_renders
+
+# Published artifacts and caches are only ever added to by renders and onboarding;
+# this removes the ones nothing refers to any more, so the disk and bucket don't
+# grow without bound.
+
+# Seconds between cleanups; 0 disables them
+ARTIFACT_CLEANUP_SECONDS = float(os.getenv("ARTIFACT_CLEANUP_SECONDS", 3600))
+
+
+async def cleanup_artifacts():
+    """Delete artifacts of menus that no longer exist, unused ad creatives and stale ad images."""
+    return {
+        "menus": await delete_orphaned_renders(),
+        "ad_creatives": await ad_creative_store.delete_unused(),
+        "ad_images": await ad_image_fetcher.prune(),
+    }
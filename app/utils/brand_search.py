@@ -0,0 +1,69 @@
+import re
+import unicodedata
+
+from pymongo import UpdateOne
+
+from app.db import db
+
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+
+# Candidates pulled from the index per requested result, before ranking
+CANDIDATE_FACTOR = 5
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse whitespace so lookups are case/accent-insensitive."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.lower().split())
+
+
+def search_keys_for(brand_name):
+    """Every word-aligned suffix of the normalized name.
+
+    "The Pizza Co" -> ["the pizza co", "pizza co", "co"], so an anchored prefix
+    query on this (multikey-indexed) array matches the start of any word.
+    """
+    words = normalize(brand_name).split(" ")
+    return [" ".join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+def _rank(brand, query):
+    name = normalize(brand.get("brand_name"))
+    if name == query:
+        tier = 0
+    elif name.startswith(query):
+        tier = 1
+    else:
+        tier = 2  # matched the start of a later word
+    return (tier, len(name), name)
+
+
+async def search_brands(name, limit=DEFAULT_SEARCH_LIMIT):
+    """Ranked typeahead lookup: exact match, then name prefix, then word prefix."""
+    query = normalize(name)
+    if not query:
+        return []
+    candidates = await db.brands.find(
+        {"search_keys": {"$regex": f"^{re.escape(query)}"}},
+        {"brand_name": 1, "metadata": 1},
+    ).limit(limit * CANDIDATE_FACTOR).to_list(limit * CANDIDATE_FACTOR)
+    candidates.sort(key=lambda brand: _rank(brand, query))
+    return candidates[:limit]
+
+
+async def backfill_search_keys(batch_size=1000):
+    """Add search_keys to brands created before search indexing existed."""
+    updated = 0
+    while True:
+        brands = await db.brands.find(
+            {"search_keys": {"$exists": False}}, {"brand_name": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not brands:
+            return updated
+        await db.brands.bulk_write([
+            UpdateOne({"_id": brand["_id"]}, {"$set": {"search_keys": search_keys_for(brand.get("brand_name", ""))}})
+            for brand in brands
+        ], ordered=False)
+        updated += len(brands)
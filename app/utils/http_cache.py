@@ -0,0 +1,55 @@
+import hashlib
+import os
+import threading
+
+from fastapi import Response
+
+# Cache-Control for generated artifacts. A menu's QR code only encodes its stable
+# download URL, so it can be cached for long; PDFs change with ad rotation and are
+# always revalidated (cheaply, via ETag).
+QR_CACHE_CONTROL = os.getenv("QR_CACHE_CONTROL", "public, max-age=86400")
+PDF_CACHE_CONTROL = os.getenv("PDF_CACHE_CONTROL", "public, no-cache")
+MENUS_CACHE_CONTROL = "private, no-cache"
+
+_file_hashes = {}  # path -> ((mtime_ns, size), etag)
+_file_hashes_lock = threading.Lock()
+
+
+def make_etag(*parts):
+    """Strong ETag from an arbitrary list of values."""
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def file_etag(path):
+    """Strong ETag from a file's contents, rehashed only when its mtime or size change."""
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _file_hashes_lock:
+        cached = _file_hashes.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    etag = f'"{digest.hexdigest()[:32]}"'
+    with _file_hashes_lock:
+        _file_hashes[path] = (signature, etag)
+    return etag
+
+
+def etag_matches(request, etag):
+    """True if the request's If-None-Match header covers etag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so ignore any W/ prefix
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
+
+
+def not_modified(etag, cache_control):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
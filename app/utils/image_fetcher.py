@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from app.utils.metrics import observe_stage
+from app.utils.utils import FILE_DIR
+
+# On-disk copies of ad images, keyed by a hash of their URL
+IMAGE_CACHE_DIR = os.path.join(FILE_DIR, "ad_images")
+
+# Number of images kept in memory
+AD_IMAGE_MEMORY_ENTRIES = int(os.getenv("AD_IMAGE_MEMORY_ENTRIES", 64))
+
+# How long a cached image is trusted before it is revalidated with the origin
+AD_IMAGE_REVALIDATE_SECONDS = int(os.getenv("AD_IMAGE_REVALIDATE_SECONDS", 300))
+
+AD_IMAGE_TIMEOUT_SECONDS = float(os.getenv("AD_IMAGE_TIMEOUT_SECONDS", 5))
+
+# Cached images not fetched or revalidated for this long are removed from disk
+AD_IMAGE_DISK_MAX_AGE_SECONDS = int(os.getenv("AD_IMAGE_DISK_MAX_AGE_SECONDS", 7 * 24 * 3600))
+
+# Images larger than this are not downloaded (the stale copy, if any, is served)
+AD_IMAGE_MAX_BYTES = int(os.getenv("AD_IMAGE_MAX_BYTES", 20 * 1024 * 1024))
+
+os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+
+
+class AdImageFetcher:
+    """Fetches ad images over a pooled async HTTP client with memory and disk caching.
+
+    Cached entries are revalidated with If-None-Match / If-Modified-Since once they
+    are older than AD_IMAGE_REVALIDATE_SECONDS; if the origin is unreachable the
+    stale copy is served instead of failing the render.
+    """
+
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, max_entries=AD_IMAGE_MEMORY_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._memory = OrderedDict()  # url -> entry dict
+        self._client = None
+        self._locks = {}  # url -> [asyncio.Lock, callers], so concurrent renders share one download
+        self.hits = 0
+        self.revalidated = 0
+        self.downloads = 0
+        self.errors = 0
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(AD_IMAGE_TIMEOUT_SECONDS),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                follow_redirects=True,
+            )
+        return self._client
+
+    def _paths(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return (
+            os.path.join(self.cache_dir, f"{digest}.img"),
+            os.path.join(self.cache_dir, f"{digest}.json"),
+        )
+
+    def _remember(self, url, entry):
+        self._memory[url] = entry
+        self._memory.move_to_end(url)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _load_from_disk(self, url):
+        image_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(image_path, "rb") as f:
+                content = f.read()
+        except (OSError, ValueError):
+            return None
+        return {**meta, "content": content}
+
+    def _save_to_disk(self, url, entry, content_changed=True):
+        image_path, meta_path = self._paths(url)
+        if content_changed:
+            with open(f"{image_path}.tmp", "wb") as f:
+                f.write(entry["content"])
+            os.replace(f"{image_path}.tmp", image_path)
+        meta = {k: v for k, v in entry.items() if k != "content"}
+        with open(f"{meta_path}.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    async def fetch(self, url, max_bytes=AD_IMAGE_MAX_BYTES):
+        """Return the image bytes for url, or None if it cannot be obtained."""
+        if not url:
+            return None
+        lock = self._locks.setdefault(url, [asyncio.Lock(), 0])
+        lock[1] += 1
+        try:
+            with observe_stage("image_fetch"):
+                async with lock[0]:
+                    return await self._fetch(url, max_bytes)
+        finally:
+            # Drop the lock once nobody is using it, so _locks doesn't grow with every URL
+            lock[1] -= 1
+            if not lock[1]:
+                self._locks.pop(url, None)
+
+    async def _fetch(self, url, max_bytes):
+        entry = self._memory.get(url)
+        if entry is None:
+            entry = await run_in_threadpool(self._load_from_disk, url)
+
+        if entry and time.time() - entry["validated_at"] < AD_IMAGE_REVALIDATE_SECONDS:
+            self.hits += 1
+            self._remember(url, entry)
+            return entry["content"]
+
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            async with self._get_client().stream("GET", url, headers=headers) as response:
+                content = await _read_body(response, max_bytes) if response.status_code == 200 else None
+        except (httpx.HTTPError, ValueError):
+            self.errors += 1
+            # Serve the stale copy rather than dropping the image from the menu
+            return entry["content"] if entry else None
+
+        if response.status_code == 304 and entry:
+            self.revalidated += 1
+            entry = {**entry, "validated_at": time.time()}
+            await run_in_threadpool(self._save_to_disk, url, entry, False)
+        elif response.status_code == 200:
+            self.downloads += 1
+            entry = {
+                "url": url,
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "validated_at": time.time(),
+                "content": content,
+            }
+            await run_in_threadpool(self._save_to_disk, url, entry)
+        else:
+            self.errors += 1
+            return entry["content"] if entry else None
+
+        self._remember(url, entry)
+        return entry["content"]
+
+    async def download(self, url, max_bytes):
+        """Download url once, bypassing the caches; raises ValueError if it can't be fetched."""
+        try:
+            async with self._get_client().stream("GET", url) as response:
+                if response.status_code != 200:
+                    raise ValueError(f"{url} returned HTTP {response.status_code}")
+                return await _read_body(response, max_bytes)
+        except httpx.HTTPError as e:
+            raise ValueError(f"{url}: {e}")
+
+    def _prune_disk(self, max_age_seconds):
+        # The metadata file is rewritten on every download and revalidation
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.cache_dir, name)
+            try:
+                if os.path.getmtime(meta_path) >= cutoff:
+                    continue
+                os.remove(meta_path)
+                os.remove(f"{meta_path[:-len('.json')]}.img")
+            except FileNotFoundError:
+                pass
+            removed += 1
+        return removed
+
+    async def prune(self, max_age_seconds=AD_IMAGE_DISK_MAX_AGE_SECONDS):
+        """Remove disk copies of images that haven't been used for max_age_seconds; returns how many."""
+        return await run_in_threadpool(self._prune_disk, max_age_seconds)
+
+    def stats(self):
+        return {
+            "memory_entries": len(self._memory),
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "downloads": self.downloads,
+            "errors": self.errors,
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+async def _read_body(response, max_bytes):
+    """Read a streamed response body, raising ValueError once it exceeds max_bytes."""
+    chunks = []
+    size = 0
+    async for chunk in response.aiter_bytes():
+        size += len(chunk)
+        if size > max_bytes:
+            raise ValueError(f"{response.url} is larger than {max_bytes} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+ad_image_fetcher = AdImageFetcher()
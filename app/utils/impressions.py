@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import os
+import time
+
+from pymongo import UpdateOne
+
+from app.db import db
+from app.utils.metrics import (
+    IMPRESSION_BACKLOG, IMPRESSION_FLUSH_DURATION_SECONDS, IMPRESSION_FLUSH_FAILURES, IMPRESSIONS_FLUSHED,
+)
+
+logger = logging.getLogger(__name__)
+
+# Flush once this many impressions are waiting...
+IMPRESSION_FLUSH_SIZE = int(os.getenv("IMPRESSION_FLUSH_SIZE", 500))
+
+# ...or at least this often
+IMPRESSION_FLUSH_SECONDS = float(os.getenv("IMPRESSION_FLUSH_SECONDS", 5))
+
+
+class ImpressionBuffer:
+    """Accumulates ad impressions in memory and writes them as one bulk_write per flush."""
+
+    def __init__(self, flush_size=IMPRESSION_FLUSH_SIZE, flush_seconds=IMPRESSION_FLUSH_SECONDS):
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._counts = {}  # ad id -> impressions not yet written
+        self._pending = 0
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._flush_task = None  # size-triggered flush, kept so it isn't garbage-collected mid-write
+        self.flushes = 0
+        self.flushed_impressions = 0
+        self.failed_flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def record(self, ad_id, count=1):
+        self._counts[ad_id] = self._counts.get(ad_id, 0) + count
+        self._pending += count
+        if self._pending >= self.flush_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_logged())
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._counts:
+                return 0
+            counts, self._counts, self._pending = self._counts, {}, 0
+
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                await db.ads.bulk_write(
+                    [UpdateOne({"_id": ad_id}, {"$inc": {"impression_count": n}}) for ad_id, n in counts.items()],
+                    ordered=False,
+                )
+                outcome = "ok"
+            except Exception:
+                self.failed_flushes += 1
+                IMPRESSION_FLUSH_FAILURES.inc()
+                # Put the impressions back so the next flush retries them
+                for ad_id, n in counts.items():
+                    self._counts[ad_id] = self._counts.get(ad_id, 0) + n
+                    self._pending += n
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                IMPRESSION_FLUSH_DURATION_SECONDS.labels(outcome=outcome).observe(elapsed)
+                self.last_flush_seconds = elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+                self.total_flush_seconds += elapsed
+
+            self.flushes += 1
+            flushed = sum(counts.values())
+            self.flushed_impressions += flushed
+            IMPRESSIONS_FLUSHED.inc(flushed)
+            return flushed
+
+    async def _flush_logged(self):
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Impression flush failed")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self._flush_logged()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the periodic flusher and write out whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flush_task is not None:
+            # Let a size-triggered flush finish; cancelling it mid-write would drop its impressions
+            await self._flush_task
+            self._flush_task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "backlog_impressions": self._pending,
+            "backlog_ads": len(self._counts),
+            "flushes": self.flushes,
+            "flushed_impressions": self.flushed_impressions,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+            "avg_flush_seconds": self.total_flush_seconds / (self.flushes + self.failed_flushes or 1),
+        }
+
+
+impression_buffer = ImpressionBuffer()
+# Read when /metrics is scraped
+IMPRESSION_BACKLOG.set_function(lambda: impression_buffer._pending)
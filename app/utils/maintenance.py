@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+
+from app.utils.ad_expiry import AD_EXPIRY_SWEEP_SECONDS, sweep_expired_ads
+from app.utils.artifact_cleanup import ARTIFACT_CLEANUP_SECONDS, cleanup_artifacts
+from app.utils.metrics import MAINTENANCE_TASK_SECONDS
+from app.utils.render_jobs import RENDER_JOB_LEASE_SECONDS, fail_abandoned_jobs
+
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceScheduler:
+    """Runs periodic housekeeping coroutines in the background of each API process.
+
+    Each task runs once at startup and then every interval_seconds; a run that fails
+    is logged and retried at the next interval. Runs of the same task never overlap.
+    """
+
+    def __init__(self):
+        self._tasks = {}  # name -> {"interval", "func", runs and timings}
+        self._running = []
+
+    def add(self, name, interval_seconds, func):
+        """Schedule func (an async function taking no arguments); an interval of 0 disables it."""
+        if interval_seconds <= 0:
+            return
+        self._tasks[name] = {
+            "interval": interval_seconds,
+            "func": func,
+            "runs": 0,
+            "failures": 0,
+            "last_seconds": None,
+            "last_result": None,
+            "last_error": None,
+        }
+
+    async def run(self, name):
+        """Run a task now and record how it went; returns its result."""
+        task = self._tasks[name]
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await task["func"]()
+            outcome = "ok"
+        except Exception as e:
+            task["failures"] += 1
+            task["last_error"] = str(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            MAINTENANCE_TASK_SECONDS.labels(task=name, outcome=outcome).observe(elapsed)
+            task["runs"] += 1
+            task["last_seconds"] = elapsed
+        task["last_result"] = result
+        task["last_error"] = None
+        return result
+
+    async def _loop(self, name):
+        while True:
+            try:
+                await self.run(name)
+            except Exception:
+                logger.exception("Maintenance task %s failed", name)
+            await asyncio.sleep(self._tasks[name]["interval"])
+
+    def start(self):
+        if not self._running:
+            loop = asyncio.get_running_loop()
+            self._running = [loop.create_task(self._loop(name)) for name in self._tasks]
+
+    async def stop(self):
+        for task in self._running:
+            task.cancel()
+        for task in self._running:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._running = []
+
+    def stats(self):
+        return {
+            name: {key: value for key, value in task.items() if key != "func"}
+            for name, task in self._tasks.items()
+        }
+
+
+maintenance_scheduler = MaintenanceScheduler()
+maintenance_scheduler.add("ad_expiry_sweep", AD_EXPIRY_SWEEP_SECONDS, sweep_expired_ads)
+maintenance_scheduler.add("artifact_cleanup", ARTIFACT_CLEANUP_SECONDS, cleanup_artifacts)
+maintenance_scheduler.add("abandoned_render_jobs", RENDER_JOB_LEASE_SECONDS, fail_abandoned_jobs)
@@ -0,0 +1,114 @@
+import csv
+import io
+from itertools import islice
+from zipfile import BadZipFile
+
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from pydantic import ValidationError
+
+from app.models import Dish
+
+# Rows validated and written per batch
+IMPORT_CHUNK_SIZE = 500
+
+# Accepted spellings for each column, compared case-insensitively
+COLUMN_ALIASES = {
+    "category": ("category", "category_name"),
+    "name": ("name", "dish", "dish_name"),
+    "price": ("price",),
+}
+
+
+def _normalize_header(header):
+    columns = {}
+    for position, title in enumerate(header):
+        title = str(title or "").strip().lower()
+        for column, aliases in COLUMN_ALIASES.items():
+            if title in aliases and column not in columns:
+                columns[column] = position
+    missing = [column for column in COLUMN_ALIASES if column not in columns]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+    return columns
+
+
+def _iter_csv(file):
+    reader = csv.reader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    header = next(reader, None)
+    if header is None:
+        raise ValueError("File is empty")
+    columns = _normalize_header(header)
+    for row in reader:
+        if any(cell.strip() for cell in row):
+            yield {column: (row[position] if position < len(row) else None) for column, position in columns.items()}
+        else:
+            yield None
+
+
+def _iter_xlsx(file):
+    # read_only mode streams rows instead of loading the whole sheet
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except (BadZipFile, InvalidFileException, KeyError) as e:
+        # KeyError: a zip archive that isn't a workbook
+        raise ValueError("Not a valid .xlsx file") from e
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ValueError("File is empty")
+        columns = _normalize_header(header)
+        for row in rows:
+            if any(cell not in (None, "") for cell in row):
+                yield {column: (row[position] if position < len(row) else None) for column, position in columns.items()}
+            else:
+                yield None
+    finally:
+        workbook.close()
+
+
+def iter_rows(file, filename):
+    """Yield (row_number, raw_row) pairs from an uploaded CSV or XLSX file, skipping blank rows."""
+    if filename.lower().endswith(".xlsx"):
+        rows = _iter_xlsx(file)
+    elif filename.lower().endswith(".csv"):
+        rows = _iter_csv(file)
+    else:
+        raise ValueError("Unsupported file type, expected .csv or .xlsx")
+    # Row 1 is the header
+    for row_number, row in enumerate(rows, start=2):
+        if row is not None:
+            yield row_number, row
+
+
+def next_chunk(rows, size=IMPORT_CHUNK_SIZE):
+    return list(islice(rows, size))
+
+
+def validate_chunk(chunk):
+    """Validate raw rows against the Dish model.
+
+    Returns ({category_name: [dish, ...]}, [row error, ...]) with categories in
+    first-seen order.
+    """
+    dishes_by_category = {}
+    errors = []
+    for row_number, row in chunk:
+        category_name = str(row.get("category") or "").strip()
+        if not category_name:
+            errors.append({"row": row_number, "errors": ["category: field required"]})
+            continue
+        try:
+            dish = Dish(name=str(row.get("name") or "").strip(), price=row.get("price"))
+        except ValidationError as e:
+            errors.append({
+                "row": row_number,
+                "errors": [f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()],
+            })
+            continue
+        if not dish.name:
+            errors.append({"row": row_number, "errors": ["name: field required"]})
+            continue
+        dishes_by_category.setdefault(category_name, []).append(dish.dict())
+    return dishes_by_category, errors
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import threading
+from datetime import datetime
+
+from bson import ObjectId
+from starlette.concurrency import run_in_threadpool
+
+from app.db import db
+from app.utils.ad_index import ad_index
+from app.utils.utils import get_next_ad, DEFAULT_WELCOME_TEXT, PDF_LAYOUT_VERSION
+from app.utils.pdf_layouts import menu_layout
+from app.utils.pdf_assembly import menu_pdf_assembler
+from app.utils.render_cache import render_cache, render_key
+from app.utils.storage import artifact_store
+from app.utils.menu_store import get_menu, menus_collection
+from app.utils.qr_codes import qr_code_cache
+
+# What each menu's published artifacts were rendered from, keyed by menu id, so
+# stale renders can be found without opening the files (see app.rerender)
+menu_renders_collection = db["menu_renders"]
+
+
+def _write_file(path, data):
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def pdf_artifact_name(menu_id):
+    return f"menu_{menu_id}.pdf"
+
+
+def qr_artifact_name(menu_id):
+    return f"qr_{menu_id}.png"
+
+
+async def record_render(restaurant_id, menu, ad, qr_payload):
+    await menu_renders_collection.update_one(
+        {"_id": menu["id"]},
+        {"$set": {
+            "restaurant_id": ObjectId(restaurant_id),
+            "menu_version": menu.get("version", 0),
+            "layout_version": PDF_LAYOUT_VERSION,
+            "layout": menu_layout(menu),
+            "ads_fingerprint": ad_index.fingerprint(),
+            "ad_id": ad.get("_id"),
+            # download_qr needs it to render other QR formats and sizes
+            "qr_payload": qr_payload,
+            "rendered_at": datetime.utcnow(),
+        }},
+        upsert=True,
+    )
+
+
+async def delete_orphaned_renders(batch_size=500):
+    """Delete the published artifacts and render record of menus that no longer exist.
+
+    Returns how many menus were cleaned up.
+    """
+    deleted = 0
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        renders = await menu_renders_collection.find(query, {"qr_payload": 1}).sort("_id", 1).limit(batch_size).to_list(None)
+        if not renders:
+            break
+        last_id = renders[-1]["_id"]
+        ids = [render["_id"] for render in renders]
+        # Menus live in the menus collection (pending ones included) or embedded in their restaurant
+        existing = set(await menus_collection.distinct("_id", {"_id": {"$in": ids}}))
+        async for restaurant in db.restaurants.find({"menus.id": {"$in": ids}}, {"menus.id": 1}):
+            existing.update(menu.get("id") for menu in restaurant.get("menus", []))
+        for render in renders:
+            menu_id = render["_id"]
+            if menu_id in existing:
+                continue
+            await asyncio.gather(
+                artifact_store.delete(pdf_artifact_name(menu_id)),
+                artifact_store.delete(qr_artifact_name(menu_id)),
+            )
+            if render.get("qr_payload"):
+                await qr_code_cache.delete(render["qr_payload"])
+            await menu_renders_collection.delete_one({"_id": menu_id})
+            deleted += 1
+        if len(renders) < batch_size:
+            break
+    return deleted
+
+
+async def render_menu_qr(restaurant_id, menu_id, base_url):
+    """Render a menu's PDF (with the next ad) and its QR code, and publish both.
+
+    Shared by the synchronous generate_qr endpoint and the render job workers.
+    Returns the URLs the artifacts are served from.
+    """
+    menu = await get_menu(restaurant_id, menu_id)
+
+    # Fetch the next ad to insert
+    ad = await get_next_ad()
+
+    welcome_text = menu.get("welcome_text") or DEFAULT_WELCOME_TEXT
+    layout = menu_layout(menu)
+
+    # URL where the PDF will be served
+    pdf_url = f"{base_url}/menus/{menu_id}/download_pdf"
+
+    # Reuse a previous render if the menu, welcome text, ad and layout are unchanged
+    key = render_key(menu, welcome_text, ad, layout)
+    cached_pdf_path = await render_cache.lookup(key)
+    if cached_pdf_path is None:
+        # A new ad for an unchanged menu is only spliced into its cached body
+        pdf_bytes, complete = await menu_pdf_assembler.assemble(menu, ad, welcome_text, layout)
+        if not complete:
+            # Rendered without the ad's image: publish it, but never serve it as a hit for this ad
+            key = f"{key}-no-image"
+        cached_pdf_path = render_cache.path(key)
+        await run_in_threadpool(_write_file, cached_pdf_path, pdf_bytes)
+        await render_cache.store(key)
+
+    # The QR code only encodes pdf_url, so after the first render it is a cache hit
+    qr_path = await qr_code_cache.get(pdf_url)
+
+    # Publish the artifacts where the download endpoints look for them (both uploads at once)
+    await asyncio.gather(
+        artifact_store.put_file(pdf_artifact_name(menu_id), cached_pdf_path, "application/pdf"),
+        artifact_store.put_file(qr_artifact_name(menu_id), qr_path, "image/png"),
+    )
+    await record_render(restaurant_id, menu, ad, pdf_url)
+
+    return {
+        "pdf_url": pdf_url,
+        "qr_code_url": f"{base_url}/menus/{menu_id}/download_qr",
+    }
@@ -0,0 +1,347 @@
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import HTTPException
+from app.db import db
+
+# Menus live in their own "menus" collection, keyed by menu id (as _id) with a
+# restaurant_id reference. Restaurants created before the split still embed theirs
+# in restaurants.menus until app.migrations.split_menus moves them, so every
+# function here looks in the menus collection first and falls back to the
+# embedded copy.
+#
+# Menus carry a "version" counter that every edit increments. Callers may pass the
+# version they last read as expected_version; the edit is then only applied if nobody
+# else changed the menu in between, otherwise a 409 is returned.
+#
+# Updates and conditions are written relative to the menu ("categories.$[c].dishes"),
+# and translated to "menus.$[m]..." for embedded menus.
+
+menus_collection = db["menus"]
+
+
+def _version_condition(expected_version):
+    # Menus created before versioning have no field, which counts as version 0
+    if expected_version == 0:
+        return {"$in": [0, None]}
+    return expected_version
+
+
+def as_menu(doc):
+    """Shape a menus-collection document like an embedded menu."""
+    menu = {k: v for k, v in doc.items() if k not in ("_id", "restaurant_id", "pending")}
+    return {"id": doc["_id"], **menu}
+
+
+# -- reads --
+#
+# Every read fetches only the menu it needs (never the whole restaurant); the bytes
+# pulled from Mongo per request are counted by read_metrics.
+
+def _collection_projection(fields):
+    return {field: 1 for field in fields} if fields else None
+
+
+async def _embedded_menu(restaurant_query, menu_id, fields=None):
+    """Return (restaurant_found, menu) for an embedded menu, projecting just `fields` of it."""
+    if not fields:
+        restaurant = await db.restaurants.find_one(
+            restaurant_query, {"menus": {"$elemMatch": {"id": menu_id}}}
+        )
+        if not restaurant:
+            return False, None
+        return True, (restaurant.get("menus") or [None])[0]
+
+    # $elemMatch projection can't narrow fields inside the element, so filter server-side
+    pipeline = [
+        {"$match": restaurant_query},
+        {"$project": {"_id": 0, "menu": {"$arrayElemAt": [
+            {"$filter": {"input": {"$ifNull": ["$menus", []]}, "as": "m", "cond": {"$eq": ["$$m.id", menu_id]}}}, 0,
+        ]}}},
+        {"$project": {"menu.id": 1, **{f"menu.{field}": 1 for field in fields}}},
+    ]
+    results = await db.restaurants.aggregate(pipeline).to_list(1)
+    if not results:
+        return False, None
+    return True, results[0].get("menu") or None
+
+
+async def get_menu(restaurant_id: str, menu_id: str, fields: Optional[list[str]] = None) -> dict:
+    """Return a single menu of a restaurant, raising 404 if either is missing.
+
+    Pass `fields` (e.g. ["categories.name"]) to read only part of the menu.
+    """
+    doc = await menus_collection.find_one(
+        {"_id": menu_id, "restaurant_id": ObjectId(restaurant_id), "pending": {"$ne": True}},
+        _collection_projection(fields),
+    )
+    if doc:
+        return as_menu(doc)
+    found, menu = await _embedded_menu({"_id": ObjectId(restaurant_id)}, menu_id, fields)
+    if not found:
+        raise HTTPException(status_code=404, detail="Restaurant not found")
+    if menu:
+        return menu
+    # A menu caught mid-migration is only in the collection, still flagged pending
+    doc = await menus_collection.find_one(
+        {"_id": menu_id, "restaurant_id": ObjectId(restaurant_id)}, _collection_projection(fields)
+    )
+    if doc:
+        return as_menu(doc)
+    raise HTTPException(status_code=404, detail="Menu not found")
+
+
+async def first_category_positions(restaurant_id: str, menu_id: str) -> dict:
+    """{category name: index of the first category with that name}, without reading any dishes."""
+    menu = await get_menu(restaurant_id, menu_id, fields=["categories.name"])
+    positions = {}
+    for index, category in enumerate(menu.get("categories", [])):
+        if "name" in category:
+            positions.setdefault(category["name"], index)
+    return positions
+
+
+async def find_menu_by_id(menu_id: str) -> Optional[dict]:
+    """Return a menu by id alone (for routes that don't know the restaurant), or None."""
+    doc = await menus_collection.find_one({"_id": menu_id, "pending": {"$ne": True}})
+    if doc:
+        return as_menu(doc)
+    _, menu = await _embedded_menu({"menus.id": menu_id}, menu_id)
+    if menu:
+        return menu
+    doc = await menus_collection.find_one({"_id": menu_id})
+    return as_menu(doc) if doc else None
+
+
+def _merge(embedded, docs):
+    menus = list(embedded or [])
+    embedded_ids = {menu.get("id") for menu in menus}
+    # Skip pending copies whose embedded original is still authoritative
+    menus.extend(as_menu(doc) for doc in docs if doc["_id"] not in embedded_ids)
+    return menus
+
+
+async def list_menus(restaurant_id: str, projection: Optional[list[str]] = None) -> Optional[list[dict]]:
+    """All menus of a restaurant, or None if the restaurant doesn't exist."""
+    embedded_projection = {f"menus.{field}": 1 for field in projection} if projection else {"menus": 1}
+    restaurant = await db.restaurants.find_one({"_id": ObjectId(restaurant_id)}, embedded_projection)
+    if not restaurant:
+        return None
+    docs = await menus_collection.find(
+        {"restaurant_id": ObjectId(restaurant_id)}, _collection_projection(projection),
+    ).to_list(None)
+    return _merge(restaurant.get("menus"), docs)
+
+
+async def attach_menus(restaurants: list[dict], fields: Optional[list[str]] = None) -> list[dict]:
+    """Add collection-stored menus to a batch of restaurant documents with one query.
+
+    Pass `fields` to read only those fields of each menu, as get_menu does.
+    """
+    if not restaurants:
+        return restaurants
+    projection = {"restaurant_id": 1, "pending": 1, **_collection_projection(fields)} if fields else None
+    docs = await menus_collection.find(
+        {"restaurant_id": {"$in": [r["_id"] for r in restaurants]}}, projection
+    ).to_list(None)
+    by_restaurant = {}
+    for doc in docs:
+        by_restaurant.setdefault(doc["restaurant_id"], []).append(doc)
+    for restaurant in restaurants:
+        restaurant["menus"] = _merge(restaurant.get("menus"), by_restaurant.get(restaurant["_id"], []))
+    return restaurants
+
+
+# -- writes --
+
+async def insert_menu(restaurant_id, menu):
+    """Store a new menu (a dict with an "id") for an existing restaurant."""
+    if not await db.restaurants.find_one({"_id": ObjectId(restaurant_id)}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Restaurant not found")
+    fields = {k: v for k, v in menu.items() if k != "id"}
+    await menus_collection.insert_one({"_id": menu["id"], "restaurant_id": ObjectId(restaurant_id), **fields})
+
+
+def _embedded_update(update):
+    return {
+        op: {f"menus.$[m].{path}": value for path, value in fields.items()}
+        for op, fields in update.items()
+    }
+
+
+def _collection_query(restaurant_id, menu_id, expected_version, menu_conditions, include_pending=False):
+    query = {"_id": menu_id, "restaurant_id": ObjectId(restaurant_id), **menu_conditions}
+    if not include_pending:
+        query["pending"] = {"$ne": True}
+    if expected_version is not None:
+        query["version"] = _version_condition(expected_version)
+    return query
+
+
+def _embedded_query(restaurant_id, menu_id, expected_version, menu_conditions):
+    elem = {"id": menu_id, **menu_conditions}
+    if expected_version is not None:
+        elem["version"] = _version_condition(expected_version)
+    return {"_id": ObjectId(restaurant_id), "menus": {"$elemMatch": elem}}
+
+
+async def _raise_update_error(restaurant_id, menu_id, expected_version, not_found_detail):
+    # Only reached when an update matched nothing, so work out which part was missing
+    if not await db.restaurants.find_one({"_id": ObjectId(restaurant_id)}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Restaurant not found")
+    try:
+        menu = await get_menu(restaurant_id, menu_id)
+    except HTTPException:
+        raise HTTPException(status_code=404, detail="Menu not found")
+    if expected_version is not None and menu.get("version", 0) != expected_version:
+        raise HTTPException(status_code=409, detail="Menu was modified by another request")
+    raise HTTPException(status_code=404, detail=not_found_detail)
+
+
+async def _apply(restaurant_id, menu_id, expected_version, menu_conditions, not_found_detail,
+                 collection_update, embedded_update, array_filters):
+    conditions = menu_conditions or {}
+    # Collection first, then the embedded copy, then a menu caught mid-migration
+    result = await menus_collection.update_one(
+        _collection_query(restaurant_id, menu_id, expected_version, conditions),
+        collection_update,
+        **({"array_filters": list(array_filters)} if array_filters else {}),
+    )
+    if result.matched_count:
+        return result
+    result = await db.restaurants.update_one(
+        _embedded_query(restaurant_id, menu_id, expected_version, conditions),
+        embedded_update,
+        **({"array_filters": [{"m.id": menu_id}, *array_filters]} if isinstance(embedded_update, dict) else {}),
+    )
+    if result.matched_count:
+        return result
+    result = await menus_collection.update_one(
+        _collection_query(restaurant_id, menu_id, expected_version, conditions, include_pending=True),
+        collection_update,
+        **({"array_filters": list(array_filters)} if array_filters else {}),
+    )
+    if result.matched_count:
+        return result
+    await _raise_update_error(restaurant_id, menu_id, expected_version, not_found_detail)
+
+
+async def update_menu(restaurant_id, menu_id, update, array_filters=(), expected_version=None,
+                      menu_conditions=None, not_found_detail="Menu not found"):
+    """Apply an in-place update to a single menu and bump its version.
+
+    `update` and `menu_conditions` address fields relative to the menu; extra array
+    filters (e.g. "c" for categories) can be passed in array_filters.
+    """
+    update = {**update, "$inc": {**update.get("$inc", {}), "version": 1}}
+    return await _apply(
+        restaurant_id, menu_id, expected_version, menu_conditions, not_found_detail,
+        update, _embedded_update(update), array_filters,
+    )
+
+
+# Times an edit by category name is retried when the categories moved underneath it
+CATEGORY_EDIT_ATTEMPTS = 3
+
+
+def category_guard(indexes):
+    """menu_conditions making sure each {name: index} still points at that category."""
+    return {f"categories.{index}.name": name for name, index in indexes.items()}
+
+
+async def edit_first_categories(restaurant_id, menu_id, names, edit):
+    """Run `await edit({name: index})` against the first category with each of names.
+
+    Category names aren't unique, so edits address a category by position (an
+    update by name would hit every category with it). edit should include
+    category_guard(indexes) in its conditions; if the categories moved between the
+    lookup and the write, the positions are looked up again.
+    """
+    for _ in range(CATEGORY_EDIT_ATTEMPTS):
+        positions = await first_category_positions(restaurant_id, menu_id)
+        if any(name not in positions for name in names):
+            raise HTTPException(status_code=404, detail="Category not found")
+        indexes = {name: positions[name] for name in names}
+        try:
+            return await edit(indexes)
+        except HTTPException as e:
+            if e.status_code != 404:
+                raise
+            # A real 404 (e.g. no such dish) if the categories are where we left them
+            current = await first_category_positions(restaurant_id, menu_id)
+            if all(current.get(name) == index for name, index in indexes.items()):
+                raise
+    raise HTTPException(status_code=409, detail="Menu was modified by another request")
+
+
+def _remove_at(array_expr, index):
+    """Aggregation expression for array_expr without the element at index."""
+    return {
+        "$concatArrays": [
+            {"$slice": [array_expr, index]},
+            {"$slice": [array_expr, index + 1, {"$max": [{"$size": array_expr}, 1]}]},
+        ]
+    }
+
+
+async def rewrite_menu(restaurant_id, menu_id, menu_fields, expected_version=None,
+                       menu_conditions=None, not_found_detail="Menu not found"):
+    """Replace fields of a single menu with aggregation expressions evaluated server-side.
+
+    Used for edits that `$pull` can't express, like removing an array element by
+    position; the whole change is still a single atomic update that only ships the
+    pipeline, not the menu contents. Inside menu_fields the menu is "$$m".
+    """
+    collection_pipeline = [{
+        "$set": {
+            **{field: {"$let": {"vars": {"m": "$$ROOT"}, "in": expr}} for field, expr in menu_fields.items()},
+            "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+        }
+    }]
+    new_version = {"$add": [{"$ifNull": ["$$m.version", 0]}, 1]}
+    embedded_pipeline = [{
+        "$set": {
+            "menus": {
+                "$map": {
+                    "input": "$menus",
+                    "as": "m",
+                    "in": {
+                        "$cond": [
+                            {"$eq": ["$$m.id", menu_id]},
+                            {"$mergeObjects": ["$$m", {**menu_fields, "version": new_version}]},
+                            "$$m",
+                        ]
+                    },
+                }
+            }
+        }
+    }]
+    return await _apply(
+        restaurant_id, menu_id, expected_version, menu_conditions, not_found_detail,
+        collection_pipeline, embedded_pipeline, (),
+    )
+
+
+def remove_category_at(index):
+    return {"categories": _remove_at("$$m.categories", index)}
+
+
+def remove_dish_at(category_index, index):
+    return {
+        "categories": {
+            "$map": {
+                "input": {"$range": [0, {"$size": "$$m.categories"}]},
+                "as": "i",
+                "in": {"$let": {
+                    "vars": {"c": {"$arrayElemAt": ["$$m.categories", "$$i"]}},
+                    "in": {
+                        "$cond": [
+                            {"$eq": ["$$i", category_index]},
+                            {"$mergeObjects": ["$$c", {"dishes": _remove_at("$$c.dishes", index)}]},
+                            "$$c",
+                        ]
+                    },
+                }},
+            }
+        }
+    }
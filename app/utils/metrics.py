@@ -0,0 +1,137 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+
+from app.utils import read_metrics
+
+# Prometheus metrics for the API, Mongo and the QR/PDF pipeline, exported on /metrics.
+# Rendering runs in worker processes, so render timings are measured there and
+# handed back with the result, then recorded here in the API process.
+
+_FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to handle an HTTP request, by route template",
+    ["method", "route", "status"],
+)
+
+MONGO_COMMAND_SECONDS = Histogram(
+    "mongo_command_duration_seconds", "Mongo command round-trip time as seen by the driver",
+    ["collection", "command", "outcome"], buckets=_FAST_BUCKETS,
+)
+
+# Stages of a menu render: image_fetch, pdf_render (menu body), ad_render, pdf_splice,
+# qr_render and render_queue_wait
+RENDER_STAGE_SECONDS = Histogram(
+    "menu_render_stage_seconds", "Time spent in each stage of rendering a menu PDF / QR code",
+    ["stage"], buckets=_FAST_BUCKETS,
+)
+
+RENDERS_IN_FLIGHT = Gauge("menu_renders_in_flight", "Renders submitted to the process pool and not yet finished")
+
+# Background maintenance tasks (app.utils.maintenance), e.g. the ad expiry sweep
+MAINTENANCE_TASK_SECONDS = Histogram(
+    "maintenance_task_duration_seconds", "Time taken by one run of a background maintenance task",
+    ["task", "outcome"], buckets=_FAST_BUCKETS,
+)
+
+EXPIRED_ADS_DELETED = Counter("expired_ads_deleted_total", "Expired ads deleted by the expiry sweep")
+
+# Ad impressions buffered in memory and written in bulk (app.utils.impressions)
+IMPRESSION_FLUSH_DURATION_SECONDS = Histogram(
+    "impression_flush_duration_seconds", "Time taken by one bulk write of buffered ad impressions",
+    ["outcome"], buckets=_FAST_BUCKETS,
+)
+
+IMPRESSIONS_FLUSHED = Counter("impressions_flushed_total", "Ad impressions written to Mongo")
+
+IMPRESSION_FLUSH_FAILURES = Counter("impression_flush_failures_total", "Impression flushes that failed and were retried")
+
+IMPRESSION_BACKLOG = Gauge("impression_backlog", "Ad impressions buffered in memory and not yet written")
+
+
+def record_stage(stage, seconds):
+    RENDER_STAGE_SECONDS.labels(stage=stage).observe(seconds)
+
+
+def record_stages(timings):
+    """Record a {stage: seconds} dict returned by a render worker."""
+    for stage, seconds in timings.items():
+        record_stage(stage, seconds)
+
+
+@contextmanager
+def observe_stage(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def render_latest():
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every command the driver sends, labelled by collection and command name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()  # events arrive on the driver's threads
+        self._collections = {}  # (request_id, connection_id) -> collection name
+
+    def started(self, event):
+        # Most commands carry the collection as the value of the command name; getMore doesn't
+        target = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+        with self._lock:
+            self._collections[(event.request_id, event.connection_id)] = target if isinstance(target, str) else "-"
+
+    def _finish(self, event, outcome):
+        with self._lock:
+            collection = self._collections.pop((event.request_id, event.connection_id), "-")
+        MONGO_COMMAND_SECONDS.labels(collection=collection, command=event.command_name, outcome=outcome).observe(
+            event.duration_micros / 1e6
+        )
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+        read_metrics.record_reply(event.command_name, event.reply)
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+class RequestMetricsMiddleware:
+    """Records request latency per route template (e.g. /menus/{menu_id}/download_pdf)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope; label by its template, not the raw path
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                method=scope["method"],
+                route=getattr(route, "path", None) or "unmatched",
+                status=str(status["code"]),
+            ).observe(time.perf_counter() - started)
+
+
+mongo_command_listener = MongoCommandListener()
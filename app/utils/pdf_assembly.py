@@ -0,0 +1,119 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+
+from app.utils.ad_creatives import load_ad_image
+from app.utils.metrics import observe_stage, record_stages
+from app.utils.pdf_layouts import render_ad_slot, render_menu_body
+from app.utils.pdf_splice import splice_ad_slot
+from app.utils.render_cache import MemoryRenderCache, ad_slot_key, body_key
+from app.utils.render_executor import render_executor
+
+# Menu bodies (everything but the ad) are rendered once per menu version and layout,
+# ads once per ad and layout; a scan only splices the two, so rotating ads never
+# re-renders a menu. Bodies are kept in memory up to this many bytes (default 64 MB).
+PDF_BODY_CACHE_MAX_BYTES = int(os.getenv("PDF_BODY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Rendered ads kept in memory (a few KB each plus their image)
+AD_SLOT_CACHE_ENTRIES = int(os.getenv("AD_SLOT_CACHE_ENTRIES", 256))
+
+
+class MenuPdfAssembler:
+    """Builds a menu PDF for an ad from cached menu bodies and cached ads."""
+
+    def __init__(self, body_max_bytes=PDF_BODY_CACHE_MAX_BYTES, ad_slot_entries=AD_SLOT_CACHE_ENTRIES):
+        self.bodies = MemoryRenderCache(body_max_bytes)
+        self.ad_slot_entries = ad_slot_entries
+        self._ad_slots = OrderedDict()  # ad_slot_key -> extract_ad_slot() result
+        self._rendering = {}  # key -> task, so concurrent scans share one render
+        self._lock = threading.Lock()
+        self.splices = 0
+        self.ad_slot_hits = 0
+        self.ad_slot_misses = 0
+        self.ad_slots_without_image = 0
+
+    async def _render_once(self, key, render):
+        task = self._rendering.get(key)
+        if task is None:
+            task = asyncio.ensure_future(render())
+            self._rendering[key] = task
+            task.add_done_callback(lambda _: self._rendering.pop(key, None))
+        # One scan giving up must not cancel the render the others are waiting on
+        return await asyncio.shield(task)
+
+    async def _body(self, menu, welcome_text, layout):
+        key = body_key(menu, welcome_text, layout)
+        body = self.bodies.get(key)
+        if body is not None:
+            return body
+
+        async def render():
+            body, timings = await render_executor.run(render_menu_body, menu, welcome_text, layout)
+            record_stages(timings)
+            self.bodies.put(key, body)
+            return body
+
+        return await self._render_once(key, render)
+
+    async def _ad_slot(self, ad, layout):
+        """Return (ad slot, complete); complete is False if the ad's image couldn't be loaded."""
+        key = ad_slot_key(ad, layout)
+        ad_slot = self._ad_slots.get(key)
+        if ad_slot is not None:
+            with self._lock:
+                self.ad_slot_hits += 1
+                self._ad_slots.move_to_end(key)
+            return ad_slot, True
+        with self._lock:
+            self.ad_slot_misses += 1
+
+        async def render():
+            ad_image = await load_ad_image(ad)
+            ad_slot, timings = await render_executor.run(render_ad_slot, ad, ad_image, layout)
+            record_stages(timings)
+            complete = ad_image is not None or not ad.get("ad_image_url")
+            with self._lock:
+                if not complete:
+                    # Likely a passing fetch failure; the next scan tries the image again
+                    self.ad_slots_without_image += 1
+                    return ad_slot, False
+                self._ad_slots[key] = ad_slot
+                while len(self._ad_slots) > self.ad_slot_entries:
+                    self._ad_slots.popitem(last=False)
+            return ad_slot, True
+
+        return await self._render_once(key, render)
+
+    async def assemble(self, menu, ad, welcome_text, layout):
+        """Return (pdf_bytes, complete) for menu with ad, rendering only the parts not cached yet.
+
+        complete is False when the ad went in without its image; such a PDF shouldn't
+        be cached under the ad's render key.
+        """
+        body, (ad_slot, complete) = await asyncio.gather(
+            self._body(menu, welcome_text, layout),
+            self._ad_slot(ad, layout),
+        )
+        with observe_stage("pdf_splice"):
+            pdf_bytes = splice_ad_slot(body, ad_slot)
+        with self._lock:
+            self.splices += 1
+        return pdf_bytes, complete
+
+    def stats(self):
+        with self._lock:
+            return {
+                "splices": self.splices,
+                "bodies": self.bodies.stats(),
+                "ad_slots": {
+                    "hits": self.ad_slot_hits,
+                    "misses": self.ad_slot_misses,
+                    "without_image": self.ad_slots_without_image,
+                    "entries": len(self._ad_slots),
+                    "max_entries": self.ad_slot_entries,
+                },
+            }
+
+
+menu_pdf_assembler = MenuPdfAssembler()
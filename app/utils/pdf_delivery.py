@@ -0,0 +1,48 @@
+import os
+
+from fastapi import HTTPException
+
+from app.utils.menu_store import find_menu_by_id
+from app.utils.utils import get_next_ad, DEFAULT_WELCOME_TEXT
+from app.utils.pdf_layouts import menu_layout
+from app.utils.pdf_assembly import menu_pdf_assembler
+from app.utils.render_cache import render_key
+
+# "disk" serves the file written by generate_qr; "on_demand" builds the PDF in memory per
+# request with the next ad, so any worker can answer a scan without shared storage
+PDF_DELIVERY_MODE = os.getenv("PDF_DELIVERY_MODE", "disk")
+
+
+async def find_menu(menu_id):
+    """Fetch a single menu by its id, without the rest of the restaurant."""
+    menu = await find_menu_by_id(menu_id)
+    if not menu:
+        raise HTTPException(status_code=404, detail="Menu not found")
+    return menu
+
+
+async def render_pdf_on_demand(menu_id, client_has=None):
+    """Return (pdf_bytes, etag) for a menu with the next ad.
+
+    The ad is spliced into the menu's cached body, so only a menu edit (or an ad
+    never shown before) costs a render.
+
+    If client_has(etag) is true the client already holds this exact PDF, so nothing
+    is rendered and (None, etag) is returned.
+    """
+    menu = await find_menu(menu_id)
+    ad = await get_next_ad()
+    welcome_text = menu.get("welcome_text") or DEFAULT_WELCOME_TEXT
+    layout = menu_layout(menu)
+
+    key = render_key(menu, welcome_text, ad, layout)
+    # The render key already hashes everything that shapes the PDF
+    etag = f'"{key[:32]}"'
+    if client_has is not None and client_has(etag):
+        return None, etag
+
+    pdf_bytes, complete = await menu_pdf_assembler.assemble(menu, ad, welcome_text, layout)
+    if not complete:
+        # Served without the ad's image; a different ETag so clients don't keep it
+        etag = f'"{key[:32]}-no-image"'
+    return pdf_bytes, etag
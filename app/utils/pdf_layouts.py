@@ -0,0 +1,262 @@
+import os
+import time
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from app.utils.pdf_splice import AD_SLOT_FORM, extract_ad_slot
+from app.utils.utils import (
+    generate_menu_pdf, draw_ad_page, get_image_reader, DEFAULT_WELCOME_TEXT, AD_IMAGE_WIDTH, AD_IMAGE_HEIGHT,
+    PDF_PAGE_COMPRESSION,
+)
+
+# "classic": title page, ad page, then one or more pages per category.
+# "compact": title and ad share the first page and categories flow through columns,
+# so a 40-category menu is a handful of pages instead of 40+.
+PDF_LAYOUTS = ("classic", "compact")
+
+# Layout for menus that don't choose one (PUT .../menus/{id}/layout); app.rerender
+# picks up menus whose published PDF used another layout
+PDF_DEFAULT_LAYOUT = os.getenv("PDF_DEFAULT_LAYOUT", "classic")
+
+PDF_COMPACT_COLUMNS = int(os.getenv("PDF_COMPACT_COLUMNS", 2))
+
+# Optional TrueType fonts for the compact layout, e.g. for currency symbols Helvetica
+# lacks. ReportLab embeds only the glyphs a menu uses; unset, the built-in Helvetica is
+# used, which isn't embedded at all.
+PDF_FONT_PATH = os.getenv("PDF_FONT_PATH")
+PDF_BOLD_FONT_PATH = os.getenv("PDF_BOLD_FONT_PATH")
+
+COMPACT_MARGIN = 36
+COMPACT_GUTTER = 18
+TITLE_SIZE = 24
+HEADING_SIZE = 13
+HEADING_LEADING = 22
+DISH_SIZE = 9.5
+DISH_LEADING = 13
+# Space kept between a dish name and its price
+PRICE_GAP = 8
+# The ad band on the first page has a fixed position and height, so an ad can be
+# rendered on its own and spliced into any menu (see app.utils.pdf_splice)
+AD_BAND_TOP = letter[1] - COMPACT_MARGIN - TITLE_SIZE - 40
+AD_BAND_HEIGHT = HEADING_LEADING + AD_IMAGE_HEIGHT + 24
+
+
+def menu_layout(menu):
+    """The layout a menu is rendered with."""
+    layout = menu.get("pdf_layout") or PDF_DEFAULT_LAYOUT
+    return layout if layout in PDF_LAYOUTS else "classic"
+
+
+@lru_cache(maxsize=None)
+def compact_fonts():
+    """(regular, bold) font names, registering the TrueType fonts once per process."""
+    if not PDF_FONT_PATH:
+        return "Helvetica", "Helvetica-Bold"
+    pdfmetrics.registerFont(TTFont("MenuFont", PDF_FONT_PATH))
+    if not PDF_BOLD_FONT_PATH:
+        return "MenuFont", "MenuFont"
+    pdfmetrics.registerFont(TTFont("MenuFont-Bold", PDF_BOLD_FONT_PATH))
+    return "MenuFont", "MenuFont-Bold"
+
+
+def _format_price(price):
+    return f"{price:.2f}" if isinstance(price, (int, float)) else str(price if price is not None else "N/A")
+
+
+class _ColumnFlow:
+    """Stacks blocks down columns, moving to the next column (then page) when one is full.
+
+    Text for a page is collected in one text object and the rules in one path, both
+    drawn when the page is finished, instead of a drawing call per dish.
+    """
+
+    def __init__(self, c, page_size, columns, first_top):
+        self.c = c
+        self.width, self.height = page_size
+        self.columns = columns
+        self.column_width = (self.width - 2 * COMPACT_MARGIN - (columns - 1) * COMPACT_GUTTER) / columns
+        self.column = 0
+        self.column_top = first_top
+        self.y = first_top
+        self.text = c.beginText()
+        self.rules = []
+
+    @property
+    def x(self):
+        return COMPACT_MARGIN + self.column * (self.column_width + COMPACT_GUTTER)
+
+    def reserve(self, block_height):
+        """Make room for a block; returns the y of its top edge."""
+        if self.y - block_height < COMPACT_MARGIN and self.y != self.column_top:
+            self.column += 1
+            if self.column == self.columns:
+                self.finish_page()
+                self.c.showPage()
+                self.column = 0
+                self.column_top = self.height - COMPACT_MARGIN
+            self.y = self.column_top
+        top = self.y
+        self.y -= block_height
+        return top
+
+    def finish_page(self):
+        self.c.drawText(self.text)
+        if self.rules:
+            self.c.setStrokeColor(colors.grey)
+            self.c.setLineWidth(0.5)
+            self.c.lines(self.rules)
+        self.text = self.c.beginText()
+        self.rules = []
+
+
+def _draw_ad_band(c, ad_data, ad_image, regular, bold):
+    """Draw the ad across the first page below the title, in AD_BAND_HEIGHT points."""
+    width = letter[0]
+    top = AD_BAND_TOP
+    if isinstance(ad_data, str):
+        c.setFont(bold, HEADING_SIZE)
+        c.drawCentredString(width / 2, top - HEADING_SIZE, ad_data)
+        return
+
+    c.setFont(bold, HEADING_SIZE)
+    c.drawString(COMPACT_MARGIN, top - HEADING_SIZE, f"Sponsored Ad: {ad_data.get('ad_name', 'Ad')}")
+    body_top = top - HEADING_LEADING
+    text_x = COMPACT_MARGIN
+
+    ad_image_url = ad_data.get('ad_image_url', '')
+    if ad_image_url and ad_image:
+        c.drawImage(get_image_reader(ad_image), COMPACT_MARGIN, body_top - AD_IMAGE_HEIGHT,
+                    width=AD_IMAGE_WIDTH, height=AD_IMAGE_HEIGHT)
+        text_x = COMPACT_MARGIN + AD_IMAGE_WIDTH + COMPACT_GUTTER
+    elif ad_image_url:
+        c.setFont(regular, DISH_SIZE)
+        c.drawString(COMPACT_MARGIN, body_top - DISH_SIZE, f"Image not available: {ad_image_url}")
+        body_top -= DISH_LEADING
+
+    # Ad metadata beside the image, as much as fits in the band
+    c.setFont(regular, DISH_SIZE)
+    y = body_top - DISH_SIZE
+    for key, value in (ad_data.get('metadata') or {}).items():
+        if y < top - HEADING_LEADING - AD_IMAGE_HEIGHT:
+            break
+        c.drawString(text_x, y, f"{key}: {value}")
+        y -= DISH_LEADING
+
+    c.setStrokeColor(colors.grey)
+    rule_y = top - AD_BAND_HEIGHT + 16
+    c.line(COMPACT_MARGIN, rule_y, width - COMPACT_MARGIN, rule_y)
+
+
+def generate_compact_menu_pdf(menu_data, ad_data, file_path, welcome_text=DEFAULT_WELCOME_TEXT, ad_image=None,
+                              ad_slot=False, columns=PDF_COMPACT_COLUMNS):
+    if not file_path:
+        raise ValueError("File path is required to generate the PDF")
+
+    regular, bold = compact_fonts()
+    c = canvas.Canvas(file_path, pagesize=letter, pageCompression=PDF_PAGE_COMPRESSION)
+    width, height = letter
+    if ad_slot:
+        # Empty placeholder form for the ad band
+        c.beginForm(AD_SLOT_FORM)
+        c.endForm()
+
+    # Title and welcome text at the top of the first page
+    top = height - COMPACT_MARGIN
+    c.setFont(bold, TITLE_SIZE)
+    c.drawCentredString(width / 2, top - TITLE_SIZE, menu_data.get('name', 'Menu'))
+    c.setFont(regular, 10)
+    c.drawCentredString(width / 2, top - TITLE_SIZE - 18, welcome_text)
+    y = AD_BAND_TOP
+
+    if ad_slot:
+        c.doForm(AD_SLOT_FORM)
+        y -= AD_BAND_HEIGHT
+    elif isinstance(ad_data, dict):
+        _draw_ad_band(c, ad_data, ad_image, regular, bold)
+        y -= AD_BAND_HEIGHT
+    elif ad_data:
+        _draw_ad_band(c, ad_data, ad_image, regular, bold)
+        y -= HEADING_LEADING + 10
+
+    flow = _ColumnFlow(c, letter, max(columns, 1), y)
+    for category in menu_data.get("categories", []):
+        rows = []
+        for dish in category.get("dishes", []):
+            price = _format_price(dish.get('price', 'N/A'))
+            price_width = pdfmetrics.stringWidth(price, regular, DISH_SIZE)
+            name_lines = simpleSplit(dish.get('name', 'Unnamed Dish'), regular, DISH_SIZE,
+                                     flow.column_width - price_width - PRICE_GAP) or [""]
+            rows.append((name_lines, price, price_width))
+
+        # Keep the heading together with the first dish
+        first_row_height = len(rows[0][0]) * DISH_LEADING if rows else 0
+        heading_top = flow.reserve(HEADING_LEADING + first_row_height)
+        flow.y += first_row_height
+        flow.text.setFont(bold, HEADING_SIZE)
+        flow.text.setTextOrigin(flow.x, heading_top - HEADING_SIZE)
+        flow.text.textOut(category.get('name', 'Unnamed Category'))
+        rule_y = heading_top - HEADING_SIZE - 5
+        flow.rules.append((flow.x, rule_y, flow.x + flow.column_width, rule_y))
+
+        flow.text.setFont(regular, DISH_SIZE)
+        for name_lines, price, price_width in rows:
+            row_top = flow.reserve(len(name_lines) * DISH_LEADING)
+            if row_top == flow.column_top:
+                # Continued in a new column, so the font must be set again on a new page
+                flow.text.setFont(regular, DISH_SIZE)
+            baseline = row_top - DISH_SIZE
+            for line in name_lines:
+                flow.text.setTextOrigin(flow.x, baseline)
+                flow.text.textOut(line)
+                baseline -= DISH_LEADING
+            # Price on the dish's first line, right-aligned in the column
+            flow.text.setTextOrigin(flow.x + flow.column_width - price_width, row_top - DISH_SIZE)
+            flow.text.textOut(price)
+        flow.y -= DISH_LEADING / 2
+
+    flow.finish_page()
+    c.showPage()
+    c.save()
+
+
+def draw_menu_pdf(layout, menu_data, ad_data, file_path, welcome_text=DEFAULT_WELCOME_TEXT, ad_image=None,
+                  ad_slot=False):
+    if layout == "compact":
+        generate_compact_menu_pdf(menu_data, ad_data, file_path, welcome_text, ad_image, ad_slot)
+    else:
+        generate_menu_pdf(menu_data, ad_data, file_path, welcome_text, ad_image, ad_slot)
+
+
+# Both run inside the rendering process pool, so they must stay picklable top-level functions
+
+def render_menu_body(menu_data, welcome_text=DEFAULT_WELCOME_TEXT, layout="classic"):
+    """Render a menu with an empty ad slot; returns (pdf_bytes, stage timings)."""
+    started = time.perf_counter()
+    buffer = BytesIO()
+    draw_menu_pdf(layout, menu_data, None, buffer, welcome_text, ad_slot=True)
+    return buffer.getvalue(), {"pdf_render": time.perf_counter() - started}
+
+
+def render_ad_slot(ad_data, ad_image=None, layout="classic"):
+    """Render an ad the way the layout places it; returns (extract_ad_slot() result, stage timings)."""
+    started = time.perf_counter()
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter, pageCompression=PDF_PAGE_COMPRESSION)
+    c.beginForm(AD_SLOT_FORM)
+    if layout == "compact":
+        regular, bold = compact_fonts()
+        _draw_ad_band(c, ad_data, ad_image, regular, bold)
+    else:
+        draw_ad_page(c, ad_data, ad_image)
+    c.endForm()
+    c.doForm(AD_SLOT_FORM)
+    c.showPage()
+    c.save()
+    return extract_ad_slot(buffer.getvalue()), {"ad_render": time.perf_counter() - started}
@@ -0,0 +1,139 @@
+"""Put an ad into an already rendered menu PDF without re-rendering the menu.
+
+A menu body is rendered with an empty form XObject named AD_SLOT_FORM where the
+ad goes (its own page in the classic layout, a band on the first page in the
+compact one). An ad is rendered into a form of the same name in a separate PDF.
+Splicing appends the ad's form, and the fonts and images it uses, to the body as
+a PDF incremental update that replaces the empty form. The body's bytes are
+reused as they are, so a splice costs about as much as copying them.
+
+This relies on how ReportLab writes PDFs (one classic xref table, direct stream
+lengths, no object streams), so it only handles files rendered by this app.
+"""
+import re
+
+AD_SLOT_FORM = "AdSlot"
+
+_SLOT_REF = re.compile(rb"/FormXob\." + AD_SLOT_FORM.encode() + rb" (\d+) 0 R")
+_REF = re.compile(rb"\b(\d+) 0 R\b")
+_OBJ_HEADER = re.compile(rb"(\d+) 0 obj\s")
+_LENGTH = re.compile(rb"/Length (\d+)\b(?! 0 R)")
+_STARTXREF = re.compile(rb"startxref\s+(\d+)\s+%%EOF\s*$")
+_SIZE = re.compile(rb"/Size (\d+)")
+_ROOT = re.compile(rb"/Root (\d+) 0 R")
+_INFO = re.compile(rb"/Info (\d+) 0 R")
+_ID = re.compile(rb"/ID\s*(\[<[0-9a-fA-F]*>\s*<[0-9a-fA-F]*>\])")
+
+
+class PdfSpliceError(ValueError):
+    pass
+
+
+def _startxref(pdf):
+    match = _STARTXREF.search(pdf[-64:])
+    if not match:
+        raise PdfSpliceError("No startxref at the end of the PDF")
+    return int(match.group(1))
+
+
+def _xref_offsets(pdf):
+    """Object number -> byte offset, from the PDF's (single) xref table."""
+    lines = pdf[_startxref(pdf):].split(b"\n")
+    if lines[0].strip() != b"xref":
+        raise PdfSpliceError("Expected a classic xref table")
+    first, count = (int(value) for value in lines[1].split())
+    offsets = {}
+    for number, line in enumerate(lines[2:2 + count], start=first):
+        offset, _, kind = line.split()[:3]
+        if kind == b"n":
+            offsets[number] = int(offset)
+    return offsets
+
+
+def _read_object(pdf, offset):
+    """Return (dictionary bytes, stream bytes or None) for the object at offset."""
+    header = _OBJ_HEADER.match(pdf, offset)
+    if not header:
+        raise PdfSpliceError(f"No object at offset {offset}")
+    start = header.end()
+    end = pdf.index(b"endobj", start)
+    stream_at = pdf.find(b"stream", start, end)
+    if stream_at == -1:
+        return pdf[start:end].rstrip(), None
+    dictionary = pdf[start:stream_at]
+    length = _LENGTH.search(dictionary)
+    if not length:
+        raise PdfSpliceError("Stream without a direct /Length")
+    data_start = stream_at + len(b"stream")
+    if pdf[data_start:data_start + 2] == b"\r\n":
+        data_start += 2
+    elif pdf[data_start:data_start + 1] == b"\n":
+        data_start += 1
+    return dictionary, pdf[data_start:data_start + int(length.group(1))]
+
+
+def extract_ad_slot(ad_pdf):
+    """Pull the AD_SLOT_FORM form, and every object it references, out of a rendered ad.
+
+    Returns {"slot": object number, "objects": {number: (dictionary, stream)}}.
+    """
+    slot = _SLOT_REF.search(ad_pdf)
+    if not slot:
+        raise PdfSpliceError(f"The ad PDF has no {AD_SLOT_FORM} form")
+    offsets = _xref_offsets(ad_pdf)
+    objects = {}
+    pending = [int(slot.group(1))]
+    while pending:
+        number = pending.pop()
+        if number in objects:
+            continue
+        dictionary, stream = _read_object(ad_pdf, offsets[number])
+        objects[number] = (dictionary, stream)
+        # References only ever appear in the dictionary, never inside stream data
+        pending.extend(int(ref) for ref in _REF.findall(dictionary))
+    return {"slot": int(slot.group(1)), "objects": objects}
+
+
+def splice_ad_slot(body_pdf, ad_slot):
+    """Return body_pdf with its empty ad slot replaced by ad_slot (from extract_ad_slot)."""
+    slot = _SLOT_REF.search(body_pdf)
+    if not slot:
+        raise PdfSpliceError(f"The menu PDF has no {AD_SLOT_FORM} form")
+    prev = _startxref(body_pdf)
+    trailer = body_pdf[body_pdf.rindex(b"trailer", 0, len(body_pdf) - 16):]
+    size = int(_SIZE.search(trailer).group(1))
+
+    # The ad's form takes the placeholder's number; everything else is numbered after the body
+    numbers = {ad_slot["slot"]: int(slot.group(1))}
+    for number in sorted(ad_slot["objects"]):
+        if number != ad_slot["slot"]:
+            numbers[number] = size
+            size += 1
+
+    def renumber(match):
+        return b"%d 0 R" % numbers[int(match.group(1))]
+
+    chunks = [body_pdf]
+    position = len(body_pdf)
+    xref = []
+    for number, (dictionary, stream) in ad_slot["objects"].items():
+        chunk = b"%d 0 obj\n" % numbers[number] + _REF.sub(renumber, dictionary)
+        if stream is not None:
+            chunk += b"stream\n" + stream + b"\nendstream"
+        chunk += b"\nendobj\n"
+        xref.append((numbers[number], position))
+        chunks.append(chunk)
+        position += len(chunk)
+
+    # Starts with the free-list head, as a first xref section would; some readers expect it
+    chunks.append(b"xref\n0 1\n0000000000 65535 f \n")
+    chunks.extend(b"%d 1\n%010d 00000 n \n" % entry for entry in sorted(xref))
+    fields = [b"/Size %d" % size, b"/Root %s 0 R" % _ROOT.search(trailer).group(1), b"/Prev %d" % prev]
+    info = _INFO.search(trailer)
+    if info:
+        fields.append(b"/Info %s 0 R" % info.group(1))
+    document_id = _ID.search(trailer)
+    if document_id:
+        fields.append(b"/ID " + document_id.group(1))
+    chunks.append(b"trailer\n<< " + b" ".join(fields) + b" >>\nstartxref\n%d\n%%%%EOF\n" % position)
+    return b"".join(chunks)
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import threading
+import time
+from functools import lru_cache
+from io import BytesIO
+
+import qrcode
+from PIL import Image
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.metrics import record_stage
+from app.utils.utils import FILE_DIR
+
+# Rendered QR codes, keyed by a hash of their payload. A menu's QR code only encodes
+# its download_pdf URL, which never changes, so each variant is rendered once.
+QR_CACHE_DIR = os.path.join(FILE_DIR, "qr")
+
+# Pixel sizes accepted by ?size= (bounded so the cache can't be filled with variants)
+QR_PNG_SIZES = (128, 256, 512, 1024, 2048)
+
+QR_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+# Quiet zone in modules, and pixels per module when no size is requested
+QR_BORDER = 4
+DEFAULT_BOX_SIZE = 10
+
+os.makedirs(QR_CACHE_DIR, exist_ok=True)
+
+
+@lru_cache(maxsize=1024)
+def qr_modules(payload):
+    """The QR code's dark/light module matrix, without the quiet zone.
+
+    Picking the smallest fitting version is the expensive part, so it is done once
+    per payload and shared by every output format.
+    """
+    qr = qrcode.QRCode(version=None, error_correction=qrcode.constants.ERROR_CORRECT_L, border=0)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return tuple(tuple(row) for row in qr.get_matrix())
+
+
+def render_png(payload, size=None):
+    modules = qr_modules(payload)
+    total = len(modules) + 2 * QR_BORDER
+    # One pixel per module, then scaled up by a whole factor so modules stay crisp
+    image = Image.new("1", (total, total), 1)
+    image.putdata([
+        0 if QR_BORDER <= y < total - QR_BORDER and QR_BORDER <= x < total - QR_BORDER
+        and modules[y - QR_BORDER][x - QR_BORDER] else 1
+        for y in range(total) for x in range(total)
+    ])
+    box_size = DEFAULT_BOX_SIZE if size is None else max(size // total, 1)
+    image = image.resize((total * box_size, total * box_size), Image.NEAREST)
+    if size is not None and image.width != size:
+        # Pad to exactly the requested size; the extra white only widens the quiet zone
+        canvas = Image.new("1", (size, size), 1)
+        canvas.paste(image, ((size - image.width) // 2, (size - image.height) // 2))
+        image = canvas
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def render_svg(payload):
+    modules = qr_modules(payload)
+    total = len(modules) + 2 * QR_BORDER
+    # One path segment per horizontal run of dark modules keeps the file small
+    segments = []
+    for y, row in enumerate(modules):
+        x = 0
+        while x < len(row):
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < len(row) and row[x]:
+                x += 1
+            segments.append(f"M{start + QR_BORDER} {y + QR_BORDER}h{x - start}v1h-{x - start}z")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {total} {total}" shape-rendering="crispEdges">'
+        f'<rect width="{total}" height="{total}" fill="#fff"/>'
+        f'<path d="{"".join(segments)}" fill="#000"/></svg>'
+    ).encode("utf-8")
+
+
+class QRCodeCache:
+    """Disk cache of QR code variants (format and size) keyed by payload hash."""
+
+    def __init__(self, cache_dir=QR_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, payload, fmt="png", size=None):
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{digest}_{size or 'default'}.{fmt}")
+
+    def _render_to(self, path, payload, fmt, size):
+        started = time.perf_counter()
+        data = render_svg(payload) if fmt == "svg" else render_png(payload, size)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        record_stage("qr_render", time.perf_counter() - started)
+
+    async def get(self, payload, fmt="png", size=None):
+        """Return the path of the requested variant, rendering it on first use."""
+        if fmt == "svg":
+            size = None  # vector output has no pixel size
+        path = self.path(payload, fmt, size)
+        if os.path.exists(path):
+            with self._lock:
+                self.hits += 1
+            return path
+        with self._lock:
+            self.misses += 1
+        await run_in_threadpool(self._render_to, path, payload, fmt, size)
+        return path
+
+    def _remove(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def delete(self, payload):
+        """Remove every cached variant of payload."""
+        paths = [self.path(payload, "svg")] + [self.path(payload, "png", size) for size in (None, *QR_PNG_SIZES)]
+        await run_in_threadpool(self._remove, paths)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+qr_code_cache = QRCodeCache()
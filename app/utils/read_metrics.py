@@ -0,0 +1,102 @@
+import contextvars
+import logging
+import os
+import random
+import threading
+
+import bson
+
+logger = logging.getLogger(__name__)
+
+# Bytes of BSON read from Mongo, per request and in total: the replies to every read
+# command (find, getMore, aggregate, findAndModify, distinct) on every collection,
+# as reported to the driver's command listener (app.utils.metrics). Writes and their
+# acknowledgements aren't counted.
+#
+# The per-request counter lives in a context variable set by ReadMetricsMiddleware;
+# Motor runs the driver in threads with a copy of the caller's context, so the
+# listener sees it. Only requests picked by the sample rate get one, and totals
+# cover those requests only.
+_request_reads = contextvars.ContextVar("request_reads", default=None)
+
+# The driver hands the listener decoded replies, so measuring one means encoding it
+# again. Off by default; 1 measures every request, 0.01 one in a hundred.
+MONGO_READ_METRICS_SAMPLE_RATE = float(os.getenv("MONGO_READ_METRICS_SAMPLE_RATE", 0))
+
+READ_COMMANDS = {"find", "getMore", "aggregate", "findAndModify", "distinct"}
+
+totals = {"requests": 0, "bytes": 0, "documents": 0}
+_lock = threading.Lock()  # replies are recorded on the driver's threads
+
+
+def _documents(command_name, reply):
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    if command_name == "findAndModify":
+        return int(reply.get("value") is not None)
+    return 0
+
+
+def record_reply(command_name, reply):
+    """Count the BSON size of a read command's reply; called by the command listener."""
+    reads = _request_reads.get()
+    if reads is None or command_name not in READ_COMMANDS:
+        return
+    size = len(bson.encode(reply))
+    documents = _documents(command_name, reply)
+    with _lock:
+        totals["bytes"] += size
+        totals["documents"] += documents
+        reads["bytes"] += size
+        reads["documents"] += documents
+
+
+class ReadMetricsMiddleware:
+    """Reports the Mongo bytes read while handling a sampled request in an X-Mongo-Bytes-Read header.
+
+    The header goes out before the body, so it is only added when the body's length is
+    known up front. Streamed responses (NDJSON exports and the like) keep reading while
+    they are sent; their count is logged once they finish instead.
+    """
+
+    def __init__(self, app, sample_rate=None):
+        self.app = app
+        self.sample_rate = MONGO_READ_METRICS_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.sample_rate or random.random() >= self.sample_rate:
+            return await self.app(scope, receive, send)
+
+        reads = {"bytes": 0, "documents": 0}
+        token = _request_reads.set(reads)
+        streamed = False
+
+        async def send_with_header(message):
+            nonlocal streamed
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if any(name.lower() == b"content-length" for name, _ in headers):
+                    headers.append((b"x-mongo-bytes-read", str(reads["bytes"]).encode()))
+                    message = {**message, "headers": headers}
+                else:
+                    streamed = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            _request_reads.reset(token)
+            with _lock:
+                totals["requests"] += 1
+            if streamed:
+                logger.info("%s %s read %d bytes (%d documents) from Mongo",
+                            scope["method"], scope["path"], reads["bytes"], reads["documents"])
+
+
+def stats():
+    return {
+        **totals,
+        "sample_rate": MONGO_READ_METRICS_SAMPLE_RATE,
+        "avg_bytes_per_request": totals["bytes"] / (totals["requests"] or 1),
+    }
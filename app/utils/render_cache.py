@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.utils.utils import FILE_DIR, PDF_LAYOUT_VERSION
+
+# Rendered artifacts are stored here under their content hash
+CACHE_DIR = os.path.join(FILE_DIR, "cache")
+
+# Upper bound on the disk space used by cached renders (default 256 MB)
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+
+# Ad fields that end up in the PDF (serving counters like last_served are left out)
+AD_RENDER_FIELDS = ("_id", "ad_name", "ad_image_url", "ad_creative", "metadata")
+
+
+def _hash(payload):
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _ad_fields(ad_data):
+    if isinstance(ad_data, dict):
+        return {field: ad_data.get(field) for field in AD_RENDER_FIELDS}
+    return None
+
+
+def render_key(menu_data, welcome_text, ad_data, layout="classic"):
+    """Hash everything that affects the rendered PDF."""
+    return _hash({
+        "menu": menu_data,
+        "welcome_text": welcome_text,
+        "ad": _ad_fields(ad_data),
+        "layout": layout,
+        "layout_version": PDF_LAYOUT_VERSION,
+    })
+
+
+def body_key(menu_data, welcome_text, layout="classic"):
+    """Hash everything that affects a menu body rendered with an empty ad slot."""
+    return _hash({
+        "menu": menu_data,
+        "welcome_text": welcome_text,
+        "ad_slot": True,
+        "layout": layout,
+        "layout_version": PDF_LAYOUT_VERSION,
+    })
+
+
+def ad_slot_key(ad_data, layout="classic"):
+    """Hash everything that affects an ad rendered on its own for splicing."""
+    return _hash({"ad": _ad_fields(ad_data), "layout": layout, "layout_version": PDF_LAYOUT_VERSION})
+
+
+class RenderCache:
+    """Content-addressed store of rendered menu PDFs with size-based LRU eviction.
+
+    Recency is tracked in memory, so a hit costs one existence check (in the
+    threadpool) rather than a utime on the event loop. QR codes don't depend on
+    the menu or ad, so they live in qr_codes.qr_code_cache instead.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._sizes = OrderedDict()  # key -> bytes on disk, least recently used first
+        self._bytes = 0
+        self._load_index()
+
+    def _load_index(self):
+        # Rebuild the size index from whatever survived a restart, oldest files first
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            key, _, extension = name.partition(".")
+            path = os.path.join(self.cache_dir, name)
+            if not os.path.isfile(path):
+                continue
+            if extension == "png":
+                # QR codes cached next to PDFs by older versions
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._sizes[key] = size
+            self._bytes += size
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def _forget(self, key):
+        size = self._sizes.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+
+    async def lookup(self, key):
+        """Return the cached PDF path for key, or None on a miss."""
+        pdf_path = self.path(key)
+        # Another worker sharing the directory may have evicted the file
+        if key in self._sizes and await run_in_threadpool(os.path.exists, pdf_path):
+            with self._lock:
+                if key in self._sizes:
+                    self.hits += 1
+                    self._sizes.move_to_end(key)
+                    return pdf_path
+        with self._lock:
+            self.misses += 1
+            self._forget(key)
+        return None
+
+    async def store(self, key):
+        """Record a freshly rendered PDF for key and evict old entries if over budget."""
+        pdf_path = self.path(key)
+        size = await run_in_threadpool(_file_size, pdf_path)
+        with self._lock:
+            self._forget(key)
+            self._sizes[key] = size
+            self._bytes += size
+            evicted = self._evict()
+        if evicted:
+            await run_in_threadpool(self._remove, evicted)
+
+    def _evict(self):
+        # Least recently used first; returns the keys whose files should be removed
+        evicted = []
+        while self._bytes > self.max_bytes and self._sizes:
+            key, size = self._sizes.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            evicted.append(key)
+        return evicted
+
+    def _remove(self, keys):
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._sizes),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class MemoryRenderCache:
+    """Byte-bounded in-memory LRU for artifacts rendered on demand."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> bytes
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        data = self._entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = data
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+render_cache = RenderCache()
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException
+
+from app.utils.metrics import RENDERS_IN_FLIGHT, record_stage
+
+# Number of render worker processes (defaults to one per core)
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", os.cpu_count() or 1))
+
+# Maximum renders allowed to wait for a worker before new requests are rejected
+RENDER_QUEUE_LIMIT = int(os.getenv("RENDER_QUEUE_LIMIT", 32))
+
+
+def _timed(fn, *args):
+    # Runs in the worker process so the measured time excludes queueing and pickling
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+class RenderExecutor:
+    """Runs CPU-bound PDF/QR rendering in a bounded process pool so the event loop stays free."""
+
+    def __init__(self, workers=RENDER_WORKERS, queue_limit=RENDER_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._pool = None
+        self._lock = threading.Lock()
+        self.pending = 0  # submitted but not yet finished
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_render_seconds = 0.0
+        self.max_render_seconds = 0.0
+        self.total_wait_seconds = 0.0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool and return its result; fn must be picklable."""
+        # Anything beyond the busy workers is queued, so cap the total in flight
+        if self.pending >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Renderer is busy, please retry shortly")
+
+        self.pending += 1
+        RENDERS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            render_seconds, result = await loop.run_in_executor(self._get_pool(), _timed, fn, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+            RENDERS_IN_FLIGHT.dec()
+
+        self.completed += 1
+        self.total_render_seconds += render_seconds
+        self.max_render_seconds = max(self.max_render_seconds, render_seconds)
+        wait_seconds = max(time.perf_counter() - started - render_seconds, 0.0)
+        self.total_wait_seconds += wait_seconds
+        record_stage("render_queue_wait", wait_seconds)
+        return result
+
+    def stats(self):
+        done = self.completed or 1
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight": self.pending,
+            "queue_depth": max(self.pending - self.workers, 0),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_render_seconds": self.total_render_seconds / done,
+            "max_render_seconds": self.max_render_seconds,
+            "avg_queue_wait_seconds": self.total_wait_seconds / done,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+
+render_executor = RenderExecutor()
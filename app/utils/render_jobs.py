@@ -0,0 +1,325 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+from app.db import db
+from app.utils.menu_render import render_menu_qr
+from app.utils.render_executor import render_executor
+
+logger = logging.getLogger(__name__)
+
+# Render jobs live in Mongo so they survive restarts and every uvicorn worker sees
+# (and helps drain) the same queue. A job goes queued -> running -> done | failed.
+#
+# Fairness: when a job is queued it gets a rank equal to the number of jobs its
+# restaurant already has waiting or running, and workers always claim the lowest
+# rank first. A restaurant that queues a hundred menus at once therefore can't
+# starve one that queues a single menu a moment later.
+#
+# Running jobs hold a lease; if a worker dies mid-render the lease runs out and
+# another worker picks the job up again.
+
+render_jobs_collection = db["render_jobs"]
+
+# Concurrent jobs per API process (the renders themselves share render_executor's pool)
+RENDER_JOB_WORKERS = int(os.getenv("RENDER_JOB_WORKERS", render_executor.workers))
+
+# How often idle workers look for jobs queued by other processes
+RENDER_JOB_POLL_SECONDS = float(os.getenv("RENDER_JOB_POLL_SECONDS", 1))
+
+RENDER_JOB_LEASE_SECONDS = int(os.getenv("RENDER_JOB_LEASE_SECONDS", 120))
+
+# A running job's lease is renewed this often, so a render may take longer than the
+# lease; only a worker that stops heartbeating loses its jobs
+RENDER_JOB_HEARTBEAT_SECONDS = RENDER_JOB_LEASE_SECONDS / 4
+
+# Finished jobs are removed by a TTL index after this long (see app.indexes)
+RENDER_JOB_RETENTION_SECONDS = 24 * 60 * 60
+
+MAX_JOB_ATTEMPTS = 3
+
+# Seconds to leave a job queued when the render pool is saturated
+BUSY_RETRY_SECONDS = 2
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+ACTIVE_STATUSES = ["queued", "running"]
+
+
+def job_view(job):
+    """The public representation of a job document."""
+    view = {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "restaurant_id": str(job["restaurant_id"]),
+        "menu_id": job["menu_id"],
+        "created_at": job["created_at"],
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+        "attempts": job.get("attempts", 0),
+    }
+    if job["status"] == "done":
+        view.update(job["result"])
+    if job["status"] == "failed":
+        view["error"] = job.get("error")
+    return view
+
+
+async def submit_job(restaurant_id, menu_id, base_url):
+    """Queue a render of one menu and return the job document.
+
+    A menu that already has a job waiting reuses it, so clients that retry (or
+    double-submit) don't multiply the work.
+    """
+    restaurant_oid = ObjectId(restaurant_id)
+    existing = await render_jobs_collection.find_one(
+        {"restaurant_id": restaurant_oid, "menu_id": menu_id, "base_url": base_url, "status": "queued"}
+    )
+    if existing:
+        return existing
+
+    rank = await render_jobs_collection.count_documents(
+        {"restaurant_id": restaurant_oid, "status": {"$in": ACTIVE_STATUSES}}
+    )
+    job = _new_job(restaurant_oid, menu_id, base_url, rank, datetime.utcnow())
+    result = await render_jobs_collection.insert_one(job)
+    job["_id"] = result.inserted_id
+    render_job_runner.wake()
+    return job
+
+
+async def submit_jobs(menus, base_url):
+    """Queue renders of a batch of (restaurant_id, menu_id) pairs; returns how many jobs were added.
+
+    Same rules as submit_job (menus with a job waiting are skipped, ranks count a
+    restaurant's active jobs), in three queries for the whole batch.
+    """
+    pairs = [(ObjectId(restaurant_id), menu_id) for restaurant_id, menu_id in menus]
+    if not pairs:
+        return 0
+    restaurant_oids = list({restaurant_oid for restaurant_oid, _ in pairs})
+    waiting = {
+        (job["restaurant_id"], job["menu_id"])
+        async for job in render_jobs_collection.find(
+            {"restaurant_id": {"$in": restaurant_oids}, "menu_id": {"$in": [menu_id for _, menu_id in pairs]},
+             "base_url": base_url, "status": "queued"},
+            {"restaurant_id": 1, "menu_id": 1},
+        )
+    }
+    ranks = {
+        group["_id"]: group["count"]
+        async for group in render_jobs_collection.aggregate([
+            {"$match": {"restaurant_id": {"$in": restaurant_oids}, "status": {"$in": ACTIVE_STATUSES}}},
+            {"$group": {"_id": "$restaurant_id", "count": {"$sum": 1}}},
+        ])
+    }
+    now = datetime.utcnow()
+    jobs = []
+    for restaurant_oid, menu_id in pairs:
+        if (restaurant_oid, menu_id) in waiting:
+            continue
+        rank = ranks.get(restaurant_oid, 0)
+        ranks[restaurant_oid] = rank + 1
+        jobs.append(_new_job(restaurant_oid, menu_id, base_url, rank, now))
+    if jobs:
+        await render_jobs_collection.insert_many(jobs, ordered=False)
+        render_job_runner.wake()
+    return len(jobs)
+
+
+def _new_job(restaurant_oid, menu_id, base_url, rank, now):
+    return {
+        "restaurant_id": restaurant_oid,
+        "menu_id": menu_id,
+        "base_url": base_url,
+        "status": "queued",
+        "rank": rank,
+        "attempts": 0,
+        "created_at": now,
+        "available_at": now,
+    }
+
+
+async def get_job(job_id):
+    try:
+        job_oid = ObjectId(job_id)
+    except Exception:
+        raise HTTPException(status_code=404, detail="Render job not found")
+    job = await render_jobs_collection.find_one({"_id": job_oid})
+    if not job:
+        raise HTTPException(status_code=404, detail="Render job not found")
+    return job
+
+
+async def claim_job():
+    """Atomically take the fairest runnable job, or return None if there is none."""
+    now = datetime.utcnow()
+    return await render_jobs_collection.find_one_and_update(
+        {"$or": [
+            {"status": "queued", "available_at": {"$lte": now}},
+            # Abandoned by a worker that died mid-render (see fail_abandoned_jobs for the last attempt)
+            {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$lt": MAX_JOB_ATTEMPTS}},
+        ]},
+        {
+            "$set": {"status": "running", "started_at": now, "worker": WORKER_ID,
+                     "lease_until": now + timedelta(seconds=RENDER_JOB_LEASE_SECONDS)},
+            "$inc": {"attempts": 1},
+        },
+        sort=[("rank", 1), ("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def fail_abandoned_jobs():
+    """Fail jobs whose worker died on their last attempt; returns how many.
+
+    claim_job no longer reclaims them, and a job left "running" would keep its
+    menu from being submitted again.
+    """
+    now = datetime.utcnow()
+    result = await render_jobs_collection.update_many(
+        {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$gte": MAX_JOB_ATTEMPTS}},
+        {
+            "$set": {"status": "failed", "error": f"Worker lost after {MAX_JOB_ATTEMPTS} attempts",
+                     "finished_at": now},
+            "$unset": {"lease_until": ""},
+        },
+    )
+    return result.modified_count
+
+
+async def _finish(job, fields):
+    # Only the worker holding the lease may finish the job
+    await render_jobs_collection.update_one(
+        {"_id": job["_id"], "worker": WORKER_ID, "status": "running"},
+        {"$set": {**fields, "finished_at": datetime.utcnow()}, "$unset": {"lease_until": ""}},
+    )
+
+
+async def _heartbeat(job):
+    """Keep extending the job's lease until cancelled."""
+    while True:
+        await asyncio.sleep(RENDER_JOB_HEARTBEAT_SECONDS)
+        try:
+            result = await render_jobs_collection.update_one(
+                {"_id": job["_id"], "worker": WORKER_ID, "status": "running"},
+                {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=RENDER_JOB_LEASE_SECONDS)}},
+            )
+        except Exception:
+            logger.exception("Could not renew the lease of render job %s", job["_id"])
+            continue
+        if result.matched_count == 0:
+            logger.warning("Render job %s lost its lease to another worker", job["_id"])
+            return
+
+
+async def _requeue(job, delay_seconds, count_attempt=True):
+    await render_jobs_collection.update_one(
+        {"_id": job["_id"], "worker": WORKER_ID, "status": "running"},
+        {
+            "$set": {"status": "queued", "available_at": datetime.utcnow() + timedelta(seconds=delay_seconds)},
+            "$unset": {"lease_until": "", "worker": ""},
+            **({} if count_attempt else {"$inc": {"attempts": -1}}),
+        },
+    )
+
+
+class RenderJobRunner:
+    """Pool of asyncio workers that drain the render_jobs queue."""
+
+    def __init__(self, workers=RENDER_JOB_WORKERS, poll_seconds=RENDER_JOB_POLL_SECONDS):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def run_job(self, job):
+        self.running += 1
+        heartbeat = asyncio.get_running_loop().create_task(_heartbeat(job))
+        try:
+            result = await render_menu_qr(str(job["restaurant_id"]), job["menu_id"], job["base_url"])
+        except HTTPException as e:
+            if e.status_code == 503:
+                # Render pool is saturated; try again shortly without using up an attempt
+                self.retried += 1
+                await _requeue(job, BUSY_RETRY_SECONDS, count_attempt=False)
+            else:
+                # Menu deleted, no ads, ...: retrying won't help
+                self.failed += 1
+                await _finish(job, {"status": "failed", "error": e.detail})
+        except Exception as e:
+            logger.exception("Render job %s failed", job["_id"])
+            if job.get("attempts", 1) < MAX_JOB_ATTEMPTS:
+                self.retried += 1
+                await _requeue(job, BUSY_RETRY_SECONDS * job.get("attempts", 1))
+            else:
+                self.failed += 1
+                await _finish(job, {"status": "failed", "error": str(e)})
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back instead of leaving it to the lease timeout
+            await _requeue(job, 0, count_attempt=False)
+            raise
+        else:
+            self.completed += 1
+            await _finish(job, {"status": "done", "result": result})
+        finally:
+            heartbeat.cancel()
+            self.running -= 1
+
+    async def _worker(self):
+        while True:
+            # Cleared before looking, so a job submitted meanwhile still wakes us
+            self._wakeup.clear()
+            try:
+                job = await claim_job()
+            except Exception:
+                logger.exception("Could not claim a render job")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run_job(job)
+
+    def start(self):
+        if not self._tasks:
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers; jobs still rendering are put back in the queue."""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+render_job_runner = RenderJobRunner()
@@ -0,0 +1,59 @@
+import asyncio
+import functools
+import json
+from datetime import date, datetime
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from starlette.responses import Response
+
+
+def _default(obj):
+    # Only called for values the C encoder doesn't know, so plain data stays on the fast path
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_json(content):
+    """Encode Mongo documents (ObjectId, datetime included) to JSON in a single pass."""
+    return _encoder.encode(content)
+
+
+class BSONJSONResponse(JSONResponse):
+    """JSON response that encodes BSON types directly, without copying the payload first."""
+
+    def render(self, content):
+        return encode_json(content).encode("utf-8")
+
+
+class BSONRoute(APIRoute):
+    """Route class that hands endpoint results straight to BSONJSONResponse.
+
+    FastAPI otherwise runs every return value through jsonable_encoder, a recursive
+    walk that rebuilds every dict and list (and can't handle ObjectId). Endpoints
+    that return a Response themselves are left alone.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        status_code = kwargs.get("status_code") or 200
+
+        if asyncio.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def wrapped(*args, **kw):
+                result = await endpoint(*args, **kw)
+                return result if isinstance(result, Response) else BSONJSONResponse(result, status_code=status_code)
+        else:
+            @functools.wraps(endpoint)
+            def wrapped(*args, **kw):
+                result = endpoint(*args, **kw)
+                return result if isinstance(result, Response) else BSONJSONResponse(result, status_code=status_code)
+
+        kwargs.setdefault("response_class", BSONJSONResponse)
+        super().__init__(path, wrapped, **kwargs)
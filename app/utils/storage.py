@@ -0,0 +1,221 @@
+import hashlib
+import os
+from abc import ABC, abstractmethod
+import shutil
+import threading
+
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.http_cache import file_etag
+from app.utils.utils import FILE_DIR
+
+# Where published menu artifacts (menu_<id>.pdf, qr_<id>.png) are kept:
+#   "local"  - files under ARTIFACT_DIR (the default, as before)
+#   "s3"     - an S3-compatible bucket (AWS, MinIO, ...), shared by every worker
+#   "memory" - this process only; for development and tests
+# Render, QR and ad image caches stay on local disk either way; they are only caches.
+ARTIFACT_STORAGE = os.getenv("ARTIFACT_STORAGE", "local")
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", FILE_DIR)
+
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_PREFIX = os.getenv("S3_PREFIX", "menus/")
+# Set for S3-compatible services or a local stand-in, e.g. http://localhost:9000
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+S3_REGION = os.getenv("S3_REGION")
+
+# Send clients to a presigned URL instead of streaming the object through the API
+S3_PRESIGNED_REDIRECTS = os.getenv("S3_PRESIGNED_REDIRECTS", "1") == "1"
+S3_PRESIGNED_EXPIRES_SECONDS = int(os.getenv("S3_PRESIGNED_EXPIRES_SECONDS", 300))
+
+# Files above the threshold are uploaded in parts, several at a time
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", 8 * 1024 * 1024))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", 8))
+
+
+class ArtifactStore(ABC):
+    """Interface for where published artifacts live. Names are flat, e.g. "menu_<id>.pdf"."""
+
+    @abstractmethod
+    async def put_file(self, name, src_path, content_type):
+        ...
+
+    @abstractmethod
+    async def get(self, name):
+        """Return the artifact's bytes, or None if it doesn't exist."""
+
+    @abstractmethod
+    async def stat(self, name):
+        """Return {"etag", "size"} for the artifact, or None if it doesn't exist."""
+
+    @abstractmethod
+    async def delete(self, name):
+        """Remove the artifact; deleting one that doesn't exist is not an error."""
+
+    async def exists(self, name):
+        return await self.stat(name) is not None
+
+    async def presigned_url(self, name):
+        """A URL clients can fetch the artifact from directly, or None if not supported."""
+        return None
+
+    def local_path(self, name):
+        """Path on this machine's disk, if the backend keeps one (lets the API use sendfile)."""
+        return None
+
+
+class LocalArtifactStore(ArtifactStore):
+    def __init__(self, root=ARTIFACT_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def local_path(self, name):
+        return os.path.join(self.root, name)
+
+    def _copy(self, src_path, dest_path):
+        # Copy then rename, so readers never see a half-written file
+        tmp_path = f"{dest_path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+
+    async def put_file(self, name, src_path, content_type):
+        await run_in_threadpool(self._copy, src_path, self.local_path(name))
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _stat(self, path):
+        try:
+            return {"etag": file_etag(path), "size": os.path.getsize(path)}
+        except FileNotFoundError:
+            return None
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    async def get(self, name):
+        return await run_in_threadpool(self._read, self.local_path(name))
+
+    async def stat(self, name):
+        return await run_in_threadpool(self._stat, self.local_path(name))
+
+    async def delete(self, name):
+        await run_in_threadpool(self._remove, self.local_path(name))
+
+
+class MemoryArtifactStore(ArtifactStore):
+    def __init__(self):
+        self._objects = {}  # name -> (bytes, content_type, etag)
+
+    def _read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def put_file(self, name, src_path, content_type):
+        data = await run_in_threadpool(self._read, src_path)
+        etag = f'"{hashlib.sha256(data).hexdigest()[:32]}"'
+        self._objects[name] = (data, content_type, etag)
+
+    async def get(self, name):
+        entry = self._objects.get(name)
+        return entry[0] if entry else None
+
+    async def stat(self, name):
+        entry = self._objects.get(name)
+        return {"etag": entry[2], "size": len(entry[0])} if entry else None
+
+    async def delete(self, name):
+        self._objects.pop(name, None)
+
+
+class S3ArtifactStore(ArtifactStore):
+    """Artifacts in an S3-compatible bucket; boto3 calls run in the thread pool."""
+
+    def __init__(self, bucket=S3_BUCKET, prefix=S3_PREFIX, endpoint_url=S3_ENDPOINT_URL, region=S3_REGION,
+                 presigned_redirects=S3_PRESIGNED_REDIRECTS):
+        # boto3 is only needed when this backend is selected
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        if not bucket:
+            raise ValueError("S3_BUCKET must be set when ARTIFACT_STORAGE=s3")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presigned_redirects = presigned_redirects
+        # boto3 clients are thread-safe, so one is shared by every upload
+        self._client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self._transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=S3_MAX_CONCURRENCY,
+        )
+
+    def _key(self, name):
+        return f"{self.prefix}{name}"
+
+    def _is_missing(self, error):
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    async def put_file(self, name, src_path, content_type):
+        await run_in_threadpool(
+            self._client.upload_file, src_path, self.bucket, self._key(name),
+            ExtraArgs={"ContentType": content_type}, Config=self._transfer_config,
+        )
+
+    async def get(self, name):
+        from botocore.exceptions import ClientError
+
+        def read():
+            try:
+                response = self._client.get_object(Bucket=self.bucket, Key=self._key(name))
+            except ClientError as e:
+                if self._is_missing(e):
+                    return None
+                raise
+            return response["Body"].read()
+
+        return await run_in_threadpool(read)
+
+    async def stat(self, name):
+        from botocore.exceptions import ClientError
+
+        try:
+            head = await run_in_threadpool(self._client.head_object, Bucket=self.bucket, Key=self._key(name))
+        except ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return {"etag": head["ETag"], "size": head["ContentLength"]}
+
+    async def delete(self, name):
+        await run_in_threadpool(self._client.delete_object, Bucket=self.bucket, Key=self._key(name))
+
+    async def presigned_url(self, name):
+        if not self.presigned_redirects:
+            return None
+        # Signing is local computation, no request is made
+        return self._client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._key(name)},
+            ExpiresIn=S3_PRESIGNED_EXPIRES_SECONDS,
+        )
+
+
+def create_artifact_store(kind=ARTIFACT_STORAGE):
+    if kind == "local":
+        return LocalArtifactStore()
+    if kind == "memory":
+        return MemoryArtifactStore()
+    if kind == "s3":
+        return S3ArtifactStore()
+    raise ValueError(f"Unknown ARTIFACT_STORAGE: {kind}")
+
+
+artifact_store = create_artifact_store()
@@ -1,9 +1,10 @@
-import json
+import hashlib
 from bson import ObjectId
 import os
-import qrcode
 from fastapi import HTTPException
 from app.db import db
+from app.utils.ad_index import ad_index
+from app.utils.pdf_splice import AD_SLOT_FORM
 from datetime import datetime
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
@@ -14,9 +15,9 @@ from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.enums import TA_CENTER
 from reportlab.platypus import Paragraph, Frame, Spacer
 from io import BytesIO
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import random
-import requests
 
 # Directory where files (PDFs, QR codes) will be stored
 FILE_DIR = './generated_files/'
@@ -24,42 +25,84 @@ FILE_DIR = './generated_files/'
 # Ensure the directory exists
 os.makedirs(FILE_DIR, exist_ok=True)
 
-def obj_to_str(obj):
-    """Convert non-serializable objects like ObjectId to strings."""
-    if isinstance(obj, ObjectId):
-        return str(obj)
-    elif isinstance(obj, dict):
-        return {k: obj_to_str(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [obj_to_str(i) for i in obj]
-    else:
-        return obj
+# Bump whenever generate_menu_pdf changes its output so cached renders are invalidated
+PDF_LAYOUT_VERSION = 2
 
-def json_serialize(data):
-    """JSON serialize, converting ObjectId and other non-serializable types to strings."""
-    return json.loads(json.dumps(data, default=obj_to_str))
+DEFAULT_WELCOME_TEXT = "Welcome to our restaurant. Enjoy the best dishes!"
 
+# zlib-compress page content streams (ReportLab's default); set to 0 to inspect PDFs by eye
+PDF_PAGE_COMPRESSION = os.getenv("PDF_PAGE_COMPRESSION", "1") == "1"
 
-# Generate PDF for the menu using ReportLab
-# Generate PDF for the menu using ReportLab
-def download_image(url):
-    """Download the image from the URL and return a BytesIO object."""
-    response = requests.get(url)
-    if response.status_code == 200:
-        print("response.content is " ,response.content)
-        return BytesIO(response.content)  # Returning the image data in BytesIO format
+# Box the ad image is drawn in, in points (ad creatives are processed to fit it)
+AD_IMAGE_WIDTH, AD_IMAGE_HEIGHT = 200, 150
+
+# Decoded images kept per process, so repeat renders of the same ad skip decoding
+MAX_DECODED_IMAGES = 32
+_decoded_images = OrderedDict()
+
+def get_image_reader(image_bytes):
+    """Return a (possibly shared) ImageReader for the given image bytes."""
+    key = hashlib.sha1(image_bytes).hexdigest()
+    image = _decoded_images.get(key)
+    if image is None:
+        image = ImageReader(BytesIO(image_bytes))
+        _decoded_images[key] = image
+        while len(_decoded_images) > MAX_DECODED_IMAGES:
+            _decoded_images.popitem(last=False)
     else:
-        raise FileNotFoundError(f"Could not download image from URL: {url}")
+        _decoded_images.move_to_end(key)
+    return image
+
+def draw_ad_page(c, ad_data, ad_image=None):
+    """Draw the classic layout's ad page (without starting a new page)."""
+    width, height = letter
+    padding = 100
+
+    c.setFont("Helvetica-Bold", 24)
+    if isinstance(ad_data, dict):
+        # Render the ad details if it's a dictionary
+        ad_name = ad_data.get('ad_name', 'Ad')
+        c.drawCentredString(width / 2, height - padding, f"Sponsored Ad: {ad_name}")
+
+        # Insert ad image (if provided); the bytes are fetched ahead of time by the caller
+        ad_image_url = ad_data.get('ad_image_url', '')
+        if ad_image_url:
+            if ad_image:
+                image = get_image_reader(ad_image)
+                image_width, image_height = AD_IMAGE_WIDTH, AD_IMAGE_HEIGHT
+                x_position = (width - image_width) / 2  # Center image horizontally
+                y_position = height - padding - 200  # Position image below the title
+                c.drawImage(image, x_position, y_position, width=image_width, height=image_height)
+            else:
+                c.drawCentredString(width / 2, height - padding - 40, f"Image not available: {ad_image_url}")
+
+        # Loop through metadata to display the ad details
+        c.setFont("Helvetica", 12)
+        y_position = height - padding - 40
+        metadata = ad_data.get('metadata', {})
+        for key, value in metadata.items():
+            c.drawCentredString(width / 2, y_position, f"{key}: {value}")
+            y_position -= 20
+
+    elif isinstance(ad_data, str):
+        # If ad_data is a simple string, render it as a message
+        c.drawCentredString(width / 2, height - padding, ad_data)
 
-def generate_menu_pdf(menu_data, ad_data, file_path, welcome_text="Welcome to our restaurant. Enjoy the best dishes!"):
+# Generate PDF for the menu using ReportLab
+def generate_menu_pdf(menu_data, ad_data, file_path, welcome_text=DEFAULT_WELCOME_TEXT, ad_image=None, ad_slot=False):
     # Ensure file_path is not None
     if not file_path:
         raise ValueError("File path is required to generate the PDF")
 
     # Create the PDF canvas
-    c = canvas.Canvas(file_path, pagesize=letter)
+    c = canvas.Canvas(file_path, pagesize=letter, pageCompression=PDF_PAGE_COMPRESSION)
     width, height = letter  # Dimensions of the PDF page
 
+    if ad_slot:
+        # Empty placeholder form for the ad (see app.utils.pdf_splice)
+        c.beginForm(AD_SLOT_FORM)
+        c.endForm()
+
     # Define padding for all sides
     padding = 100  # Adjust padding as necessary for your design
 
@@ -77,42 +120,12 @@ def generate_menu_pdf(menu_data, ad_data, file_path, welcome_text="Welcome to ou
     # Leave the first page with only the title
     c.showPage()  # New page after title
 
-    # If ad_data exists, render the ad on the second page
-    if ad_data:
-        c.setFont("Helvetica-Bold", 24)
-        if isinstance(ad_data, dict):
-            # Render the ad details if it's a dictionary
-            ad_name = ad_data.get('ad_name', 'Ad')
-            c.drawCentredString(width / 2, height - padding, f"Sponsored Ad: {ad_name}")
-            
-            # Insert ad image (if provided)
-            ad_image_url = ad_data.get('ad_image_url', '')
-            print("trying outside ad_image_url" , ad_image_url)
-            if ad_image_url:
-                try:
-                    print("trying in ad_image_url" , ad_image_url)
-                    # Download the image and draw it in the PDF
-                    image_data = download_image(ad_image_url)  # Get the image as a byte stream
-                    image = ImageReader(image_data)
-                    image_width, image_height = 200, 150  # Set image dimensions
-                    x_position = (width - image_width) / 2  # Center image horizontally
-                    y_position = height - padding - 200  # Position image below the title
-                    c.drawImage(image, x_position, y_position, width=image_width, height=image_height)  # Pass the image byte stream
-                except FileNotFoundError as e:
-                    c.drawCentredString(width / 2, height - padding - 40, f"Image not available: {str(e)}")
-            
-            # Loop through metadata to display the ad details
-            c.setFont("Helvetica", 12)
-            y_position = height - padding - 40
-            metadata = ad_data.get('metadata', {})
-            for key, value in metadata.items():
-                c.drawCentredString(width / 2, y_position, f"{key}: {value}")
-                y_position -= 20
-
-        elif isinstance(ad_data, str):
-            # If ad_data is a simple string, render it as a message
-            c.drawCentredString(width / 2, height - padding, ad_data)
-
+    # The ad goes on the second page; an ad slot leaves it to be spliced in per scan
+    if ad_slot:
+        c.doForm(AD_SLOT_FORM)
+        c.showPage()
+    elif ad_data:
+        draw_ad_page(c, ad_data, ad_image)
         c.showPage()  # New page after ad
 
     # Render each category on a new page
@@ -149,46 +162,12 @@ def generate_menu_pdf(menu_data, ad_data, file_path, welcome_text="Welcome to ou
 
     # Save the PDF
     c.save()  
-# Generate a QR code
-def generate_qr_code(url, file_path):
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-    img = qr.make_image(fill='black', back_color='white')
-    img.save(file_path)
-
-ROTATION_PERIOD_SECONDS = 300
 
 async def get_next_ad():
-    # Fetch all ads sorted by bid_price (desc) and last_served (asc)
-    ads = await db.ads.find().sort([("bid_price", -1), ("last_served", 1)]).to_list(100)
-    
-    # Check if any ad meets the rotation period criteria
-    current_time = datetime.utcnow()
-    eligible_ad = None
-
-    for ad in ads:
-        last_served = ad.get('last_served', None)
-        if last_served is None or (current_time - last_served).total_seconds() >= ROTATION_PERIOD_SECONDS:
-            eligible_ad = ad
-            break
-    
-    # If no ad meets the primary criteria, use the highest bid_price ad regardless of last_served
-    if not eligible_ad:
-        eligible_ad = ads[0] if ads else None
+    # Pick and atomically claim the best eligible ad from the in-memory index
+    eligible_ad = await ad_index.claim_next()
 
     if not eligible_ad:
         raise HTTPException(status_code=404, detail="No ads available")
 
-    # Update the selected ad's last_served and increment impression count
-    await db.ads.update_one(
-        {"_id": eligible_ad["_id"]},
-        {"$set": {"last_served": current_time}, "$inc": {"impression_count": 1}}
-    )
-
-    return eligible_ad
\ No newline at end of file
+    return eligible_ad
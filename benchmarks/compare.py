@@ -0,0 +1,73 @@
+"""Compare two benchmark result files and flag regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.15
+
+Exits with status 1 if any latency grew (or throughput dropped) by more than the
+threshold, so it can gate a deploy.
+"""
+import argparse
+import json
+import sys
+
+# Metrics compared per scenario; True means higher is better
+METRICS = {"p50_ms": False, "p95_ms": False, "p99_ms": False, "throughput_rps": True, "pdf_bytes": False,
+           "splice_p50_ms": False}
+
+
+def _scenarios(results):
+    scenarios = dict(results.get("endpoints", {}))
+    for row in results.get("generate_menu_pdf", []):
+        # Runs from before layouts were benchmarked only rendered the classic one
+        layout = row.get("layout", "classic")
+        scenarios[f"generate_menu_pdf {layout} {row['categories']}x{row['dishes_per_category']}"] = row
+    return scenarios
+
+
+def compare(baseline, candidate, threshold):
+    """Return a list of rows (scenario, metric, old, new, change, regressed)."""
+    rows = []
+    old_scenarios, new_scenarios = _scenarios(baseline), _scenarios(candidate)
+    for name, new in new_scenarios.items():
+        old = old_scenarios.get(name)
+        if old is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            before, after = old.get(metric), new.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            regressed = -change > threshold if higher_is_better else change > threshold
+            rows.append((name, metric, before, after, change, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative change (default 0.10)")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    for side in ("backend", "scale"):
+        if baseline["meta"].get(side) != candidate["meta"].get(side):
+            print(f"Warning: runs differ in {side}, numbers may not be comparable")
+
+    rows = compare(baseline, candidate, args.threshold)
+    for name, metric, before, after, change, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        print(f"{name:<32} {metric:<15} {before:>10} -> {after:>10} {change:+8.1%} {flag}")
+
+    regressions = [row for row in rows if row[5]]
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
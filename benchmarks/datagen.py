@@ -0,0 +1,115 @@
+"""Synthetic restaurants, menus, brands and ads for benchmark runs."""
+import random
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from bson import ObjectId
+from PIL import Image
+
+# Ad images are served from this (fake) host by the runner's HTTP transport
+AD_IMAGE_HOST = "bench.invalid"
+
+_WORDS = [
+    "spicy", "grilled", "garden", "house", "golden", "smoked", "crispy", "classic",
+    "royal", "fresh", "citrus", "paneer", "truffle", "masala", "basil", "honey",
+]
+_CUISINES = ["Starters", "Mains", "Curries", "Breads", "Rice", "Desserts", "Drinks", "Sides", "Salads", "Soups"]
+
+
+@dataclass
+class Scale:
+    restaurants: int = 200
+    menus_per_restaurant: int = 2
+    categories_per_menu: int = 8
+    dishes_per_category: int = 12
+    brands: int = 50
+    ads: int = 20
+    seed: int = 1
+
+
+def _name(rng, words=2):
+    return " ".join(rng.choice(_WORDS).capitalize() for _ in range(words))
+
+
+def make_menu(rng, categories, dishes_per_category, menu_id=None):
+    return {
+        "id": menu_id or str(ObjectId()),
+        "name": f"{_name(rng)} Menu",
+        "welcome_text": f"Welcome to {_name(rng)}!",
+        "version": 0,
+        "categories": [
+            {
+                "name": f"{_CUISINES[i % len(_CUISINES)]} {i // len(_CUISINES) + 1}",
+                "dishes": [
+                    {"name": _name(rng, 3), "price": round(rng.uniform(2, 40), 2)}
+                    for _ in range(dishes_per_category)
+                ],
+            }
+            for i in range(categories)
+        ],
+    }
+
+
+def ad_image_bytes(index, size=(600, 200)):
+    """A small PNG creative, different per ad so decode caches can't hide the cost."""
+    color = ((index * 53) % 256, (index * 97) % 256, (index * 151) % 256)
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def seed(db, scale: Scale):
+    """Reset the benchmark collections and fill them; returns ids the scenarios need."""
+    # Imported here so app.db is only loaded after standin.install() has run
+    from app.utils.ad_creatives import ad_creative_store, process_creative
+    from app.utils.brand_search import search_keys_for
+
+    rng = random.Random(scale.seed)
+    for name in ("restaurants", "menus", "brands", "ads", "ad_creatives"):
+        await db[name].delete_many({})
+
+    restaurants, menus, refs = [], [], []
+    for _ in range(scale.restaurants):
+        restaurant_id = ObjectId()
+        restaurants.append({"_id": restaurant_id, "name": f"{_name(rng)} Kitchen", "location": _name(rng, 1), "menus": []})
+        for _ in range(scale.menus_per_restaurant):
+            menu = make_menu(rng, scale.categories_per_menu, scale.dishes_per_category)
+            menus.append({"_id": menu.pop("id"), "restaurant_id": restaurant_id, **menu})
+            refs.append((str(restaurant_id), menus[-1]["_id"]))
+    if restaurants:
+        await db.restaurants.insert_many(restaurants)
+    if menus:
+        await db.menus.insert_many(menus)
+
+    brands = []
+    for i in range(scale.brands):
+        brand_name = f"{_name(rng)} {i}"
+        brands.append({"_id": ObjectId(), "brand_name": brand_name, "metadata": {}, "search_keys": search_keys_for(brand_name)})
+    if brands:
+        await db.brands.insert_many(brands)
+
+    now = datetime.utcnow()
+    ads = [
+        {
+            "ad_name": f"Ad {i}",
+            "bid_price": round(rng.uniform(0.1, 5), 2),
+            "ad_image_url": f"http://{AD_IMAGE_HOST}/ads/{i}.png",
+            "metadata": {},
+            "impression_count": 0,
+            "last_served": None,
+            "created_at": now,
+            "expires_at": now + timedelta(days=30),
+            "brand_id": brands[i % len(brands)]["_id"] if brands else None,
+        }
+        for i in range(scale.ads)
+    ]
+    # Processed the way onboarding does it, so renders take the production path
+    for i, ad in enumerate(ads):
+        data, info = process_creative(ad_image_bytes(i))
+        await ad_creative_store.save(data, info, ad["ad_image_url"])
+        ad["ad_creative"] = info
+    if ads:
+        await db.ads.insert_many(ads)
+
+    return {"menus": refs, "brand_names": [b["brand_name"] for b in brands], "scale": asdict(scale)}
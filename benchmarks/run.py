@@ -0,0 +1,280 @@
+"""Run the benchmark suite and write the results as JSON.
+
+    python -m benchmarks.run                       # in-process Mongo stand-in
+    python -m benchmarks.run --mongo-uri mongodb://localhost:27017
+    python -m benchmarks.run --restaurants 1000 --requests 500 --concurrency 16
+
+Compare two runs with `python -m benchmarks.compare old.json new.json`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import fields
+from datetime import datetime
+from io import BytesIO
+
+from benchmarks import standin
+
+# Menu sizes (categories, dishes per category) for the PDF micro-benchmark
+PDF_SIZES = [(1, 5), (5, 10), (10, 20), (20, 40), (40, 50)]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies, errors, wall_seconds):
+    ordered = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3) if seconds is not None else None
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        "mean_ms": ms(statistics.fmean(ordered)) if ordered else None,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1]) if ordered else None,
+    }
+
+
+async def measure(operation, count, concurrency):
+    """Call `await operation(i)` count times from `concurrency` workers."""
+    latencies, errors = [], 0
+    counter = iter(range(count))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                await operation(i)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def _ok(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.request.url.path}: {response.status_code}")
+    return response
+
+
+async def run_endpoints(client, data, args):
+    from app.utils.utils import get_next_ad
+
+    menus = data["menus"]
+    n, concurrency = args.requests, args.concurrency
+    results = {}
+
+    async def list_restaurants(i):
+        _ok(await client.get("/restaurants/", params={"limit": 50}))
+
+    async def list_restaurant_summaries(i):
+        _ok(await client.get("/restaurants/", params={"limit": 50, "summary": True}))
+
+    async def next_ad(i):
+        await get_next_ad()
+
+    def dish_url(i):
+        restaurant_id, menu_id = menus[i % len(menus)]
+        return f"/restaurants/{restaurant_id}/menus/{menu_id}/categories/Starters 1/dishes"
+
+    async def add_dish(i):
+        _ok(await client.post(dish_url(i), json={"name": f"Bench dish {i}", "price": 9.5}))
+
+    async def update_dish(i):
+        _ok(await client.put(f"{dish_url(i)}/0", json={"name": f"Renamed {i}", "price": 10.0}))
+
+    async def delete_dish(i):
+        _ok(await client.delete(f"{dish_url(i)}/0"))
+
+    async def generate_qr(i):
+        restaurant_id, menu_id = menus[i % len(menus)]
+        _ok(await client.get(f"/restaurants/{restaurant_id}/menus/{menu_id}/generate_qr"))
+
+    scenarios = [
+        ("get_restaurants", list_restaurants, n),
+        ("get_restaurants_summary", list_restaurant_summaries, n),
+        ("get_next_ad", next_ad, n),
+        ("add_dish", add_dish, n),
+        ("update_dish", update_dish, n),
+        ("delete_dish", delete_dish, n),
+        # Renders are slow, so fewer of them; the first pass over the menus is mostly cache misses
+        ("generate_menu_qr", generate_qr, max(args.requests // 5, 1)),
+    ]
+    for name, operation, count in scenarios:
+        if args.only and name not in args.only:
+            continue
+        print(f"  {name} x{count}", file=sys.stderr)
+        results[name] = await measure(operation, count, concurrency)
+    return results
+
+
+def run_pdf_render(args):
+    from benchmarks.datagen import ad_image_bytes, make_menu
+    from app.utils.ad_creatives import process_creative
+    from app.utils.pdf_layouts import PDF_LAYOUTS, draw_menu_pdf, render_ad_slot, render_menu_body
+    from app.utils.pdf_splice import splice_ad_slot
+    import random
+
+    ad = {"ad_name": "Bench ad", "ad_image_url": "http://bench.invalid/ads/0.png", "metadata": {}}
+    # The creative as onboarding stores it
+    image, _ = process_creative(ad_image_bytes(0))
+    results = []
+    for layout in args.layouts or PDF_LAYOUTS:
+        rng = random.Random(1)  # the same menus for every layout
+        for categories, dishes in PDF_SIZES:
+            menu = make_menu(rng, categories, dishes)
+            latencies, size = [], 0
+            for _ in range(args.pdf_repeats):
+                buffer = BytesIO()
+                started = time.perf_counter()
+                draw_menu_pdf(layout, menu, ad, buffer, ad_image=image)
+                latencies.append(time.perf_counter() - started)
+                size = buffer.tell()
+            pages = len(re.findall(rb"/Type\s*/Page\b", buffer.getvalue()))
+            summary = summarize(latencies, 0, sum(latencies))
+
+            # What a download_pdf scan costs once the body and the ad are cached
+            body, _ = render_menu_body(menu, layout=layout)
+            ad_slot, _ = render_ad_slot(ad, image, layout)
+            splices = []
+            for _ in range(args.pdf_repeats):
+                started = time.perf_counter()
+                splice_ad_slot(body, ad_slot)
+                splices.append(time.perf_counter() - started)
+            splice_p50_ms = round(statistics.median(splices) * 1000, 3)
+
+            results.append({"layout": layout, "categories": categories, "dishes_per_category": dishes,
+                            "pdf_bytes": size, "pages": pages, "splice_p50_ms": splice_p50_ms, **summary})
+            print(f"  {layout} {categories}x{dishes}: p50 {summary['p50_ms']} ms, "
+                  f"{size / 1024:.1f} KiB, {pages} pages, splice p50 {splice_p50_ms} ms", file=sys.stderr)
+    return results
+
+
+def render_stage_breakdown():
+    """Mean time per render stage, from the same histograms /metrics exports."""
+    from app.utils.metrics import RENDER_STAGE_SECONDS
+
+    totals = {}
+    for metric in RENDER_STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            stage = totals.setdefault(sample.labels["stage"], {})
+            if sample.name.endswith("_sum"):
+                stage["total_seconds"] = sample.value
+            elif sample.name.endswith("_count"):
+                stage["count"] = int(sample.value)
+    return {
+        name: {**stage, "mean_ms": round(stage["total_seconds"] / stage["count"] * 1000, 3) if stage.get("count") else None}
+        for name, stage in totals.items()
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    backend = standin.install(args.mongo_uri, args.db_name)
+
+    import httpx
+    from app.db import db
+    from app.main import app
+    from app.utils.image_fetcher import ad_image_fetcher
+    from benchmarks.datagen import AD_IMAGE_HOST, Scale, ad_image_bytes, seed
+
+    scale = Scale(**{f.name: getattr(args, f.name) for f in fields(Scale)})
+    print(f"Seeding {backend} with {scale}", file=sys.stderr)
+    data = await seed(db, scale)
+
+    # Ad images come from an in-memory transport, so no request leaves the process
+    def serve_image(request):
+        if request.url.host != AD_IMAGE_HOST:
+            return httpx.Response(404)
+        index = int(request.url.path.rsplit("/", 1)[-1].split(".")[0])
+        return httpx.Response(200, content=ad_image_bytes(index), headers={"content-type": "image/png"})
+
+    ad_image_fetcher._client = httpx.AsyncClient(transport=httpx.MockTransport(serve_image))
+
+    results = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat() + "Z",
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "backend": backend,
+            "scale": data["scale"],
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+    }
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print("Endpoints", file=sys.stderr)
+            results["endpoints"] = await run_endpoints(client, data, args)
+    # Where generate_menu_qr spent its time: image fetch, queue wait, PDF and QR rendering
+    results["render_stages"] = render_stage_breakdown()
+
+    if not args.only or "generate_menu_pdf" in args.only:
+        print("PDF rendering", file=sys.stderr)
+        results["generate_menu_pdf"] = run_pdf_render(args)
+    return results
+
+
+def parse_args(argv=None):
+    from benchmarks.datagen import Scale
+
+    parser = argparse.ArgumentParser(description="Benchmark the hot API paths against a local database.")
+    parser.add_argument("--mongo-uri", help="use this server instead of the in-process stand-in (the database is wiped)")
+    parser.add_argument("--db-name", default=standin.STANDIN_DB_NAME)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--pdf-repeats", type=int, default=5)
+    parser.add_argument("--layouts", nargs="*", help="PDF layouts to benchmark (default: all)")
+    parser.add_argument("--only", nargs="*", help="run just these scenarios")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>.json)")
+    for f in fields(Scale):
+        parser.add_argument(f"--{f.name.replace('_', '-')}", type=int, default=f.default)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    output = os.path.abspath(args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", datetime.now().strftime("%Y%m%d-%H%M%S.json")
+    ))
+    # Generated PDFs, QR codes and caches go to a scratch directory, not the checkout
+    with tempfile.TemporaryDirectory(prefix="menu-bench-") as workdir:
+        os.chdir(workdir)
+        results = asyncio.run(main(args))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}", file=sys.stderr)
@@ -0,0 +1,177 @@
+"""Point app.db at the database used for a benchmark run.
+
+Must be called before anything imports app.main, since the routes bind `db` at
+import time. With a mongo_uri the run uses that server (e.g. a local mongod);
+otherwise an in-process mongomock database is used, so no server or network is
+needed. mongomock doesn't implement arrayFilters or pipeline updates, which the
+menu store relies on, so a minimal version of both is patched in below.
+Latencies under the stand-in are only comparable with other stand-in runs.
+"""
+import os
+import re
+
+STANDIN_DB_NAME = "menu_bench"
+
+
+def install(mongo_uri=None, db_name=STANDIN_DB_NAME):
+    """Configure app.db and return a short description of the backend."""
+    os.environ.setdefault("MONGO_URI", mongo_uri or "mongodb://localhost:27017")
+    os.environ.setdefault("MONGO_DB_NAME", db_name)
+    import app.db
+
+    if mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from app.utils.metrics import mongo_command_listener
+
+        client = AsyncIOMotorClient(mongo_uri, event_listeners=[mongo_command_listener])
+        backend = "mongod"
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+
+        _patch_mongomock()
+        # Indexes and query plans mean nothing to mongomock
+        os.environ["ENSURE_INDEXES"] = "0"
+        client = AsyncMongoMockClient()
+        backend = "mongomock"
+
+    app.db.client = client
+    app.db.db = client[db_name]
+    app.db.restaurants_collection = app.db.db["restaurants"]
+    return backend
+
+
+# -- mongomock compatibility --
+
+_FILTER_IDENTIFIER = re.compile(r"\$\[(\w+)\]")
+
+
+def _patch_mongomock():
+    import mongomock
+    from mongomock.filtering import filter_applies
+    from mongomock.results import UpdateResult
+
+    collection_class = mongomock.collection.Collection
+    if getattr(collection_class, "_bench_patched", False):
+        return
+    original_update_one = collection_class.update_one
+
+    def matched(n):
+        return UpdateResult({"n": n, "nModified": n}, acknowledged=True)
+
+    def targets(value, parts, array_filters):
+        # Yield (container, key) pairs addressed by a dotted path with $[id] segments
+        head, rest = parts[0], parts[1:]
+        identifier = _FILTER_IDENTIFIER.fullmatch(head)
+        if identifier:
+            name = identifier.group(1)
+            condition = next(f for f in array_filters if any(k.split(".")[0] == name for k in f))
+            element_condition = {k[len(name) + 1:]: v for k, v in condition.items()}
+            for i, element in enumerate(value):
+                if filter_applies(element_condition, element if isinstance(element, dict) else {}):
+                    if rest:
+                        yield from targets(element, rest, array_filters)
+                    else:
+                        yield value, i
+            return
+        key = int(head) if isinstance(value, list) else head
+        if not rest:
+            yield value, key
+            return
+        if isinstance(value, dict):
+            value.setdefault(key, {})
+        yield from targets(value[key], rest, array_filters)
+
+    def apply_operator(op, container, key, operand):
+        if op == "$set":
+            container[key] = operand
+        elif op == "$inc":
+            current = container.get(key) if isinstance(container, dict) else container[key]
+            container[key] = (current or 0) + operand
+        elif op == "$push":
+            values = operand["$each"] if isinstance(operand, dict) and "$each" in operand else [operand]
+            if isinstance(container, dict):
+                container.setdefault(key, [])
+            container[key].extend(values)
+        elif op == "$unset":
+            if isinstance(container, dict):
+                container.pop(key, None)
+        else:
+            raise NotImplementedError(f"{op} with array_filters")
+
+    def update_one(self, filter, update, upsert=False, array_filters=None, **kwargs):
+        if isinstance(update, list):
+            doc = self.find_one(filter)
+            if doc is None:
+                return matched(0)
+            for stage in update:
+                (op, fields), = stage.items()
+                if op != "$set":
+                    raise NotImplementedError(f"{op} in pipeline updates")
+                new_values = {field: evaluate(expr, {"ROOT": doc}) for field, expr in fields.items()}
+                doc.update(new_values)
+            self.replace_one({"_id": doc["_id"]}, doc)
+            return matched(1)
+        if not array_filters:
+            return original_update_one(self, filter, update, upsert=upsert, **kwargs)
+        doc = self.find_one(filter)
+        if doc is None:
+            return matched(0)
+        for op, fields in update.items():
+            for path, operand in fields.items():
+                for container, key in list(targets(doc, path.split("."), array_filters)):
+                    apply_operator(op, container, key, operand)
+        self.replace_one({"_id": doc["_id"]}, doc)
+        return matched(1)
+
+    collection_class.update_one = update_one
+    collection_class._bench_patched = True
+
+
+def evaluate(expr, variables):
+    """Evaluate the aggregation expressions used by menu_store.rewrite_menu."""
+    if isinstance(expr, str) and expr.startswith("$$"):
+        name, *path = expr[2:].split(".")
+        value = variables[name]
+        for part in path:
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+    if isinstance(expr, str) and expr.startswith("$"):
+        return evaluate("$$ROOT." + expr[1:], variables)
+    if isinstance(expr, list):
+        return [evaluate(item, variables) for item in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) != 1 or not next(iter(expr)).startswith("$"):
+        return {key: evaluate(value, variables) for key, value in expr.items()}
+
+    (op, args), = expr.items()
+    if op == "$map":
+        items = evaluate(args["input"], variables) or []
+        return [evaluate(args["in"], {**variables, args["as"]: item}) for item in items]
+    if op == "$let":
+        bound = {name: evaluate(value, variables) for name, value in args["vars"].items()}
+        return evaluate(args["in"], {**variables, **bound})
+    if op == "$cond":
+        condition, then, otherwise = args
+        return evaluate(then if evaluate(condition, variables) else otherwise, variables)
+
+    args = evaluate(args, variables)
+    if op == "$eq":
+        return args[0] == args[1]
+    if op == "$mergeObjects":
+        return {key: value for part in args for key, value in (part or {}).items()}
+    if op == "$concatArrays":
+        return [item for part in args for item in part]
+    if op == "$slice":
+        if len(args) == 3:
+            return args[0][args[1]:args[1] + args[2]]
+        return args[0][:args[1]]
+    if op == "$size":
+        return len(args)
+    if op == "$max":
+        return max(args)
+    if op == "$add":
+        return sum(args)
+    if op == "$ifNull":
+        return args[0] if args[0] is not None else args[1]
+    raise NotImplementedError(op)
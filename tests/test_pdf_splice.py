@@ -0,0 +1,62 @@
+import os
+from io import BytesIO
+
+import pytest
+
+# Importing the layouts pulls in app.db, which only needs these to be set (it never connects here)
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("MONGO_DB_NAME", "test")
+
+pypdf = pytest.importorskip("pypdf")
+from PIL import Image
+
+from app.utils.pdf_layouts import PDF_LAYOUTS, render_ad_slot, render_menu_body
+from app.utils.pdf_splice import splice_ad_slot
+
+MENU = {
+    "name": "Dinner",
+    "categories": [
+        {"name": f"Category {i}", "dishes": [{"name": f"Dish {i}.{j}", "price": 9.5 + j} for j in range(12)]}
+        for i in range(6)
+    ],
+}
+
+AD = {"_id": "ad1", "ad_name": "Spliced ad", "ad_image_url": "http://example.com/ad.png"}
+
+
+def _png():
+    buffer = BytesIO()
+    Image.new("RGB", (40, 30), (200, 30, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _read_strict(pdf_bytes):
+    return pypdf.PdfReader(BytesIO(pdf_bytes), strict=True)
+
+
+@pytest.mark.parametrize("layout", PDF_LAYOUTS)
+def test_splice_keeps_pdf_valid(layout):
+    body, _ = render_menu_body(MENU, "Welcome", layout)
+    ad_slot, _ = render_ad_slot(AD, _png(), layout)
+
+    spliced = splice_ad_slot(body, ad_slot)
+
+    # The splice is an incremental update: the body is kept byte for byte
+    assert spliced.startswith(body)
+    body_pages = len(_read_strict(body).pages)
+    reader = _read_strict(spliced)
+    assert len(reader.pages) == body_pages
+    # The appended xref section starts with the free-list head and points at each new object
+    section = spliced[spliced.rindex(b"\nxref\n") + 1:spliced.rindex(b"trailer")].split(b"\n")[1:-1]
+    assert section[:2] == [b"0 1", b"0000000000 65535 f "]
+    entries = section[2:]
+    assert entries
+    for subsection, entry in zip(entries[::2], entries[1::2]):
+        number = int(subsection.split()[0])
+        offset = int(entry.split()[0])
+        assert spliced[offset:].startswith(b"%d 0 obj" % number)
+        assert reader.get_object(number) is not None
+    # The ad (text and image) ends up on a page
+    text = "".join(page.extract_text() for page in reader.pages)
+    assert AD["ad_name"] in text
+    assert any(page.images for page in reader.pages)